@@ -6,6 +6,7 @@ import os
 import sys
 import subprocess
 import random
+from functools import partial
 
 import havsfunc as hvf
 import mvsfunc as mvf
@@ -17,20 +18,26 @@ import vsTAAmbk as taa
 from adptvgrnMod import adptvgrnMod as agmod
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth
-import vscompare
+from soapfunc import checkpoint, chunked, comp, output
+from soapfunc.degrain import smdegrain
+from soapfunc.masked import gated_merge
+from soapfunc.edl import rfs
+from soapfunc.profiler import Profiler
+from soapfunc.tune import tune
 
 core = vs.core
-core.max_cache_size = 40000
+workers = 0   # >1 encodes keyframe-aligned chunks in that many processes
+resumable = False   # render in committed segments that survive a crash/restart
+profile = 0   # >0 times every node of filter_chain over that many sampled frames instead of encoding
 raw = os.path.join(os.getcwd(), " ".join(sys.argv[1:]))
 masked = [(6873, 6988), (7014, 7122), (7152, 7266), (7298, 7403), (7431, 7533), (7560, 7653), (7680, 7792), (7818, 7906), (7933, 8011), (8034, 8101), (8122, 8227), (8251, 8349), (8372, 8501), (35048, 35305), (166713, 166800), (167471, 167628), (167793, 167971), (167999, 168144)]
 
+comp_threads = []  # comps render next to the encode, joined once it is done
+
 def compac(src, enc):
-    for i in [13355, 79259, 85924, 90630, 97819]:
-        frame = i
-        src, enc = vscompare.prep(src, enc, w=1920, h=1080, dith=True, yuv444=False)
-        vscompare.save(frame, src=src, enc=enc)
+    comp_threads.append(comp.save_background([13355, 79259, 85924, 90630, 97819], {'src': src, 'enc': enc}, w=1920, h=1080))
 
-def filter_chain(clip):
+def filter_chain(clip, comps=True):
     # print(clip.decode('utf-8'))
     src = lvf.src(clip)
     src = core.std.AssumeFPS(src, fpsnum = 24000, fpsden = 1001)
@@ -51,12 +58,12 @@ def filter_chain(clip):
     upscale = join([aa, plane(src, 1), plane(src, 2)])
 
     #denoising
-    ref_a = hvf.SMDegrain(upscale, tr=1, thSAD=64, plane=4)
+    ref_a = smdegrain(upscale, tr=1, thSAD=64, plane=4)
     den_a = mvf.BM3D(upscale, sigma=[3.2, 0.8], ref=ref_a)
-    ref_b = hvf.SMDegrain(upscale, tr=1, thSAD=128, plane=4)
+    ref_b = smdegrain(upscale, tr=1, thSAD=128, plane=4)
     den_b = mvf.BM3D(upscale, sigma=[1.8, 0.8], ref=ref_b)
     adaptive_mask = kgf.adaptive_grain(upscale, luma_scaling=8, show_mask=True)
-    denoise = core.std.MaskedMerge(den_a, den_b, adaptive_mask)
+    denoise = gated_merge(den_a, den_b, adaptive_mask)
 
     #Edge-detection and debanding
     line_mask = kgf.retinex_edgemask(denoise).std.Binarize(9999).rgvs.RemoveGrain(3).std.Inflate()
@@ -65,29 +72,67 @@ def filter_chain(clip):
 
     #Add grain and exclude few frames from output
     grain = agmod(deband, strength=0.20, size=1, sharp=75, static=True)
-    final = depth(lvf.rfs(grain, src, ranges=masked), 10)
+    final = depth(rfs(grain, src, masked), 10)
 
     #generate comps 
-    compac(src, final)
+    if comps:
+        compac(src, final)
 
     return final
 
 
+ffv1_args = [
+        "ffmpeg", "-hide_banner", "-v", "quiet", "-stats",
+        "-f", "yuv4mpegpipe", "-i", "-",
+        "-c:v", "ffv1", "-level", "3", "-threads", "8",
+        "-map", "0", "-pix_fmt", "yuv420p10le"
+        ]
+
 def encode_chain(clip: vs.VideoNode)-> None:
     """Output to ffv1"""
     print("\n\nFFV1 encode starts")
-    ffmpeg_args = [
-            "ffmpeg", "-hide_banner", "-v", "quiet", "-stats",
-            "-f", "yuv4mpegpipe", "-i", "-",
-            "-c:v", "ffv1", "-level", "3", "-threads", "8",
-            "-map", "0", "-pix_fmt", "yuv420p10le", "lostFiltered.mkv"
-            ]
-    process = subprocess.Popen(ffmpeg_args, stdin=subprocess.PIPE)
-    clip.output(process.stdin, y4m=True, progress_update=lambda value, endvalue: print(f"\rVapourSynth: {value}/{endvalue} ~ {100 * value // endvalue}% || Encoder: ", end=""))
+    ffmpeg_args = output.rawvideo(ffv1_args, clip) + ["lostFiltered.mkv"]
+    process = output.popen(ffmpeg_args)
+    output.write(clip, process, progress_update=lambda value, endvalue: print(f"\rVapourSynth: {value}/{endvalue} ~ {100 * value // endvalue}% || Encoder: ", end=""))
     process.communicate()
     print("FFV1 process ends")
 
 
+def resumable_chain(clip: vs.VideoNode)-> None:
+    """Output to ffv1 in checkpointed segments, a restart carries on after the last committed one"""
+    print("\n\nResumable FFV1 encode starts")
+    args = [a for a in ffv1_args if a != "-stats"]
+    checkpoint.render(clip, "lostFiltered.mkv", output.rawvideo(args, clip))
+    print("FFV1 process ends")
+
+
+def chunked_chain(clip: str)-> None:
+    """Output to ffv1, split at keyframes and encoded by `workers` processes"""
+    print("\n\nChunked FFV1 encode starts")
+    args = [a for a in ffv1_args if a != "-stats"]
+    chunked.encode(partial(filter_chain, comps=False), clip, "lostFiltered.mkv", args,
+                   boundaries=chunked.keyframes(clip), workers=workers)
+    print("FFV1 process ends")
+    # the workers skip the comps; write them here, from a chain built just for that
+    filter_chain(clip)
+    for t in comp_threads:
+        t.join()
+
+
 if __name__ == '__main__':
-    filtered = filter_chain(raw)
-    encode_chain(filtered)
+    if workers > 1:
+        chunked_chain(raw)
+    elif profile:
+        prof = Profiler()
+        prof.run(prof.instrument(filter_chain)(raw, comps=False), frames=profile)
+        print(prof.table())
+        prof.write_folded("lost.folded")
+    else:
+        filtered = filter_chain(raw)
+        tune(filtered, encoder='ffv1')
+        if resumable:
+            resumable_chain(filtered)
+        else:
+            encode_chain(filtered)
+        for t in comp_threads:
+            t.join()
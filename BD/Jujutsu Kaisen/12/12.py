@@ -17,6 +17,7 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth
+from soapfunc.edl import EDL
 
 source = "S01E12-To You, Someday.mkv"
 source = lvf.src(source)
@@ -33,7 +34,7 @@ ed = depth(ed, 16)
 
 height = 844
 
-src = source[:2832]+op[2:-24]+source[4990:30596]+ed[:-25]+source[32755:]
+src = EDL.load("12.edl", source=source, op=op, ed=ed).node()
 
 
 cred_op = source[2832:4990] # this is the OP with credits
@@ -59,7 +60,7 @@ op_fin = CoolDegrain(op_fin, thsad=16, thsadc=48, blksize=8, overlap=4)
 ed_fin = atf.ApplyCredits(cred_ed, ed[:-25], deband[30596:32755])
 ed_fin = CoolDegrain(ed_fin, thsad=16, thsadc=48, blksize=8, overlap=4)
 
-mrg = deband[:2832]+op_fin+deband[4990:30596]+ed_fin+deband[32755:]
+mrg = EDL().append(deband).replace(op_fin, 2832, 4989, 0).replace(ed_fin, 30596, 32754, 0).node()
 #den_cred = core.knlm.KNLMeansCL(out, d=2, s=2, h=1.4, device_type='cpu')
 
 grain = agmod(mrg, strength=0.30, size=1, sharp=75, static=True)
@@ -8,6 +8,7 @@ import kagefunc as kgf
 from adptvgrnMod import adptvgrnMod as agmod
 from vsutil import plane, join, depth
 import stgfunc as stg
+from soapfunc.cache import FrameCache
 
 def dehalo_clip(src, rescaled) -> vs.VideoNode:
     halo_mask = lvf.mask.halo_mask(rescaled, brz=0.25, rad=1)
@@ -27,6 +28,7 @@ def deband_clip(denoise, dehalo) -> vs.VideoNode:
 
 
 source = "S01E14-Kyoto Sister School Exchange Event - Group Battle 0 -.mkv"
+fc = FrameCache(source)  # keeps the slow stages on disk while tuning deband/grain
 source = lvf.src(source, force_lsmas=True)
 src = depth(source, 16)
 
@@ -35,16 +37,19 @@ height = 844
 rescale = depth(lvf.scale.descale(clip=src, upscaler=lvf.scale.reupscale(), height=height, kernel=lvf.kernels.Bicubic(b=1/3, c=1/3)), 16)
 
 upscale = join([rescale, plane(src, 1), plane(src, 2)])
+upscale = fc.stage(upscale, 'rescale', [fc.source_key], height=height, b=1/3, c=1/3)
 
 # mask = core.adg.Mask(core.std.PlaneStats(src), luma_scaling=16)
 
 dehalo = dehalo_clip(src, upscale)
+dehalo = fc.stage(dehalo, 'dehalo', [upscale], brz=0.25, rad=1, darkstr=0, brightstr=0.4)
 
 mask = core.adg.Mask(core.std.PlaneStats(dehalo), luma_scaling=48)
 mask2 = lvf.mask.detail_mask(dehalo)
 
 ref = hvf.SMDegrain(dehalo, tr=1, thSAD=84, plane=4)
 denoise = lvf.denoise.bm3d(dehalo, sigma=[0.8, 0], ref=ref)
+denoise = fc.stage(denoise, 'denoise', [dehalo], tr=1, thSAD=84, plane=4, sigma=[0.8, 0])
 
 # line_mask = kgf.retinex_edgemask(denoise).std.Binarize(9999).rgvs.RemoveGrain(3).std.Inflate()
 deband = deband_clip(denoise, dehalo)
@@ -0,0 +1,60 @@
+"""Jujutsu Kaisen BD, episodes 06-12 in one go (same chain as 06/06.py - 12/12.py)"""
+__author__ = 'Soap'
+
+import vapoursynth as vs
+core = vs.core
+
+import havsfunc as hvf
+import mvsfunc as mvf
+import lvsfunc as lvf
+import fvsfunc as fvf
+import kagefunc as kgf
+from adptvgrnMod import adptvgrnMod as agmod
+from cooldegrain import CoolDegrain
+from vsutil import plane, join, depth
+from soapfunc.season import Episode, Splice, run
+
+OP2 = "JJK v2/00005.m2ts"
+OP3 = "JJK v3/00005.m2ts"
+ED = "JJK v1/00006.m2ts"
+
+# (episode frames with credits, NC trim) straight from the per-episode scripts
+episodes = [
+    Episode("06/00004.m2ts", "06/06.mkv", [Splice(OP2, 843, 3017, 0, -10), Splice(ED, 31317, 33476, 0, -25)]),
+    Episode("07/S01E07-Assault.mkv", "07/07.mkv", [Splice(OP2, 3141, 5308, 1, -16), Splice(ED, 30592, 32748, 0, -28)]),
+    Episode("08/S01E08-Boredom.mkv", "08/08.mkv", [Splice(OP2, 4798, 6955, 0, -27), Splice(ED, 29255, 31411, 0, -28)]),
+    Episode("09/S01E09-Small Fry and Reverse Retribution.mkv", "09/09.mkv", [Splice(OP3, 6642, 8800, 0, -26), Splice(ED, 31315, 33472, 0, -27)]),
+    Episode("10/S01E10-Idle Transfiguration.mkv", "10/10.mkv", [Splice(OP3, 4101, 6258, 0, -27), Splice(ED, 30593, 32752, 0, -25)]),
+    Episode("11/S01E11-Narrow-minded.mkv", "11/11.mkv", [Splice(OP3, 3310, 5468, 0, -26), Splice(ED, 31674, 33828, 0, -30)]),
+    Episode("12/S01E12-To You, Someday.mkv", "12/12.mkv", [Splice(OP3, 2832, 4990, 2, -24), Splice(ED, 30596, 32755, 0, -25)]),
+]
+
+
+def load(path):
+    return depth(lvf.src(path), 16)
+
+
+def chain(src):
+    height = 844
+    rescale = depth(lvf.scale.descale(clip=src, upscaler=lvf.scale.reupscale(), height=height, kernel=lvf.kernels.Bicubic(b=1/3, c=1/3)), 16)
+    upscale = join([rescale, plane(src, 1), plane(src, 2)])
+
+    ref = hvf.SMDegrain(upscale, tr=1, thSAD=84, plane=4)
+    denoise = mvf.BM3D(upscale, sigma=[2.4, 1.0], ref=ref)
+
+    line_mask = kgf.retinex_edgemask(denoise).std.Binarize(9999).rgvs.RemoveGrain(3).std.Inflate()
+    deband = core.f3kdb.Deband(denoise, range=18, y=64, cb=16, cr=16, grainy=0, grainc=0, output_depth=16, keep_tv_range=True)
+    return core.std.MaskedMerge(deband, upscale, line_mask)
+
+
+def credit_fix(clip):
+    return CoolDegrain(clip, thsad=16, thsadc=48, blksize=8, overlap=4)
+
+
+def finish(clip):
+    grain = agmod(clip, strength=0.30, size=1, sharp=75, static=True)
+    return fvf.Depth(grain, 10)
+
+
+if __name__ == '__main__':
+    run(episodes, load, chain, finish, credit_fix=credit_fix)
@@ -1 +1 @@
-for %%i in (*.mkv) do "C:/Program Files/MKVToolNix\mkvmerge.exe" --output "2%%i" --language 0:und --default-track 0:yes --language 1:jpn --track-name 1:Japanese --default-track 1:yes --language 2:eng --track-name 2:English --sub-charset 3:UTF-8 --language 3:eng --track-name ^"3:English subs^" --default-track 3:yes "%%i" --title ^"[AniDL] Kanojo, Okarishimasu [BD 1080p 10bit][Soap]^" --track-order 0:0,0:1,0:2,0:3
+python -m soapfunc.mkvedit *.mkv --language 0:und --default-track 0:yes --language 1:jpn --track-name 1:Japanese --default-track 1:yes --language 2:eng --track-name 2:English --sub-charset 3:UTF-8 --language 3:eng --track-name "3:English subs" --default-track 3:yes --title "[AniDL] Kanojo, Okarishimasu [BD 1080p 10bit][Soap]" --track-order 0:0,0:1,0:2,0:3
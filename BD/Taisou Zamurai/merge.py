@@ -1,46 +1,32 @@
 import glob
-from subprocess import run
-import psutil
+import os
+from soapfunc import audio, mux
 
-def finishing(i):
-    run("\"C:/Program Files/MKVToolNix/mkvmerge.exe\" -o \"b"+i+"\" \"a"+i+"\"", shell=True)
-    run("rem *.wav", shell=True)
-    run("rem *.aac", shell=True)
+nc = ["S01ED-Yume Ja Nai [Hatena].mkv", "S01OP-Shanghai Honey [ORANGE RANGE].mkv"]
 
-def processing(file):
-    file = file.replace("&", "^&")
-    i = file
-    run("echo "+file, shell=True)
-    run("ffmpeg -y -hide_banner -v quiet -stats -i \"../"+file+"\" -map 0:a:0 Japanese.wav", shell=True)
-    for p in psutil.process_iter():
-        try:
-            if "Japanese.wav" in str(p.open_files()):
-                print(p.name())
-                print("^^^^^^^^^^^^^^^^^")
-                p.kill()
-        except:
-            continue
-    run("qaac64 -V 73 Japanese.wav -o Jap.aac", shell=True)
-    if str(file) == "S01ED-Yume Ja Nai [Hatena].mkv" or file == "S01OP-Shanghai Honey [ORANGE RANGE].mkv":
-        run("ffmpeg -y -hide_banner -v quiet -stats -i \""+i+"\" -i \"Jap.aac\" -i \"../"+i+"\" -map 0 -map 1 -map 2 -map -2:v -map -2:a -c copy -map_metadata:g -1 -metadata title=\"[AniDL] Taisou Zamurai [BD 480p 10bit][Soap]\" -metadata:s:v title=\"\" -metadata:s:a title=\"Japanese\" \"a"+i+"\"", shell=True)
-    else:
-        run("ffmpeg -y -hide_banner -v quiet -stats -i \"../"+i+"\" -map 0:a:1 English.wav", shell=True)
-        for p in psutil.process_iter():
-            try:
-                if "English.wav" in str(p.open_files()):
-                    print(p.name())
-                    print("^^^^^^^^^^^^^^^^^")
-                    p.kill()
-            except:
-                continue
-        run("qaac64 -V 73 English.wav -o Eng.aac", shell=True)
-        run("ffmpeg -y -hide_banner -v quiet -stats -i \""+i+"\" -i \"Jap.aac\" -i \"Eng.aac\" -i \"../"+i+"\" -map 0 -map 1 -map 2 -map 3 -map -3:v -map -3:a -c copy -map_metadata:g -1 -metadata title=\"[AniDL] Taisou Zamurai [BD 480p 10bit][Soap]\" -metadata:s:v title=\"\" -metadata:s:a:0 title=\"Japanese\" -metadata:s:a:1 title=\"English\" \"a"+i+"\"", shell=True)
-    finishing(i)
+def tracks(n, file):
+    # the NC OP/ED only have the Japanese track
+    jap = audio.Track("../"+file, 0, str(n)+".Jap.aac")
+    if file in nc:
+        return [jap]
+    return [jap, audio.Track("../"+file, 1, str(n)+".Eng.aac")]
+
+def job(n, file):
+    # encoded video, new audio, then the source's subs/fonts/chapters, written once
+    jap = mux.Track(str(n)+".Jap.aac", name="Japanese", language="jpn")
+    eng = mux.Track(str(n)+".Eng.aac", name="English", language="eng")
+    audios = [jap] if file in nc else [jap, eng]
+    return mux.Job("b"+file, mux.tracks_of(file, 'video', name="") + audios + mux.tracks_of("../"+file, 'subtitles'),
+                   title="[AniDL] Taisou Zamurai [BD 480p 10bit][Soap]", keep_from=["../"+file])
 
 def main():
     files = glob.glob('*.mkv')
-    for i in files:
-        processing(i)
+    # every track of every file, straight from the source into qaac, side by side
+    aacs = audio.encode_all([t for n, file in enumerate(files) for t in tracks(n, file)])
+    mux.run_all([job(n, file) for n, file in enumerate(files)])
+    # run_all raises on a failed mux, so this only runs once every file has its audio
+    for aac in aacs:
+        os.remove(aac)
         
 if __name__ == '__main__':
     main()
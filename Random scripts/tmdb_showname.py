@@ -1,26 +1,13 @@
-from jikanpy import Jikan
-import sys
-from pprint import pprint
-import json
-from glob import glob
-import requests
-import os
+"""Append TMDB episode titles to the .mkv files in the current folder.
 
-api_key = str(input("Enter TMDB api key: "))
-season = input("Enter Season Number (Specials are usually Season 0): ")
-tmdb_id = input("Enter TMDB Show ID: ")
+Seasons are cached, files are matched by their episode number and every batch of
+renames can be undone, see soapfunc.tmdb:
 
+    python tmdb_showname.py 1429 --season 1
+    python tmdb_showname.py 1429 --season 0 "*.mkv" --dry-run
+    python tmdb_showname.py --undo
+"""
+from soapfunc.tmdb import main
 
-r = requests.get(url = f"https://api.themoviedb.org/3/tv/{tmdb_id}/season/{season}?api_key={api_key}")
-parsed = json.loads(json.dumps(r.json(), indent=4))
-print(parsed['episodes'][0]['name'])
-	#print(i['title'])
-
-files = glob('*.mkv')
-i = 0
-for file in files:
-        name = parsed['episodes'][i]['name']
-        print(f'{file[:-4]}{name}.mkv')
-        name = "".join(j for j in name if j not in "\/:*?<>|")
-        os.rename(file, f'{file[:-4]}{name}.mkv')
-        i = i+1
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 32*2**10
 
 import os
 import random
@@ -19,6 +18,7 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E01.The.Duel.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -44,4 +44,5 @@ deband = core.f3kdb.Deband(denoise, range=16, y=32, cb=8, cr=8, grainy=0, grainc
 grain = kgf.adaptive_grain(crop[:739]+deband[739:18120]+crop[18120:], strength=0.30, luma_scaling=12)
 
 final = depth(grain, 10)
+tune(final)
 final.set_output()
@@ -1,6 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 32*2**10
 
 import os
 import random
@@ -19,6 +18,8 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.masked import gated_merge
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E03.The.Twins.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -46,7 +47,7 @@ dehalo = hvf.DeHalo_alpha(aa, rx=1.6, darkstr = 0.4, brightstr=1.2)
 halo_mask = lvf.mask.halo_mask(aa, brz=0.25, rad=1)
 # halo_mask.set_output(4)
 
-dehalo1 = core.std.MaskedMerge(aa, dehalo, halo_mask)
+dehalo1 = gated_merge(aa, dehalo, halo_mask)
 # dehalo1.set_output(5)
 # aa = lvf.aa.transpose_aa(crop, eedi3=False, rep=1)
 # aa.set_output(3)
@@ -62,4 +63,5 @@ grain = agmod(semicrop[:552]+deband+semicrop[23610:], strength=1, size=0.75, sta
 # grain.set_output(9)
 
 final = depth(grain, 10)
+tune(final)
 final.set_output()
@@ -1,6 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 32*2**10
 
 import os
 import random
@@ -19,6 +18,7 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E05.The.Ninth.Jedi.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -51,4 +51,5 @@ grain = agmod(semicrop[:600]+deband+semicrop[30624:], strength=1.0, size=0.5, st
 # grain.set_output(4)
 
 final = depth(grain, 10)
+tune(final)
 final.set_output()
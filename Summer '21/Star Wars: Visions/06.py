@@ -1,7 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 8*2**10
-core.num_threads = 4
 
 import os
 import random
@@ -21,6 +19,7 @@ from cooldegrain import CoolDegrain
 import debandshit as dbs
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E06.T0-B1.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -55,4 +54,5 @@ grain = agmod(semicrop[:520]+deband+semicrop[18528:], strength=0.6, size=0.5, st
 # grain.set_output(5)
 
 final = depth(grain, 10)
+tune(final, threads=4)
 final.set_output()
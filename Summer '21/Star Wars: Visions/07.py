@@ -1,6 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 32*2**10
 
 import os
 import random
@@ -19,6 +18,8 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.masked import gated_merge
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E07.The.Elder.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -46,7 +47,7 @@ dehalo = hvf.DeHalo_alpha(aa, rx=1.8, darkstr=0.5, brightstr=0.8)
 halo_mask = lvf.mask.halo_mask(aa, brz=0.3, rad=1)
 # halo_mask.set_output(4)
 
-dehalo1 = core.std.MaskedMerge(aa, dehalo, halo_mask)
+dehalo1 = gated_merge(aa, dehalo, halo_mask)
 # dehalo1.set_output(5)
 # clean = core.tmc.TMaskCleaner(halo_mask, length=10, thresh=160, fade=0)
 # clean.set_output(6)
@@ -61,4 +62,5 @@ grain = agmod(semicrop[:551]+deband+semicrop[22112:], strength=0.8, size=0.75, s
 # grain.set_output(9)
 
 final = depth(grain, 10)
+tune(final)
 final.set_output(1)
@@ -1,6 +1,5 @@
 import vapoursynth as vs
 core = vs.core
-core.max_cache_size = 32*2**10
 import os
 import random
 import havsfunc as hvf
@@ -18,6 +17,7 @@ import atomchtools as atf
 from cooldegrain import CoolDegrain
 from nnedi3_rpow2 import nnedi3_rpow2
 from vsutil import plane, join, depth, get_w
+from soapfunc.tune import tune
 
 key = "Star.Wars.Visions.S01E08.Lop.Och.1080p.DSNP.WEB-DL.DDP5.1.H.264-FLUX.mkv" #key.decode() 
 source = os.path.join(os.getcwd(), key) 
@@ -52,4 +52,5 @@ grain = agmod(semicrop[:584]+deband+semicrop[27569:], strength=0.3, size=0.5, st
 # grain.set_output(4)
 
 final = depth(grain, 10)
+tune(final)
 final.set_output()
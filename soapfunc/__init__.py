@@ -0,0 +1,22 @@
+"""Soap's helper functions for the encode scripts in this repo"""
+__author__ = 'Soap'
+
+# audio/muxing tools, these run on machines without VapourSynth too
+from . import audio, fonts, mkvedit, mux, pipeline, publish, tmdb
+
+try:
+    import vapoursynth
+except ImportError:
+    pass
+else:
+    from . import bench, cache, checkpoint, chunked, comp, credits, dedup, degrain, edl, fanout, masked, native, output, profiler, scenes, season, tune, util, y4m
+    from .cache import FrameCache
+    from .dedup import Dupes, find_dupes
+    from .degrain import MotionCache, smdegrain
+    from .edl import EDL, rfs
+    from .fanout import Rung
+    from .masked import gated_merge, gated_merge_tiles
+    from .native import find_native
+    from .profiler import Profiler
+    from .scenes import analyse, classify
+    from .util import load_script
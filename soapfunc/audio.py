@@ -0,0 +1,140 @@
+"""Audio transcodes straight from the source into the encoder, many at a time.
+
+ffmpeg decodes the track to WAV on a pipe and qaac (or any encoder that reads stdin)
+encodes it as it arrives: no temp WAV, nobody left holding a file. Every track of every
+file runs in one bounded pool.
+
+    audio.encode_all([audio.Track("../ep01.mkv", 0, "ep01.jpn.aac"),
+                      audio.Track("../ep01.mkv", 1, "ep01.eng.aac"), ...], jobs=6)
+
+An encoder is its command line minus the output file, reading WAV on stdin.
+
+`cached()` keeps one encode per (source stream, encoder settings) under ~/.soapfunc/audio,
+keyed by a hash of the stream's packets, so the 480p/720p/1080p muxes and any re-release
+of the same episode all take the same file:
+
+    python -m soapfunc.audio "[SubsPlease] Heike Monogatari - 01 (1080p) [516659CC].mkv" --codec opus128
+"""
+__author__ = 'Soap'
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+QAAC = ["qaac64", "-V", "73", "--ignorelength", "-", "-o"]
+OPUS_128K = ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-i", "-", "-c:a", "libopus", "-ac", "2", "-b:a", "128k"]
+AAC_128K = ["ffmpeg", "-hide_banner", "-v", "error", "-y", "-i", "-", "-c:a", "aac", "-ac", "2", "-b:a", "128k"]
+
+# name -> (encoder, extension)
+CODECS: Dict[str, Tuple[Sequence[str], str]] = {
+    'qaac': (QAAC, '.aac'),
+    'opus128': (OPUS_128K, '.opus'),
+    'aac128': (AAC_128K, '.m4a'),
+}
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.soapfunc', 'audio')
+_index_lock = threading.Lock()
+
+
+class Track(NamedTuple):
+    source: str
+    stream: int                         # audio stream number, -map 0:a:<stream>
+    output: str
+    encoder: Sequence[str] = QAAC
+
+
+def decoder(source: str, stream: int) -> List[str]:
+    return ["ffmpeg", "-hide_banner", "-v", "error", "-i", source, "-map", f"0:a:{stream}", "-f", "wav", "-"]
+
+
+def transcode(track: Track) -> str:
+    """Decode -> pipe -> encode one track; the output only appears once both sides succeeded."""
+    stem, ext = os.path.splitext(track.output)
+    tmp = f"{stem}.part{ext}"
+    dec = subprocess.Popen(decoder(track.source, track.stream), stdout=subprocess.PIPE)
+    enc = subprocess.Popen(list(track.encoder) + [tmp], stdin=dec.stdout)
+    dec.stdout.close()      # only the encoder holds the read end now, so it sees EOF
+    enc.wait()
+    dec.wait()
+    if dec.returncode or enc.returncode:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise RuntimeError(f"{track.source} a:{track.stream}: decoder exited with {dec.returncode}, "
+                           f"encoder with {enc.returncode}")
+    os.replace(tmp, track.output)
+    return track.output
+
+
+def encode_all(tracks: Sequence[Track], jobs: Optional[int] = None) -> List[str]:
+    """Transcode every track, `jobs` at a time (default: one per CPU)."""
+    jobs = jobs or os.cpu_count() or 1
+    done = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(transcode, t): t for t in tracks}
+        for fut in as_completed(futures):
+            done.append(fut.result())
+            print(f"Audio: {done[-1]} ({len(done)}/{len(tracks)})")
+    return done
+
+
+def _read_index(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def stream_hash(source: str, stream: int, root: str = CACHE_DIR) -> str:
+    """sha256 of the stream's packets (no decode), remembered per file size and mtime."""
+    st = os.stat(source)
+    key = f"{os.path.abspath(source)}|{stream}"
+    index_path = os.path.join(root, 'streams.json')
+    with _index_lock:
+        hit = _read_index(index_path).get(key)
+        if hit and hit['size'] == st.st_size and hit['mtime'] == st.st_mtime:
+            return hit['hash']
+
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-v", "error", "-i", source, "-map", f"0:a:{stream}",
+                          "-c", "copy", "-f", "hash", "-hash", "sha256", "-"],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    digest = out.strip().split('=', 1)[1]
+
+    with _index_lock:
+        index = _read_index(index_path)
+        index[key] = dict(size=st.st_size, mtime=st.st_mtime, hash=digest)
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(index_path + '.tmp', index_path)
+    return digest
+
+
+def cached(source: str, stream: int = 0, encoder: Sequence[str] = OPUS_128K, ext: str = '.opus',
+           root: str = CACHE_DIR) -> str:
+    """Path of the encoded track, transcoding it only if this stream was never encoded with these settings."""
+    os.makedirs(root, exist_ok=True)
+    key = hashlib.blake2b(json.dumps([stream_hash(source, stream, root), list(encoder), ext]).encode(),
+                          digest_size=12).hexdigest()
+    path = os.path.join(root, key + ext)
+    if not os.path.exists(path):
+        transcode(Track(source, stream, path, encoder))
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.audio', description='Print the cached encode of an audio track, '
+                                                                        'encoding it first if needed')
+    parser.add_argument('source')
+    parser.add_argument('--stream', type=int, default=0, help='audio stream number, -map 0:a:<stream>')
+    parser.add_argument('--codec', default='opus128', choices=list(CODECS))
+    opts = parser.parse_args(argv)
+    encoder, ext = CODECS[opts.codec]
+    print(cached(opts.source, opts.stream, encoder, ext))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""Benchmarks for the house chains on synthetic clips.
+
+Every run gets its own process (clean core, clean peak RSS) and renders a fixed number
+of frames from a deterministic source: gradients, hard edges, thin diagonals and seeded
+noise, panning a couple of pixels per frame so the motion search has something to find.
+
+    python -m soapfunc.bench --res 480p 1080p --threads 1 4 8 --out bench.json
+    python -m soapfunc.bench --baseline bench.json --out new.json    # exits 1 on a regression
+
+Results are a JSON list of {chain, res, threads, frames, fps, peak_rss_mb, scaling},
+where scaling is fps / (threads * fps at the lowest thread count).
+"""
+__author__ = 'Soap'
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import plane_view
+
+core = vs.core
+
+RESOLUTIONS = {'480p': (854, 480), '1080p': (1920, 1080), '2160p': (3840, 2160)}
+CYCLE = 24      # distinct source frames, repeated
+
+
+def _pattern(w: int, h: int, n: int) -> List[np.ndarray]:
+    """Luma and two chroma planes (float, 0-1) for frame n."""
+    rng = np.random.default_rng(n)
+    shift = 2 * n
+    x = (np.arange(w) + shift)[None, :].astype(np.float32)
+    y = np.arange(h)[:, None].astype(np.float32)
+    luma = 0.2 + 0.6 * x / (w + 2 * CYCLE) + 0.05 * np.sin(y / h * 6 * np.pi)
+    block = max(8, h // 16)
+    luma = luma + 0.15 * (((x // block) + (y // block)) % 2)
+    luma = np.where(np.abs((x - y) % (4 * block)) < 1.5, 0.95, luma)      # thin aliased diagonals
+    luma = luma + rng.normal(0, 0.015, (h, w)).astype(np.float32)
+    cx = x[:, :w // 2 * 2:2]
+    cy = y[:h // 2 * 2:2]
+    u = 0.5 + 0.1 * np.sin(cx / w * 2 * np.pi) + 0.05 * cy / h
+    v = 0.5 + 0.1 * np.cos(cy / h * 2 * np.pi) - 0.05 * cx / w
+    return [np.clip(p, 0, 1) for p in (luma, u, v)]
+
+
+def synthetic(res: str = '1080p', length: int = 240) -> vs.VideoNode:
+    """Deterministic YUV420P16 clip, the same on every machine."""
+    w, h = RESOLUTIONS[res]
+    blank = core.std.BlankClip(width=w, height=h, format=vs.YUV420P16, length=length, fpsnum=24000, fpsden=1001)
+    frames = []
+    for n in range(CYCLE):
+        # limited range, like the BD sources
+        luma, u, v = _pattern(w, h, n)
+        frames.append([(4096 + luma * 56064).astype(np.uint16),
+                       (4096 + u * 57344).astype(np.uint16), (4096 + v * 57344).astype(np.uint16)])
+
+    def fill(n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        fout = f.copy()
+        for p, data in enumerate(frames[n % CYCLE]):
+            dst = np.asarray(plane_view(fout, p, write=True))
+            dst[:] = data
+        return fout
+
+    return core.std.ModifyFrame(blank, blank, fill)
+
+
+def _native(src: vs.VideoNode, height_1080: int) -> int:
+    """The 1080p descale height scaled to the test resolution, kept even."""
+    return max(2, round(src.height * height_1080 / 1080 / 2) * 2)
+
+
+def heavens_feel(src: vs.VideoNode) -> vs.VideoNode:
+    """lost_butterfly.py / presage_flower.py filter_chain, minus the source loading."""
+    import insaneAA
+    import kagefunc as kgf
+    import lvsfunc as lvf
+    import mvsfunc as mvf
+    import havsfunc as hvf
+    from adptvgrnMod import adptvgrnMod as agmod
+    from vsutil import depth, join, plane
+    from .degrain import smdegrain
+    from .masked import gated_merge
+
+    descale = depth(lvf.scale.descale(clip=src, upscaler=None, height=_native(src, 855),
+                                      kernel=lvf.kernels.Bicubic(b=1/3, c=1/3)), 16)
+    dehalo = hvf.DeHalo_alpha(descale, darkstr=0)
+    upscale = insaneAA.rescale(dehalo, dx=src.width, dy=src.height)
+    aa = insaneAA.insaneAA(src, external_aa=upscale)
+    upscale = join([aa, plane(src, 1), plane(src, 2)])
+
+    den_a = mvf.BM3D(upscale, sigma=[3.2, 0.8], ref=smdegrain(upscale, tr=1, thSAD=64, plane=4))
+    den_b = mvf.BM3D(upscale, sigma=[1.8, 0.8], ref=smdegrain(upscale, tr=1, thSAD=128, plane=4))
+    denoise = gated_merge(den_a, den_b, kgf.adaptive_grain(upscale, luma_scaling=8, show_mask=True))
+
+    line_mask = kgf.retinex_edgemask(denoise).std.Binarize(9999).rgvs.RemoveGrain(3).std.Inflate()
+    deband = core.f3kdb.Deband(denoise, range=18, y=64, cb=16, cr=16, grainy=0, grainc=0, output_depth=16, keep_tv_range=True)
+    deband = core.std.MaskedMerge(deband, upscale, line_mask)
+    return depth(agmod(deband, strength=0.20, size=1, sharp=75, static=True), 10)
+
+
+def jjk_bd(src: vs.VideoNode) -> vs.VideoNode:
+    """BD/Jujutsu Kaisen/season.py chain + finish."""
+    import havsfunc as hvf
+    import kagefunc as kgf
+    import lvsfunc as lvf
+    import mvsfunc as mvf
+    from adptvgrnMod import adptvgrnMod as agmod
+    from vsutil import depth, join, plane
+
+    rescale = depth(lvf.scale.descale(clip=src, upscaler=lvf.scale.reupscale(), height=_native(src, 844),
+                                      kernel=lvf.kernels.Bicubic(b=1/3, c=1/3)), 16)
+    upscale = join([rescale, plane(src, 1), plane(src, 2)])
+    denoise = mvf.BM3D(upscale, sigma=[2.4, 1.0], ref=hvf.SMDegrain(upscale, tr=1, thSAD=84, plane=4))
+    line_mask = kgf.retinex_edgemask(denoise).std.Binarize(9999).rgvs.RemoveGrain(3).std.Inflate()
+    deband = core.f3kdb.Deband(denoise, range=18, y=64, cb=16, cr=16, grainy=0, grainc=0, output_depth=16, keep_tv_range=True)
+    deband = core.std.MaskedMerge(deband, upscale, line_mask)
+    return depth(agmod(deband, strength=0.30, size=1, sharp=75, static=True), 10)
+
+
+def sw_transpose_aa(src: vs.VideoNode) -> vs.VideoNode:
+    """Summer '21/Star Wars: Visions/03.py, transpose_aa through grain."""
+    import havsfunc as hvf
+    import kagefunc as kgf
+    import lvsfunc as lvf
+    from adptvgrnMod import adptvgrnMod as agmod
+    from vsutil import depth, join, plane
+    from .masked import gated_merge
+
+    aa = lvf.aa.transpose_aa(src, eedi3=False, rep=1)
+    aa = join([aa, plane(src, 1), plane(src, 2)])
+    dehalo = hvf.DeHalo_alpha(aa, rx=1.6, darkstr=0.4, brightstr=1.2)
+    dehalo1 = gated_merge(aa, dehalo, lvf.mask.halo_mask(aa, brz=0.25, rad=1))
+    line_mask = kgf.retinex_edgemask(dehalo1).std.Binarize(11000).rgvs.RemoveGrain(3) \
+        .std.Deflate().std.Deflate().std.Minimum()
+    deband = core.neo_f3kdb.Deband(dehalo1, range=12, y=32, cb=8, cr=8, grainy=0, grainc=0, output_depth=16, keep_tv_range=True)
+    deband = core.std.MaskedMerge(deband, dehalo1, line_mask)
+    return depth(agmod(deband, strength=1, size=0.75, static=True, luma_scaling=6), 10)
+
+
+CHAINS: Dict[str, Callable[[vs.VideoNode], vs.VideoNode]] = {
+    'heavens_feel': heavens_feel,
+    'jjk_bd': jjk_bd,
+    'sw_transpose_aa': sw_transpose_aa,
+}
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+
+
+def run_one(chain: str, res: str, threads: int, frames: int, warmup: int = 8, cache_mb: int = 8000) -> dict:
+    """Render `frames` frames after `warmup` untimed ones. Meant to run in a fresh process."""
+    core.num_threads = threads
+    core.max_cache_size = cache_mb
+    clip = CHAINS[chain](synthetic(res, warmup + frames))
+    for _ in clip[:warmup].frames():
+        pass
+    start = time.perf_counter()
+    for _ in clip[warmup:].frames():
+        pass
+    elapsed = time.perf_counter() - start
+    return dict(chain=chain, res=res, threads=threads, frames=frames,
+                fps=round(frames / elapsed, 3), peak_rss_mb=round(_peak_rss_mb(), 1))
+
+
+def run(chains: List[str], resolutions: List[str], threads: List[int], frames: Dict[str, int]) -> List[dict]:
+    results = []
+    for chain in chains:
+        for res in resolutions:
+            rows = []
+            for t in sorted(threads):
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    try:
+                        row = pool.submit(run_one, chain, res, t, frames[res]).result()
+                    except Exception as e:      # missing plugin, out of memory, ...
+                        row = dict(chain=chain, res=res, threads=t, frames=frames[res], error=repr(e))
+                print(json.dumps(row), file=sys.stderr)
+                rows.append(row)
+            ok = [r for r in rows if 'fps' in r]
+            if ok:
+                base = ok[0]['fps'] / ok[0]['threads']
+                for r in ok:
+                    r['scaling'] = round(r['fps'] / (r['threads'] * base), 3)
+            results += rows
+    return results
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float = 0.05) -> List[str]:
+    """Lines describing runs that got more than `tolerance` slower than the baseline."""
+    old = {(r['chain'], r['res'], r['threads']): r for r in baseline if 'fps' in r}
+    regressions = []
+    for r in results:
+        b = old.get((r['chain'], r['res'], r['threads']))
+        if b is None or 'fps' not in r:
+            continue
+        change = r['fps'] / b['fps'] - 1
+        line = (f"{r['chain']:<16} {r['res']:>5} {r['threads']:>3}t  {b['fps']:>8.2f} -> {r['fps']:>8.2f} fps "
+                f"({100 * change:+.1f}%)  {b['peak_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+        print(line)
+        if change < -tolerance:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.bench', description=__doc__.splitlines()[0])
+    parser.add_argument('--chains', nargs='+', default=list(CHAINS), choices=list(CHAINS))
+    parser.add_argument('--res', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--frames', type=int, default=240, help='timed frames at 1080p, scaled by pixel count')
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--baseline', help='earlier --out file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.05)
+    opts = parser.parse_args(argv)
+
+    px_1080 = 1920 * 1080
+    frames = {r: max(24, round(opts.frames * px_1080 / (w * h))) for r, (w, h) in RESOLUTIONS.items()}
+    baseline = None
+    if opts.baseline:
+        with open(opts.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = run(opts.chains, opts.res, sorted(set(opts.threads)), frames)
+    report = dict(machine=dict(platform=platform.platform(), cpus=os.cpu_count(), python=platform.python_version(),
+                               vapoursynth=str(core.version_number())),
+                  results=results)
+    with open(opts.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, opts.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {100 * opts.tolerance:.0f}%")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
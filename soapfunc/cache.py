@@ -0,0 +1,260 @@
+"""Persistent on-disk cache for intermediate filter stages.
+
+    fc = FrameCache(source, max_size=100 * 2**30)
+    upscale = fc.stage(upscale, 'rescale', [fc.source_key], height=844, b=1/3, c=1/3)
+    dehalo = fc.stage(dehalo_clip(src, upscale), 'dehalo', [upscale], brz=0.25, rad=1)
+    denoise = fc.stage(denoise, 'denoise', [dehalo], thSAD=84, plane=4, sigma=[0.8, 0])
+    # tweaking the deband/grain below now only re-renders deband and grain
+
+A stage's key hashes the keys of what it was built from (`upstream`: the source's key
+and/or earlier staged clips, always given), the clip's format, size and length, and
+the params given to `stage()`. The cache can't see the filters between a stage and its
+upstream, so those params are their only description: they are required, and must
+include every setting that changes the output (change one that isn't passed and the
+old frames come back).
+
+Frames are stored in zlib-compressed blocks and the least recently used blocks are
+evicted once the cache grows past `max_size`. Frames wait in memory until their block
+is complete, at most `staging_mb` of them; past that, or after STALE seconds, a partial
+block is written out and merged with the rest of its frames later.
+"""
+__author__ = 'Soap'
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Sequence, Union
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import plane_view
+
+core = vs.core
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.soapfunc', 'frames')
+STALE = 60      # seconds a partial block stays in memory
+
+
+def source_digest(path: str, sample: int = 4 << 20) -> str:
+    """Hash of a (huge) source file from its size and three samples of its content."""
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in (0, max(size // 2 - sample // 2, 0), max(size - sample, 0)):
+            f.seek(offset)
+            h.update(f.read(sample))
+    return h.hexdigest()
+
+
+def _props(frame: vs.VideoFrame) -> Dict[str, Any]:
+    out = {}
+    for k, v in frame.props.items():
+        if isinstance(v, (int, float, str, bytes)) or \
+                (isinstance(v, (list, tuple)) and all(isinstance(x, (int, float)) for x in v)):
+            out[k] = v
+    return out
+
+
+class FrameCache:
+    """One cache per source file; call `stage()` after any node worth keeping."""
+
+    def __init__(self, source: str, root: str = CACHE_DIR, max_size: int = 50 * 2**30, block: int = 16,
+                 staging_mb: int = 512) -> None:
+        self.root = root
+        self.max_size = max_size
+        self.block = block
+        self.staging_bytes = staging_mb * 2**20
+        self.source_key = source_digest(source)
+        self.last_key = self.source_key
+        self._keys: Dict[int, str] = {}
+        self._nodes: List[vs.VideoNode] = []     # keeps the id() keys valid
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.evict()
+
+    def key(self, name: str, params: Dict[str, Any], upstream: Iterable[str]) -> str:
+        blob = json.dumps([name, sorted(upstream), params], sort_keys=True, default=repr)
+        return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+    def stage(self, clip: vs.VideoNode, name: str, upstream: Sequence[Union[str, vs.VideoNode]],
+              **params: Any) -> vs.VideoNode:
+        """Cache `clip` on disk. `upstream` is what it was built from: `fc.source_key` and/or
+        clips returned by earlier stage() calls (or their keys)."""
+        if not params:
+            raise ValueError(f'FrameCache: stage {name!r} needs the parameters that change its output')
+        if not upstream:
+            raise ValueError(f'FrameCache: stage {name!r} needs its upstream, fc.source_key for the first one')
+        keys = []
+        for u in upstream:
+            if isinstance(u, vs.VideoNode):
+                if id(u) not in self._keys:
+                    raise ValueError(f'FrameCache: stage {name!r}: an upstream clip that is not a cached stage')
+                u = self._keys[id(u)]
+            keys.append(u)
+        shape = [clip.format.name if clip.format else None, clip.width, clip.height, clip.num_frames,
+                 clip.fps_num, clip.fps_den]
+        key = self.key(name, dict(params, _clip=shape), keys)
+        self.last_key = key
+        node = _Stage(self, os.path.join(self.root, key), clip).node
+        self._keys[id(node)] = key
+        self._nodes.append(node)
+        return node
+
+    def evict(self) -> None:
+        """Drop least recently used blocks until the cache fits in max_size."""
+        blocks = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith('.blk'):
+                    path = os.path.join(dirpath, name)
+                    st = os.stat(path)
+                    blocks.append((st.st_mtime, st.st_size, path))
+        total = sum(b[1] for b in blocks)
+        for _, size, path in sorted(blocks):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _account(self, size: int) -> None:
+        with self._lock:
+            self._written += size
+            if self._written < self.max_size // 20:
+                return
+            self._written = 0
+        self.evict()
+
+
+class _Stage:
+    def __init__(self, cache: FrameCache, path: str, clip: vs.VideoNode) -> None:
+        if clip.format is None or clip.width == 0:
+            raise ValueError('FrameCache: variable format/resolution clips are not supported')
+        self.cache = cache
+        self.path = path
+        self.clip = clip
+        self.lock = threading.Lock()
+        self.staging: Dict[int, Dict[int, Any]] = {}       # in order of their first frame
+        self.staged_at: Dict[int, float] = {}
+        self.staged = 0
+        self.block_locks: Dict[int, threading.Lock] = {}
+        self.loaded: 'OrderedDict[int, Dict[int, Any]]' = OrderedDict()
+        os.makedirs(path, exist_ok=True)
+
+        fmt = clip.format
+        self.frame_bytes = fmt.bytes_per_sample * sum(
+            (clip.width >> (fmt.subsampling_w if p else 0)) * (clip.height >> (fmt.subsampling_h if p else 0))
+            for p in range(fmt.num_planes))
+        self.dtype = np.dtype(f'u{fmt.bytes_per_sample}' if fmt.sample_type == vs.INTEGER else f'f{fmt.bytes_per_sample}')
+        blank = core.std.BlankClip(clip)
+        self.loader = core.std.ModifyFrame(blank, blank, self._load)
+        self.storer = core.std.ModifyFrame(clip, clip, self._store)
+        self.pending: Dict[int, Dict[int, Any]] = {}
+        self.node = core.std.FrameEval(blank, self._select)
+
+    def _block_path(self, b: int) -> str:
+        return os.path.join(self.path, f'{b:07d}.blk')
+
+    def _select(self, n: int) -> vs.VideoNode:
+        # the block is read here, so one evicted in the meantime is a miss rather than an error in _load
+        try:
+            data = self._read_block(n // self.cache.block)
+        except FileNotFoundError:
+            return self.storer
+        if n not in data:
+            return self.storer      # a partial block written out early
+        with self.lock:
+            self.pending[n] = data
+        return self.loader
+
+    def _read_block(self, b: int) -> Dict[int, Any]:
+        with self.lock:
+            if b in self.loaded:
+                self.loaded.move_to_end(b)
+                return self.loaded[b]
+        path = self._block_path(b)
+        with open(path, 'rb') as f:
+            data = pickle.loads(zlib.decompress(f.read()))
+        try:
+            os.utime(path)  # LRU
+        except FileNotFoundError:
+            pass            # evicted just now; we have the frames anyway
+        with self.lock:
+            self.loaded[b] = data
+            while len(self.loaded) > 4:
+                self.loaded.popitem(last=False)
+        return data
+
+    def _load(self, n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        with self.lock:
+            data = self.pending.pop(n, None)
+        props, planes = (data or self._read_block(n // self.cache.block))[n]
+        fout = f.copy()
+        for p, data in enumerate(planes):
+            dst = np.asarray(plane_view(fout, p, write=True))
+            dst[:] = np.frombuffer(data, self.dtype).reshape(dst.shape)
+        for k, v in props.items():
+            fout.props[k] = v
+        return fout
+
+    def _store(self, n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+        planes = [np.asarray(plane_view(f, p)).tobytes() for p in range(f.format.num_planes)]
+        b = n // self.cache.block
+        first = b * self.cache.block
+        size = min(self.cache.block, self.clip.num_frames - first)
+        with self.lock:
+            frames = self.staging.setdefault(b, {})
+            self.staged_at.setdefault(b, time.monotonic())
+            if n not in frames:
+                self.staged += self.frame_bytes
+            frames[n] = (_props(f), planes)
+            out = [b] if len(frames) == size else []
+            # scrubbing around in a previewer leaves blocks that never fill up: write them out
+            # once they are old or hold too much memory, oldest first
+            left = self.staged - (self.frame_bytes * size if out else 0)
+            now = time.monotonic()
+            for other in self.staging:
+                if other == b and out:
+                    continue
+                if left <= self.cache.staging_bytes and now - self.staged_at[other] < STALE:
+                    break
+                out.append(other)
+                left -= self.frame_bytes * len(self.staging[other])
+            flush = []
+            for x in out:
+                flush.append((x, self.staging.pop(x)))
+                self.staged_at.pop(x)
+                self.staged -= self.frame_bytes * len(flush[-1][1])
+        for x, block in flush:
+            self._write(x, block)
+        return f
+
+    def _write(self, b: int, frames: Dict[int, Any]) -> None:
+        with self.lock:
+            lock = self.block_locks.setdefault(b, threading.Lock())
+        with lock:
+            path = self._block_path(b)
+            try:
+                with open(path, 'rb') as fh:
+                    old = pickle.loads(zlib.decompress(fh.read()))    # written out partial before
+                old.update(frames)
+                frames = old
+            except FileNotFoundError:
+                pass
+            blob = zlib.compress(pickle.dumps(frames, protocol=pickle.HIGHEST_PROTOCOL), 1)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as fh:
+                fh.write(blob)
+            os.replace(tmp, path)
+            with self.lock:
+                self.loaded.pop(b, None)
+        self.cache._account(len(blob))
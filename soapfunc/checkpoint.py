@@ -0,0 +1,156 @@
+"""Resumable renders for the long lossless passes.
+
+The movie is rendered in fixed segments of `segment_len` frames. Each segment goes to a
+temp file first and is only renamed into place once the encoder has exited cleanly. The
+manifest (written atomically after every rename) then records its frame range, a hash of
+the raw frames that went in and a hash of the file that came out. A restart checks the
+committed segments against the manifest and carries on after the last good one; the
+segments are joined with -c copy at the end.
+
+Old segments are only reused for the same clip shape, encoder arguments and script
+(hashed, by default the one being run). Edits in modules the script imports don't change
+that hash; `verify=True` also renders the last committed segment again and compares its
+frames with the hash recorded for it.
+
+Segment boundaries only depend on the frame count, so with an intra-only encoder (FFV1) a
+resumed run produces the same file as one that was never interrupted.
+
+    checkpoint.render(final, "lostFiltered.mkv", output.rawvideo(ffv1_args, final))
+"""
+__author__ = 'Soap'
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Sequence
+
+import vapoursynth as vs
+
+from . import output as output_
+from .chunked import concat
+from .util import main_script
+
+core = vs.core
+
+MANIFEST = 'manifest.json'
+
+
+def fingerprint(clip: vs.VideoNode, encoder_args: Sequence[str], script: Optional[str] = None) -> Dict[str, Any]:
+    """What has to match for old segments to be reusable."""
+    return dict(frames=clip.num_frames, width=clip.width, height=clip.height, format=clip.format.name,
+                fps=f'{clip.fps.numerator}/{clip.fps.denominator}', encoder=list(encoder_args),
+                script=file_hash(script) if script else None)
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**24), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _save(workdir: str, manifest: Dict[str, Any]) -> None:
+    path = os.path.join(workdir, MANIFEST)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def frame_hash(clip: vs.VideoNode) -> str:
+    """Hash of the raw frames, the same one render() records per segment."""
+    h = hashlib.blake2b(digest_size=16)
+    for frame in clip.frames():
+        for p in output_._buffers(frame):
+            h.update(p)
+    return h.hexdigest()
+
+
+def load(workdir: str, expect: Dict[str, Any], verify: bool = False) -> List[Dict[str, Any]]:
+    """Committed segments that are still intact, in order and without gaps.
+
+    Sizes are checked for every segment and the file hash only for the last one (the one a
+    crash would have hit) unless `verify` asks for all of them; FFV1 segments are big.
+    """
+    path = os.path.join(workdir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest['clip'] != expect:
+        raise ValueError(f"{workdir}: the clip or encoder settings changed since these segments were written; "
+                         f"delete the folder or pass restart=True")
+    good, pos = [], 0
+    segments = manifest['segments']
+    for i, seg in enumerate(segments):
+        part = os.path.join(workdir, seg['file'])
+        if seg['start'] != pos or not os.path.exists(part) or os.path.getsize(part) != seg['size']:
+            break
+        if (verify or i == len(segments) - 1) and file_hash(part) != seg['file_hash']:
+            break
+        good.append(seg)
+        pos = seg['end']
+    return good
+
+
+def render(clip: vs.VideoNode, output: str, encoder_args: Sequence[str], segment_len: int = 2000,
+           y4m: bool = False, restart: bool = False, verify: bool = False, keep: bool = False,
+           script: Optional[str] = None) -> None:
+    """clip -> encoder -> `output`, surviving crashes. `encoder_args` is the command line minus the output file.
+
+    `script` is the file whose edits invalidate old segments, the running script by default.
+    """
+    workdir = output + '.segments'
+    if restart and os.path.isdir(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    expect = fingerprint(clip, encoder_args, script or main_script())
+    segments = load(workdir, expect, verify)
+    if verify and segments:
+        last = segments[-1]
+        if frame_hash(clip[last['start']:last['end']]) != last['frame_hash']:
+            raise ValueError(f"{workdir}: the chain no longer gives the frames of {last['file']}; "
+                             f"delete the folder or pass restart=True")
+    manifest = dict(clip=expect, segments=segments)
+    ext = os.path.splitext(output)[1]
+
+    start = segments[-1]['end'] if segments else 0
+    if start:
+        print(f"Resuming at frame {start}/{clip.num_frames} ({len(segments)} segments committed)")
+    for first in range(start, clip.num_frames, segment_len):
+        last = min(first + segment_len, clip.num_frames)
+        name = f'{first:07d}-{last:07d}{ext}'
+        part = os.path.join(workdir, name)
+        tmp = os.path.join(workdir, f'{first:07d}.tmp{ext}')
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        frames = hashlib.blake2b(digest_size=16)
+
+        def tap(n: int, planes: List[memoryview]) -> None:
+            for p in planes:
+                frames.update(p)
+
+        process = output_.popen(list(encoder_args) + [tmp])
+        output_.write(clip[first:last], process, y4m=y4m, report=False, tap=tap,
+                      progress_update=lambda value, endvalue: print(
+                          f"\rVapourSynth: {first + value}/{clip.num_frames} "
+                          f"~ {100 * (first + value) // clip.num_frames}%", end=""))
+        process.communicate()
+        if process.returncode:
+            raise RuntimeError(f"segment {first}-{last}: encoder exited with {process.returncode}")
+
+        with open(tmp, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, part)
+        segments.append(dict(start=first, end=last, file=name, frame_hash=frames.hexdigest(),
+                             size=os.path.getsize(part), file_hash=file_hash(part)))
+        _save(workdir, manifest)
+    print()
+
+    concat([os.path.join(workdir, seg['file']) for seg in segments], output)
+    if not keep:
+        shutil.rmtree(workdir)
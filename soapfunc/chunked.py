@@ -0,0 +1,120 @@
+"""Keyframe-aligned chunked encoding.
+
+Splits a long render at keyframes/scene changes, renders and encodes the chunks in a
+process pool and joins them back with ffmpeg's concat demuxer (-c copy, so lossless).
+
+Every worker rebuilds the full filter chain and only then trims its chunk out of the
+final node. Temporal filters (SMDegrain tr=1, MDegrain, etc.) therefore read their real
+neighbours across the chunk edge; the edge frames are simply computed twice. That is
+the overlap, and it keeps the filtered frames identical to one serial clip.output().
+The encoded file only matches a serial encode with an intra-only encoder (FFV1): x265
+chunks are separate encodes, each with its own rate control and lookahead.
+
+Callers that write comparison screenshots from the chain should skip them in the
+workers and do them once in the parent (see the Heaven's Feel scripts).
+"""
+__author__ = 'Soap'
+
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import vapoursynth as vs
+
+core = vs.core
+
+Chunk = Tuple[int, int]
+
+
+def keyframes(path: str) -> List[int]:
+    """I-frame numbers of a video file, what Random scripts/keyframe_list.bat works out."""
+    out = subprocess.run(["ffprobe", "-v", "quiet", "-select_streams", "v", "-show_frames",
+                          "-show_entries", "frame=pict_type", "-of", "csv", path],
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return [n for n, line in enumerate(out.splitlines()) if line.strip().endswith('I')]
+
+
+def read_keyframes(path: str) -> List[int]:
+    """Read the .txt made by keyframe_list.bat (grep -n line numbers, so 1-based)."""
+    with open(path) as f:
+        return [int(line) - 1 for line in f if line.strip()]
+
+
+def scene_changes(clip: vs.VideoNode, threshold: float = 0.14) -> List[int]:
+    """Scene cuts found with misc.SCDetect on a small luma-only copy of `clip`."""
+    small = clip.resize.Bilinear(clip.width // 4 & ~1, clip.height // 4 & ~1, format=vs.GRAY8)
+    small = core.misc.SCDetect(small, threshold=threshold)
+    return [n for n, f in enumerate(small.frames()) if f.props.get('_SceneChangePrev')]
+
+
+def plan(num_frames: int, boundaries: Optional[Iterable[int]] = None, chunk_len: int = 4000) -> List[Chunk]:
+    """Cut [0, num_frames) into chunks of at least `chunk_len` frames, only at `boundaries`.
+
+    Without boundaries the clip is cut every `chunk_len` frames, which is only safe
+    for intra-only output such as FFV1.
+    """
+    if boundaries is None:
+        boundaries = range(chunk_len, num_frames, chunk_len)
+    cuts = [0]
+    for b in sorted(set(boundaries)):
+        if b - cuts[-1] >= chunk_len and num_frames - b >= chunk_len // 2:
+            cuts.append(b)
+    cuts.append(num_frames)
+    return list(zip(cuts, cuts[1:]))
+
+
+def _render(builder: Callable[[str], vs.VideoNode], source: str, chunk: Chunk,
+            encoder_args: Sequence[str], output: str, threads: int) -> str:
+    core.num_threads = threads
+    clip = builder(source)[chunk[0]:chunk[1]]
+    process = subprocess.Popen(list(encoder_args) + [output], stdin=subprocess.PIPE)
+    clip.output(process.stdin, y4m=True)
+    process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"chunk {chunk}: encoder exited with {process.returncode}")
+    return output
+
+
+def concat(parts: Sequence[str], output: str) -> None:
+    """Join the chunk files without re-encoding."""
+    listing = output + '.concat.txt'
+    with open(listing, 'w', encoding='utf-8') as f:
+        for part in parts:
+            path = os.path.abspath(part).replace('\\', '/').replace("'", r"'\''")
+            f.write(f"file '{path}'\n")
+    subprocess.run(["ffmpeg", "-hide_banner", "-v", "quiet", "-y", "-f", "concat", "-safe", "0",
+                    "-i", listing, "-map", "0", "-c", "copy", output], check=True)
+    os.remove(listing)
+
+
+def encode(builder: Callable[[str], vs.VideoNode], source: str, output: str, encoder_args: Sequence[str],
+           boundaries: Optional[Iterable[int]] = None, workers: int = 4, chunk_len: int = 4000,
+           keep: bool = False) -> None:
+    """Chunked, parallel version of clip.output() -> encoder.
+
+    `builder(source)` must return the final clip and be picklable (a top-level function
+    of a script guarded by `if __name__ == '__main__'`, or a functools.partial of one).
+    `encoder_args` is the encoder command line minus its output file, reading y4m on stdin.
+    """
+    num_frames = builder(source).num_frames
+    chunks = plan(num_frames, boundaries, chunk_len)
+    workdir = output + '.chunks'
+    os.makedirs(workdir, exist_ok=True)
+    ext = os.path.splitext(output)[1]
+    parts = [os.path.join(workdir, f"{i:05d}{ext}") for i in range(len(chunks))]
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    print(f"Chunked encode: {len(chunks)} chunks over {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_render, builder, source, chunk, encoder_args, part, threads)
+                   for chunk, part in zip(chunks, parts)]
+        for done, fut in enumerate(as_completed(futures), 1):
+            fut.result()
+            print(f"\rChunks: {done}/{len(chunks)} ~ {100 * done // len(chunks)}%", end="")
+    print()
+
+    concat(parts, output)
+    if not keep:
+        shutil.rmtree(workdir)
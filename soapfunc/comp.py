@@ -0,0 +1,101 @@
+"""Comparison screenshots.
+
+Prepares every clip once (resize to the comp size, convert to RGB), requests all the
+frames of all the clips at once and writes the PNGs from a thread pool. Frames already
+on disk are skipped, so adding an encode to an existing set only renders that encode.
+
+    save([13355, 79259, 85924], {'src': src, 'filtered': final,
+                                  '480p': source('480p/ep.mkv'), '1080p': source('1080p/ep.mkv')})
+"""
+__author__ = 'Soap'
+
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import plane_view
+
+core = vs.core
+
+
+def prep(clip: vs.VideoNode, w: int = 1920, h: int = 1080, dither: bool = True, matrix: str = '709') -> vs.VideoNode:
+    """Scale to the comp size and convert to RGB24, once per clip."""
+    args = dict(format=vs.RGB24, dither_type='error_diffusion' if dither else 'none')
+    if clip.format.color_family == vs.YUV:
+        args['matrix_in_s'] = matrix
+    return clip.resize.Spline36(w, h, **args)
+
+
+def write_png(path: str, rgb: np.ndarray, level: int = 6) -> None:
+    """(h, w, 3) uint8 -> PNG. zlib drops the GIL, so a thread pool writes in parallel."""
+    h, w, _ = rgb.shape
+    raw = np.empty((h, w * 3 + 1), np.uint8)
+    raw[:, 0] = 0   # filter type: none
+    raw[:, 1:] = rgb.reshape(h, w * 3)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    png = b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8, 2, 0, 0, 0)) \
+        + chunk(b'IDAT', zlib.compress(raw.tobytes(), level)) + chunk(b'IEND', b'')
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(png)
+    os.replace(tmp, path)
+
+
+def _rgb(frame: vs.VideoFrame) -> np.ndarray:
+    return np.dstack([np.asarray(plane_view(frame, p)) for p in range(3)])
+
+
+def save(frames: Sequence[int], clips: Dict[str, vs.VideoNode], out_dir: str = 'comps',
+         w: int = 1920, h: int = 1080, dither: bool = True, matrix: str = '709',
+         in_flight: int = 16, writers: int = 8) -> List[str]:
+    """Write <out_dir>/<frame>_<name>.png for every frame and clip; returns the files written.
+
+    A PNG that fails to write is reported on stderr and left out of the result.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    prepped = {name: prep(clip, w, h, dither, matrix) for name, clip in clips.items()}
+    jobs = deque()
+    for name, clip in prepped.items():
+        for n in frames:
+            path = os.path.join(out_dir, f'{n:06d}_{name}.png')
+            if n < clip.num_frames and not os.path.exists(path):
+                jobs.append((clip, n, path))
+
+    writes = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        while jobs or pending:
+            while jobs and len(pending) < in_flight:
+                clip, n, path = jobs.popleft()
+                pending.append((clip.get_frame_async(n), path))
+            fut, path = pending.popleft()
+            writes.append((pool.submit(write_png, path, _rgb(fut.result())), path))
+
+    written = []
+    for fut, path in writes:
+        try:
+            fut.result()
+        except OSError as e:
+            print(f"comp: {path}: {e}", file=sys.stderr)
+        else:
+            written.append(path)
+    return written
+
+
+def save_background(frames: Sequence[int], clips: Dict[str, vs.VideoNode], **kwargs) -> threading.Thread:
+    """save() on a thread with only a couple of frames in flight, so it can run next to an encode."""
+    kwargs.setdefault('in_flight', 2)
+    t = threading.Thread(target=save, args=(frames, clips), kwargs=kwargs, daemon=True)
+    t.start()
+    return t
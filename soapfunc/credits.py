@@ -0,0 +1,159 @@
+"""Find where the credited OP/ED sit in an episode by matching against the NC clips.
+
+Every frame is reduced to a 64 bit DCT perceptual hash (credit text only flips a few
+bits). The NCOP/NCED hashes are kept as a small index next to the file, anchor frames
+vote for an offset, and the aligned diagonal is walked to get the matched span:
+
+    python -m soapfunc.credits 00004.m2ts --op "../JJK v3/00005.m2ts" --ed "../JJK v1/00006.m2ts"
+    # op: cred_op = source[2832:4990]  nc = op[2:-24]
+
+which is what atf.ApplyCredits(cred_op, op[2:-24], filtered[2832:4990]) needs.
+"""
+__author__ = 'Soap'
+
+import argparse
+import os
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import plane_view, source
+
+core = vs.core
+
+_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+    m[0] /= np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+
+_DCT = _dct_matrix(_SIZE)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], np.uint8)
+
+
+class Hashes(NamedTuple):
+    hashes: np.ndarray      # uint64 per frame
+    flat: np.ndarray        # bool, near-uniform frames (black, white flashes) that match anything
+
+
+def hash_frames(frames: np.ndarray) -> Hashes:
+    """(N, 32, 32) luma -> 64 bit pHashes, all frames at once."""
+    dct = np.einsum('ij,njk,lk->nil', _DCT, frames.astype(np.float64), _DCT)[:, :8, :8].reshape(len(frames), 64)
+    med = np.median(dct[:, 1:], axis=1, keepdims=True)
+    bits = (dct > med).astype(np.uint8)
+    hashes = np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+    flat = frames.reshape(len(frames), -1).std(axis=1) < 2.0
+    return Hashes(hashes, flat)
+
+
+def hash_clip(clip: vs.VideoNode, progress: bool = True) -> Hashes:
+    tiny = clip.resize.Bilinear(_SIZE, _SIZE, format=vs.GRAY8)
+    frames = np.empty((clip.num_frames, _SIZE, _SIZE), np.uint8)
+    for n, f in enumerate(tiny.frames()):
+        frames[n] = np.asarray(plane_view(f, 0))
+        if progress and n % 2000 == 0:
+            print(f"\rHashing: {n}/{clip.num_frames}", end="")
+    if progress:
+        print(f"\rHashing: {clip.num_frames}/{clip.num_frames}")
+    # batches keep the float64 DCT input small on 170k-frame movies
+    parts = [hash_frames(frames[i:i + 4096]) for i in range(0, len(frames), 4096)]
+    return Hashes(np.concatenate([p.hashes for p in parts]), np.concatenate([p.flat for p in parts]))
+
+
+def index(path: str, clip: Optional[vs.VideoNode] = None) -> Hashes:
+    """Hashes of an NC file, cached as <file>.phash.npz so every episode reuses them."""
+    cache = path + '.phash.npz'
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        data = np.load(cache)
+        return Hashes(data['hashes'], data['flat'])
+    hashes = hash_clip(clip if clip is not None else source(path))
+    np.savez_compressed(cache, hashes=hashes.hashes, flat=hashes.flat)
+    return hashes
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Popcount of a ^ b with broadcasting."""
+    x = np.ascontiguousarray(np.bitwise_xor(a, b))
+    return _POPCOUNT[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.int32)
+
+
+class CreditMatch(NamedTuple):
+    ep_start: int
+    ep_end: int             # exclusive, like a slice
+    nc_start: int
+    nc_end: int             # exclusive
+    nc_length: int
+    distance: float         # mean Hamming distance over the match
+
+    def nc_slice(self) -> str:
+        end = '' if self.nc_end == self.nc_length else str(self.nc_end - self.nc_length)
+        start = '' if self.nc_start == 0 else str(self.nc_start)
+        return f'[{start}:{end}]'
+
+    def __str__(self) -> str:
+        return f'source[{self.ep_start}:{self.ep_end}]  nc{self.nc_slice()}  (distance {self.distance:.1f})'
+
+
+def match(episode: Hashes, nc: Hashes, thr: int = 14, anchor_step: int = 12, gap: int = 24) -> Optional[CreditMatch]:
+    """Locate `nc` inside `episode`, or None when it doesn't appear."""
+    anchors = np.flatnonzero(~nc.flat)[::anchor_step]
+    if not len(anchors):
+        return None
+    # anchors x episode distances, every close pair votes for offset = ep - nc
+    dist = hamming(nc.hashes[anchors, None], episode.hashes[None, :])
+    a_idx, e_idx = np.nonzero((dist <= thr) & ~episode.flat[None, :])
+    if not len(a_idx):
+        return None
+    offsets = e_idx - anchors[a_idx]
+    values, counts = np.unique(offsets, return_counts=True)
+    offset = int(values[counts.argmax()])
+
+    # walk the diagonal for that offset
+    j = np.arange(len(nc.hashes))
+    e = j + offset
+    valid = (e >= 0) & (e < len(episode.hashes))
+    j, e = j[valid], e[valid]
+    d = hamming(nc.hashes[j], episode.hashes[e])
+    good = (d <= thr) | nc.flat[j]
+    # bridge short misses (hard cuts inside the OP, heavy credit overlays)
+    idx = np.flatnonzero(good)
+    if not len(idx):
+        return None
+    runs = np.split(idx, np.flatnonzero(np.diff(idx) > gap) + 1)
+    best = max(runs, key=lambda r: r[-1] - r[0])
+    # trim flat frames at the edges, they'd "match" black anywhere
+    solid = best[~nc.flat[j[best]]]
+    if not len(solid):
+        return None
+    lo, hi = solid[0], solid[-1]
+    return CreditMatch(int(e[lo]), int(e[hi]) + 1, int(j[lo]), int(j[hi]) + 1, len(nc.hashes),
+                       float(d[lo:hi + 1].mean()))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.credits', description=__doc__.splitlines()[0])
+    parser.add_argument('episode')
+    parser.add_argument('--op', help='creditless OP')
+    parser.add_argument('--ed', help='creditless ED')
+    parser.add_argument('--thr', type=int, default=14, help='max Hamming distance out of 64')
+    opts = parser.parse_args(argv)
+
+    ep = hash_clip(source(opts.episode))
+    for name, path in (('op', opts.op), ('ed', opts.ed)):
+        if not path:
+            continue
+        m = match(ep, index(path), thr=opts.thr)
+        if m is None:
+            print(f"{name}: not found")
+        else:
+            print(f"{name}: cred_{name} = source[{m.ep_start}:{m.ep_end}]  nc = {name}{m.nc_slice()}"
+                  f"  (distance {m.distance:.1f})")
+
+
+if __name__ == '__main__':
+    main()
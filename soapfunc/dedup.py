@@ -0,0 +1,114 @@
+"""Filter held frames once.
+
+Anime is mostly on twos/threes with held stills in between, but the chains run BM3D,
+SMDegrain and AA on every frame anyway. `find_dupes` scans the source once for frames
+that match the start of their run, and `dedup` runs the spatial-only part of a chain
+on the unique frames and repeats the results back in:
+
+    dupes = find_dupes(src, cache=key + '.dupes.txt')
+    aa = dedup(src, lambda c: taa.TAAmbk(c, aatype='Nnedi3'), dupes)
+    denoise = mvf.BM3D(aa, sigma=3.0)   # temporal/motion stuff stays at full rate
+
+By default only frames identical to the start of their run in every plane count, so the
+result is the same as running the chain on every frame. `thr` above 0 also takes
+near-repeats (grain, compression noise, a small mouth flap or a slow fade that stays
+under it) and replaces each with the filtered first frame of its run, chroma included:
+that is lossy, so compare against the plain chain before using it for an encode.
+
+Temporal filters (SMDegrain, MDegrain, TemporalSoften, ...) must not go inside the
+deduped function: their neighbours would be the next unique frame instead of the
+real one. Keep them before or after it, on the full clip.
+"""
+__author__ = 'Soap'
+
+import os
+import sys
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import plane_view
+
+core = vs.core
+
+
+class Dupes(NamedTuple):
+    num_frames: int
+    dupes: List[int]        # frames that repeat the start of their run
+
+    @property
+    def skipped(self) -> int:
+        return len(self.dupes)
+
+
+def block_diff(a: np.ndarray, b: np.ndarray, block: int = 8) -> float:
+    """Largest mean absolute difference over block x block tiles, so a mouth flap on an
+    otherwise held frame isn't averaged away like it would be by a whole-frame mean."""
+    h, w = (a.shape[0] // block) * block, (a.shape[1] // block) * block
+    d = np.abs(a[:h, :w].astype(np.float32) - b[:h, :w].astype(np.float32))
+    return float(d.reshape(h // block, block, w // block, block).mean(axis=(1, 3)).max())
+
+
+def _planes(f: vs.VideoFrame) -> List[np.ndarray]:
+    return [np.array(plane_view(f, p), copy=True) for p in range(f.format.num_planes)]
+
+
+def find_dupes(clip: vs.VideoNode, thr: float = 0.0, block: int = 8,
+               cache: Optional[str] = None, progress: bool = True) -> Dupes:
+    """One pass over `clip` at full size, every plane; `thr` is in 8 bit levels, 0 means identical.
+
+    `cache` is a text file for the result, so reruns of the script skip the scan.
+    """
+    header = f"# find_dupes thr={thr} block={block}"
+    if cache and os.path.exists(cache):
+        with open(cache) as f:
+            first, *rest = f.read().split('\n', 1) + ['']
+        if first == header:
+            num_frames, *dupes = (int(x) for x in rest[0].split())
+            if num_frames == clip.num_frames:
+                return Dupes(num_frames, dupes)
+
+    fmt = clip.format
+    levels = thr * ((1 << fmt.bits_per_sample) - 1) / 255 if fmt.sample_type == vs.INTEGER else thr / 255
+    dupes, ref = [], None
+    for n, f in enumerate(clip.frames()):
+        cur = _planes(f)
+        if ref is not None and (all(np.array_equal(a, b) for a, b in zip(ref, cur)) if thr <= 0 else
+                                max(block_diff(a, b, block) for a, b in zip(ref, cur)) < levels):
+            dupes.append(n)
+        else:
+            ref = cur
+        if progress and n % 500 == 0:
+            print(f"\rDupe scan: {n}/{clip.num_frames} ~ {100 * n // clip.num_frames}%", end="", file=sys.stderr)
+    if progress:
+        print(f"\rDupe scan: {len(dupes)}/{clip.num_frames} frames are repeats", file=sys.stderr)
+
+    if cache:
+        with open(cache, 'w') as f:
+            f.write(header + '\n' + '\n'.join(str(x) for x in [clip.num_frames] + dupes))
+    return Dupes(clip.num_frames, dupes)
+
+
+def dedup(clip: vs.VideoNode, spatial: Callable[[vs.VideoNode], vs.VideoNode], dupes: Dupes,
+          report: bool = True) -> vs.VideoNode:
+    """Run `spatial` on the unique frames only and put the repeats back in.
+
+    Frame n of the result is `spatial` applied to the first frame of n's run, all planes;
+    with dupes found at thr=0 that is the frame the plain chain would give.
+    """
+    if dupes.num_frames != clip.num_frames:
+        raise ValueError('dedup: dupe list was made for a different clip')
+    if not dupes.dupes:
+        return spatial(clip)
+
+    unique = core.std.DeleteFrames(clip, dupes.dupes)
+    filtered = spatial(unique)
+    # each dupe repeats the unique frame before it; in unique-clip numbering that's
+    # (dupe index - dupes before it - 1)
+    repeat = [d - i - 1 for i, d in enumerate(dupes.dupes)]
+    out = core.std.DuplicateFrames(filtered, repeat)
+    if report:
+        print(f"dedup: {dupes.skipped}/{dupes.num_frames} frames reuse an earlier result "
+              f"({100 * dupes.skipped // max(dupes.num_frames, 1)}%)", file=sys.stderr)
+    return out
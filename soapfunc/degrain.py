@@ -0,0 +1,127 @@
+"""SMDegrain with the motion search shared between calls.
+
+    ref_a = smdegrain(upscale, tr=1, thSAD=64, plane=4)
+    ref_b = smdegrain(upscale, tr=1, thSAD=128, plane=4)   # reuses ref_a's vectors
+
+hvf.SMDegrain builds its super clips and runs MAnalyse on every call, so two passes
+with different thSAD on the same clip do the whole motion search twice. Here the super
+clips and vectors are cached per clip and per search setting (and per delta, so a tr=1
+pass also reuses the first vectors of a tr=2 one); only MDegrain runs per call.
+
+Follows SMDegrain's defaults for the plain case (prefilter=-1, no contrasharp, no
+RefineMotion), including what it does there without being asked: the search clip goes
+through DitherLumaRebuild(s0=1, c=0.0625), the search uses chroma unless the clip is
+GRAY (also for plane=0), HD is wider than 1279 or taller than 719 and gets pel=1,
+16px blocks and no truemotion, the pads are one block, and `limit` is given in 8-bit
+and scaled to the clip. `compare` reports how far
+a result is from hvf.SMDegrain's with the same arguments; run it before swapping a
+script over.
+"""
+__author__ = 'Soap'
+
+import weakref
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import vapoursynth as vs
+
+core = vs.core
+
+
+class MotionCache:
+    """Super clips and motion vectors, kept per source node and search settings for as long
+    as that node is alive."""
+
+    def __init__(self) -> None:
+        self._super: Dict[Tuple, vs.VideoNode] = {}
+        self._prefiltered: Dict[Tuple, vs.VideoNode] = {}
+        self._vectors: Dict[Tuple, vs.VideoNode] = {}
+        self._watched: Set[int] = set()
+
+    def _id(self, clip: vs.VideoNode) -> int:
+        # the entries go when the clip does, so a season of episodes doesn't pile up and
+        # a new clip can't inherit a dead one's id()
+        key = id(clip)
+        if key not in self._watched:
+            weakref.finalize(clip, self._forget, key)
+            self._watched.add(key)
+        return key
+
+    def _forget(self, key: int) -> None:
+        self._watched.discard(key)
+        for entries in (self._super, self._prefiltered, self._vectors):
+            for k in [k for k in entries if k[0] == key]:
+                del entries[k]
+
+    def super(self, clip: vs.VideoNode, pel: int, pad: int, levels: int = 0, chroma: bool = True) -> vs.VideoNode:
+        key = (self._id(clip), pel, pad, levels, chroma)
+        if key not in self._super:
+            self._super[key] = core.mv.Super(clip, hpad=pad, vpad=pad, pel=pel, sharp=2,
+                                             rfilter=4 if levels == 0 else 2, levels=levels, chroma=chroma)
+        return self._super[key]
+
+    def prefiltered(self, clip: vs.VideoNode, chroma: bool) -> vs.VideoNode:
+        """SMDegrain's automatic search prefilter: TV->PC luma expansion."""
+        from havsfunc import DitherLumaRebuild
+        key = (self._id(clip), chroma)
+        if key not in self._prefiltered:
+            self._prefiltered[key] = DitherLumaRebuild(clip, s0=1.0, c=0.0625, chroma=chroma)
+        return self._prefiltered[key]
+
+    def vectors(self, clip: vs.VideoNode, delta: int, backward: bool, search: Dict[str, Any]) -> vs.VideoNode:
+        key = (self._id(clip), delta, backward) + tuple(sorted(search.items()))
+        if key not in self._vectors:
+            pref = self.prefiltered(clip, search['chroma'])
+            sup = self.super(pref, search['pel'], search['blksize'], chroma=search['chroma'])
+            self._vectors[key] = core.mv.Analyse(sup, isb=backward, delta=delta,
+                                                 blksize=search['blksize'], overlap=search['overlap'],
+                                                 search=search['search'], truemotion=search['truemotion'],
+                                                 chroma=search['chroma'])
+        return self._vectors[key]
+
+    def degrain(self, clip: vs.VideoNode, tr: int = 2, thSAD: int = 300, thSADC: Optional[int] = None,
+                plane: int = 4, blksize: Optional[int] = None, overlap: Optional[int] = None,
+                pel: Optional[int] = None, search: int = 4, truemotion: Optional[bool] = None,
+                chroma: Optional[bool] = None, thSCD1: int = 400, thSCD2: int = 130,
+                limit: int = 255, limitc: Optional[int] = None) -> vs.VideoNode:
+        """Same knobs and defaults as hvf.SMDegrain with prefilter=-1."""
+        if not 1 <= tr <= 3:
+            raise ValueError('degrain: tr must be between 1 and 3')
+        hd = clip.width > 1279 or clip.height > 719
+        blksize = blksize or (16 if hd else 8)
+        opts = dict(
+            pel=pel or (1 if hd else 2),
+            blksize=blksize,
+            overlap=blksize // 2 if overlap is None else overlap,
+            search=search,
+            truemotion=not hd if truemotion is None else truemotion,
+            chroma=clip.format.color_family != vs.GRAY if chroma is None else chroma,
+        )
+        thSADC = thSAD // 2 if thSADC is None else thSADC
+        peak = (1 << clip.format.bits_per_sample) - 1 if clip.format.sample_type == vs.INTEGER else 1.0
+        limitc = limit if limitc is None else limitc
+
+        vecs: List[vs.VideoNode] = []
+        for delta in range(1, tr + 1):
+            vecs += [self.vectors(clip, delta, True, opts), self.vectors(clip, delta, False, opts)]
+        render = self.super(clip, opts['pel'], blksize, levels=1, chroma=opts['chroma'])
+        mdegrain = (core.mv.Degrain1, core.mv.Degrain2, core.mv.Degrain3)[tr - 1]
+        return mdegrain(clip, render, *vecs, thsad=thSAD, thsadc=thSADC, plane=plane,
+                        limit=round(limit * peak / 255), limitc=round(limitc * peak / 255), thscd1=thSCD1, thscd2=thSCD2)
+
+
+_shared = MotionCache()
+
+
+def smdegrain(clip: vs.VideoNode, **kwargs: Any) -> vs.VideoNode:
+    """Drop-in for hvf.SMDegrain(clip, tr=..., thSAD=..., plane=...) using a shared MotionCache."""
+    return _shared.degrain(clip, **kwargs)
+
+
+def compare(clip: vs.VideoNode, frames: Sequence[int], **kwargs: Any) -> List[float]:
+    """Largest per-frame difference (in 8-bit steps) between smdegrain and hvf.SMDegrain on `frames`."""
+    import havsfunc as hvf
+    ours = core.std.Splice([smdegrain(clip, **kwargs)[n] for n in frames])
+    theirs = core.std.Splice([hvf.SMDegrain(clip, **kwargs)[n] for n in frames])
+    peak = (1 << clip.format.bits_per_sample) - 1 if clip.format.sample_type == vs.INTEGER else 1.0
+    stats = core.std.PlaneStats(core.std.Expr([ours, theirs], 'x y - abs'))
+    return [f.props['PlaneStatsMax'] * 255 / peak for f in stats.frames()]
@@ -0,0 +1,157 @@
+"""Edit decision lists compiled into a single node.
+
+`source[:2832]+op[2:-24]+source[4990:30596]+...` and lvf.rfs with a couple dozen ranges
+build deep trees of Trim/Splice nodes that every frame request walks through. An EDL
+keeps the edits as a sorted interval index instead: the output is one FrameEval that
+finds the segment with a bisect and hands back a pre-shifted node, and all segments that
+share a clip and an offset (every rfs range, for one) share that node.
+
+    src = EDL.load('12.edl', source=source, op=op, ed=ed).node()
+    final = rfs(grain, src, masked)     # drop-in for lvf.rfs
+
+Sidecar files take one edit per line, with Python slice syntax for splices and rfs-style
+inclusive tuples for replacements:
+
+    source[:2832]
+    op[2:-24]
+    source[4990:30596]
+    ed[:-25]
+    source[32755:]
+    src(6873, 6988)     # frames 6873-6988 of the result come from src instead
+"""
+__author__ = 'Soap'
+
+import re
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import vapoursynth as vs
+
+core = vs.core
+
+_SLICE = re.compile(r'^(\w+)\[\s*(-?\d*)\s*:\s*(-?\d*)\s*\]$')
+_RANGE = re.compile(r'^(\w+)\(\s*(-?\d+)\s*,\s*(-?\d+)\s*\)$')
+
+
+class Segment(NamedTuple):
+    start: int      # output frames [start, end)
+    end: int
+    clip: int       # index into EDL.clips
+    offset: int     # source frame = output frame + offset
+
+
+class EDL:
+    def __init__(self) -> None:
+        self.clips: List[vs.VideoNode] = []
+        self.segments: List[Segment] = []
+
+    @property
+    def num_frames(self) -> int:
+        return self.segments[-1].end if self.segments else 0
+
+    def _index(self, clip: vs.VideoNode) -> int:
+        for i, c in enumerate(self.clips):
+            if c is clip:
+                return i
+        self.clips.append(clip)
+        return len(self.clips) - 1
+
+    def append(self, clip: vs.VideoNode, start: Optional[int] = None, end: Optional[int] = None) -> 'EDL':
+        """Add clip[start:end] at the end, same rules as a Python slice."""
+        first, last, _ = slice(start, end).indices(clip.num_frames)
+        if last > first:
+            pos = self.num_frames
+            self.segments.append(Segment(pos, pos + last - first, self._index(clip), first - pos))
+        return self
+
+    def replace(self, clip: vs.VideoNode, first: int, last: int, src_first: Optional[int] = None) -> 'EDL':
+        """Frames first..last (inclusive, like rfs) come from `clip`, by default the same frame numbers."""
+        if last < first or first >= self.num_frames:
+            return self
+        end = min(last + 1, self.num_frames)
+        src_first = first if src_first is None else src_first
+        new = Segment(first, end, self._index(clip), src_first - first)
+        out = []
+        for seg in self.segments:
+            if seg.end <= first or seg.start >= end:
+                out.append(seg)
+                continue
+            if seg.start < first:
+                out.append(seg._replace(end=first))
+            if seg.end > end:
+                out.append(seg._replace(start=end))
+        out.append(new)
+        self.segments = sorted(out, key=lambda s: s.start)
+        return self
+
+    def node(self) -> vs.VideoNode:
+        """Compile to one node."""
+        if not self.segments:
+            raise ValueError('EDL: nothing to compile')
+        ref = self.clips[self.segments[0].clip]
+        for c in self.clips:
+            if c.format is None or (c.format.id, c.width, c.height) != (ref.format.id, ref.width, ref.height):
+                raise ValueError('EDL: every clip needs the same format and size')
+
+        shifted: Dict[Tuple[int, int], vs.VideoNode] = {}
+        nodes = []
+        for seg in self.segments:
+            key = (seg.clip, seg.offset)
+            if key not in shifted:
+                clip = self.clips[seg.clip]
+                if seg.offset >= 0:
+                    shifted[key] = clip[seg.offset:]
+                else:
+                    shifted[key] = core.std.BlankClip(clip, length=-seg.offset) + clip
+            nodes.append(shifted[key])
+
+        starts = [seg.start for seg in self.segments]
+        base = core.std.BlankClip(ref, length=self.num_frames)
+        return core.std.FrameEval(base, lambda n: nodes[bisect_right(starts, n) - 1])
+
+    @classmethod
+    def splice(cls, *parts: Tuple[vs.VideoNode, Optional[int], Optional[int]]) -> 'EDL':
+        edl = cls()
+        for clip, start, end in parts:
+            edl.append(clip, start, end)
+        return edl
+
+    @classmethod
+    def parse(cls, text: str, **clips: vs.VideoNode) -> 'EDL':
+        edl = cls()
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            m = _SLICE.match(line)
+            if m:
+                name, start, end = m.groups()
+                edl.append(_named(clips, name, lineno), int(start) if start else None, int(end) if end else None)
+                continue
+            m = _RANGE.match(line)
+            if m:
+                name, first, last = m.groups()
+                edl.replace(_named(clips, name, lineno), int(first), int(last))
+                continue
+            raise ValueError(f'EDL: line {lineno}: cannot read "{line}"')
+        return edl
+
+    @classmethod
+    def load(cls, path: str, **clips: vs.VideoNode) -> 'EDL':
+        with open(path, encoding='utf-8') as f:
+            return cls.parse(f.read(), **clips)
+
+
+def _named(clips: Dict[str, vs.VideoNode], name: str, lineno: int) -> vs.VideoNode:
+    if name not in clips:
+        raise ValueError(f'EDL: line {lineno}: no clip called "{name}"')
+    return clips[name]
+
+
+def rfs(clipa: vs.VideoNode, clipb: vs.VideoNode, ranges: Sequence[Union[int, Tuple[int, int]]]) -> vs.VideoNode:
+    """lvf.rfs(clipa, clipb, ranges) as a single node; ranges are inclusive (start, end) tuples or single frames."""
+    edl = EDL().append(clipa)
+    for r in ranges:
+        first, last = (r, r) if isinstance(r, int) else r
+        edl.replace(clipb, first, last)
+    return edl.node()
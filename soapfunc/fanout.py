@@ -0,0 +1,161 @@
+"""Filter once, encode many.
+
+Runs the filter graph a single time and feeds every resolution's encoder from it,
+instead of calling vspipe once per rung and letting ffmpeg's -s shrink full 1080p y4m.
+The encoders run quiet (three -stats lines would overwrite each other); the progress
+line shows, per rung, the frames handed to its encoder and how full its queue is. The
+render goes at the pace of the slowest encoder: its queue fills up and then every
+rung waits, so a rung that sits at the queue size is the one holding things up.
+
+    python -m soapfunc.fanout lain.vpy --arg key="ep01.mkv" \
+        --rung 676x480 "480p/ep01.mkv" --rung 1014x720 "720p/ep01.mkv" --rung 1520x1080 "1080p/ep01.mkv" \
+        -- -c:v libx265 -crf 22 -pix_fmt yuv420p10le -preset slow
+"""
+__author__ = 'Soap'
+
+import argparse
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import vapoursynth as vs
+
+from . import y4m
+from .util import load_script, parse_args
+
+core = vs.core
+
+FFMPEG_IN = ["ffmpeg", "-hide_banner", "-v", "quiet", "-f", "yuv4mpegpipe", "-i", "-"]
+
+
+class Rung(NamedTuple):
+    width: int
+    height: int
+    args: List[str]     # full encoder command line, reads y4m from stdin
+
+
+def shared_source(clip: vs.VideoNode, held: Dict[int, vs.VideoFrame]) -> vs.VideoNode:
+    """A node that serves frames the driver has already rendered, so the rungs' resizers
+    never pull on the filter chain themselves."""
+    blank = core.std.BlankClip(clip)
+    return core.std.ModifyFrame(blank, blank, lambda n, f: held[n])
+
+
+def _writer(proc: subprocess.Popen, clip: vs.VideoNode, q: queue.Queue, errors: list, written: List[int],
+            i: int) -> None:
+    try:
+        proc.stdin.write(y4m.header(clip))
+        while True:
+            frame = q.get()
+            if frame is None:
+                break
+            y4m.write_frame(proc.stdin, frame)
+            written[i] += 1
+    except Exception as e:      # a dead encoder, or a frame that failed to render
+        errors.append(e)
+        # keep draining so the driver never blocks on a dead encoder
+        while q.get() is not None:
+            pass
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+
+def fanout(clip: vs.VideoNode, rungs: Sequence[Rung], kernel: str = 'Spline36',
+           queue_size: int = 24, prefetch: Optional[int] = None, progress: bool = True) -> None:
+    """Render `clip` once and encode it at every rung concurrently.
+
+    Each rung is resized inside the graph with `kernel` and gets its own bounded queue
+    and writer thread. A slower encoder only holds up the render once its queue is full,
+    and from then on sets the pace for all of them.
+    """
+    prefetch = prefetch or max(core.num_threads, 1)
+    held: Dict[int, vs.VideoFrame] = {}
+    shared = shared_source(clip, held)
+    resize = getattr(core.resize, kernel)
+
+    scaled, procs, queues, threads, errors = [], [], [], [], []
+    written = [0] * len(rungs)
+    for i, rung in enumerate(rungs):
+        node = shared if (rung.width, rung.height) == (clip.width, clip.height) \
+            else resize(shared, rung.width, rung.height)
+        proc = subprocess.Popen(rung.args, stdin=subprocess.PIPE)
+        q = queue.Queue(maxsize=queue_size)
+        t = threading.Thread(target=_writer, args=(proc, node, q, errors, written, i), daemon=True)
+        t.start()
+        scaled.append(node)
+        procs.append(proc)
+        queues.append(q)
+        threads.append(t)
+
+    total = clip.num_frames
+    start = time.monotonic()
+    pending = deque(clip.get_frame_async(n) for n in range(min(prefetch, total)))
+    try:
+        for n in range(total):
+            if errors:
+                break           # an encoder is gone, the rest of the render would be wasted
+            held[n] = pending.popleft().result()
+            if n + prefetch < total:
+                pending.append(clip.get_frame_async(n + prefetch))
+            futures = [node.get_frame_async(n) for node in scaled]
+            for q, fut in zip(queues, futures):
+                q.put(fut.result())
+            del held[n]
+            if progress:
+                fps = (n + 1) / max(time.monotonic() - start, 1e-3)
+                encoders = "  ".join(f"{r.height}p {w} [{q.qsize()}/{queue_size}]"
+                                     for r, w, q in zip(rungs, written, queues))
+                print(f"\rVapourSynth: {n + 1}/{total} ~ {100 * (n + 1) // total}% {fps:.2f} fps | {encoders} ", end="")
+    finally:
+        for q in queues:
+            q.put(None)
+        for t in threads:
+            t.join()
+        for proc in procs:
+            proc.wait()
+    if progress:
+        print()
+    if errors:
+        raise RuntimeError(f"fanout: an encoder quit early ({errors[0]})")
+
+
+def ffmpeg_rungs(specs: Sequence[Sequence[str]], encode_args: Sequence[str]) -> List[Rung]:
+    """[('854x480', 'out.mkv'), ...] + shared ffmpeg output args -> rungs"""
+    rungs = []
+    for size, output in specs:
+        w, h = (int(x) for x in size.lower().split('x'))
+        rungs.append(Rung(w, h, FFMPEG_IN + list(encode_args) + [output]))
+    return rungs
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    encode_args: List[str] = []
+    if '--' in argv:
+        encode_args = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+
+    parser = argparse.ArgumentParser(prog='soapfunc.fanout', description=__doc__.splitlines()[0])
+    parser.add_argument('script')
+    parser.add_argument('--arg', '-a', action='append', help='key=value, same as vspipe')
+    parser.add_argument('--rung', nargs=2, action='append', required=True, metavar=('WxH', 'OUTPUT'))
+    parser.add_argument('--kernel', default='Spline36')
+    parser.add_argument('--queue', type=int, default=24,
+                        help='rendered frames waiting per rung; once the slowest encoder has this many queued, '
+                             'the render (and so every rung) waits for it')
+    opts = parser.parse_args(argv)
+
+    # `encoders` lets the script's tune() hold back memory for every rung's encoder
+    clip = load_script(opts.script, dict(parse_args(opts.arg), encoders=len(opts.rung)))
+    fanout(clip, ffmpeg_rungs(opts.rung, encode_args), kernel=opts.kernel, queue_size=opts.queue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""Fonts for .ass subtitles, found by name and cut down to the glyphs the script uses.
+
+The mux recipes used to -attach a hand-picked list of font files, each with a hand-written
+mimetype, and whole multi-MB CJK fonts went into every episode. Here:
+
+- the [V4+ Styles] fonts and the \\fn, \\b, \\i, \\r, \\p override tags of every Dialogue line
+  give, per (family, weight, italic), the characters it has to draw
+- a family -> file index of the font folders (name table: family, full, PostScript and
+  typographic names) lives in ~/.soapfunc/fonts/index.json; a rescan only opens files
+  that are new or changed
+- each font is subset to those characters (fontTools) and the subset is cached by
+  font file and character set, so rerunning an episode, or giving the whole season's
+  scripts at once so every episode shares one subset, reads nothing again
+
+Fonts whose OS/2 embedding flags forbid subsetting are attached whole.
+
+    python -m soapfunc.fonts "Subs/*.ass" --dir . --print cmd
+    -attach "C:\\Users\\...\\.soapfunc\\fonts\\subsets\\5d0c....ttf" -metadata:s:t:0 mimetype=application/x-truetype-font ...
+"""
+__author__ = 'Soap'
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+ROOT = os.path.join(os.path.expanduser('~'), '.soapfunc', 'fonts')
+INDEX = os.path.join(ROOT, 'index.json')
+SUBSETS = os.path.join(ROOT, 'subsets')
+EXTENSIONS = ('.ttf', '.otf', '.ttc', '.otc')
+MIMETYPES = {'.ttf': 'application/x-truetype-font', '.ttc': 'application/x-truetype-font',
+             '.otf': 'application/x-font-opentype', '.otc': 'application/x-font-opentype'}
+
+_index_lock = threading.Lock()
+
+
+def system_dirs() -> List[str]:
+    dirs = [os.path.join(os.environ.get('WINDIR', 'C:/Windows'), 'Fonts'),
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft', 'Windows', 'Fonts'),
+            '/usr/share/fonts', os.path.expanduser('~/.local/share/fonts'), os.path.expanduser('~/Library/Fonts')]
+    return [d for d in dirs if os.path.isdir(d)]
+
+
+# font files
+
+class Face(NamedTuple):
+    path: str
+    index: int              # face number inside a .ttc
+    names: List[str]        # family, full, PostScript and typographic family names
+    weight: int             # OS/2 usWeightClass
+    italic: bool
+    fs_type: int            # OS/2 embedding flags
+
+
+def _tables(data: bytes, offset: int) -> Dict[bytes, Tuple[int, int]]:
+    count, = struct.unpack_from('>H', data, offset + 4)
+    tables = {}
+    for i in range(count):
+        tag, _, start, length = struct.unpack_from('>4sIII', data, offset + 12 + 16 * i)
+        tables[tag] = (start, length)
+    return tables
+
+
+def _names(data: bytes, start: int) -> List[str]:
+    _, count, strings = struct.unpack_from('>HHH', data, start)
+    names = []
+    for i in range(count):
+        platform, encoding, _, name_id, length, offset = struct.unpack_from('>6H', data, start + 6 + 12 * i)
+        if name_id not in (1, 4, 6, 16):
+            continue
+        raw = data[start + strings + offset:start + strings + offset + length]
+        if platform in (0, 3):
+            name = raw.decode('utf-16-be', 'replace')
+        elif platform == 1 and encoding == 0:
+            name = raw.decode('mac_roman', 'replace')
+        else:
+            continue
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def faces_of(path: str) -> List[Face]:
+    """Every face in a .ttf/.otf/.ttc, read from the name and OS/2 tables only."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] == b'ttcf':
+        count, = struct.unpack_from('>I', data, 8)
+        offsets = struct.unpack_from(f'>{count}I', data, 12)
+    else:
+        offsets = (0,)
+    faces = []
+    for i, offset in enumerate(offsets):
+        tables = _tables(data, offset)
+        if b'name' not in tables:
+            continue
+        weight, italic, fs_type = 400, False, 0
+        if b'OS/2' in tables:
+            os2 = tables[b'OS/2'][0]
+            weight, fs_type = struct.unpack_from('>H', data, os2 + 4)[0], struct.unpack_from('>H', data, os2 + 8)[0]
+            selection, = struct.unpack_from('>H', data, os2 + 62)
+            italic = bool(selection & 1)
+        faces.append(Face(os.path.abspath(path), i, _names(data, tables[b'name'][0]), weight, italic, fs_type))
+    return faces
+
+
+def build_index(dirs: Iterable[str], index_path: str = INDEX) -> List[Face]:
+    """Faces of every font under `dirs`; only files new or changed since the last call are opened."""
+    with _index_lock:
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        seen, changed = set(), False
+        for d in dirs:
+            for root, _, files in os.walk(d):
+                for name in files:
+                    if not name.lower().endswith(EXTENSIONS):
+                        continue
+                    path = os.path.abspath(os.path.join(root, name))
+                    st = os.stat(path)
+                    seen.add(path)
+                    hit = index.get(path)
+                    if hit and hit['size'] == st.st_size and hit['mtime'] == st.st_mtime:
+                        continue
+                    try:
+                        faces = [list(face) for face in faces_of(path)]
+                    except (struct.error, OSError) as e:
+                        print(f"fonts: skipping {path}: {e}", file=sys.stderr)
+                        faces = []
+                    index[path] = dict(size=st.st_size, mtime=st.st_mtime, faces=faces)
+                    changed = True
+        # forget files that are gone, keep the ones in folders not scanned this time
+        for path in [p for p in index if p not in seen and not os.path.exists(p)]:
+            del index[path]
+            changed = True
+        if changed:
+            os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+            with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(index_path + '.tmp', index_path)
+    wanted = [os.path.abspath(d) for d in dirs]
+    return [Face(*face) for path, entry in index.items()
+            if any(path.startswith(os.path.join(d, '')) for d in wanted) for face in entry['faces']]
+
+
+# subtitles
+
+class Use(NamedTuple):
+    family: str
+    weight: int
+    italic: bool
+
+
+def _weight(value: str) -> int:
+    v = int(value)
+    return 700 if v in (1, -1) else 400 if v == 0 else v
+
+
+def _fields(line: str, fmt: List[str]) -> Dict[str, str]:
+    return dict(zip(fmt, (v.strip() for v in line.split(':', 1)[1].split(',', len(fmt) - 1))))
+
+
+def used(ass_paths: Iterable[str]) -> Dict[Use, Set[str]]:
+    """Characters drawn with each font, over every Dialogue line of the scripts."""
+    out: Dict[Use, Set[str]] = {}
+    for path in ass_paths:
+        styles: Dict[str, Use] = {}
+        section, fmt = '', []
+        with open(path, encoding='utf-8-sig', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('['):
+                    section, fmt = line.lower(), []
+                elif line.startswith('Format:'):
+                    fmt = [x.strip().lower() for x in line.split(':', 1)[1].split(',')]
+                elif line.startswith('Style:') and fmt:
+                    s = _fields(line, fmt)
+                    styles[s['name']] = Use(s['fontname'].lstrip('@'), _weight(s.get('bold', '0')),
+                                            s.get('italic', '0') not in ('0', ''))
+                elif line.startswith('Dialogue:') and section == '[events]' and fmt:
+                    e = _fields(line, fmt)
+                    base = styles.get(e['style']) or styles.get('Default') or Use('Arial', 400, False)
+                    _scan(e.get('text', ''), base, styles, out)
+    return out
+
+
+def _scan(text: str, base: Use, styles: Dict[str, Use], out: Dict[Use, Set[str]]) -> None:
+    font, drawing = base, False
+    for block, plain in re.findall(r'\{([^}]*)\}|([^{]+)', text):
+        if plain:
+            if not drawing:
+                chars = plain.replace('\\N', '').replace('\\n', '').replace('\\h', '\u00a0')
+                out.setdefault(font, set()).update(chars)
+            continue
+        for tag in block.split('\\')[1:]:
+            tag = tag.strip().rstrip(')')
+            if tag.startswith('fn'):
+                font = font._replace(family=tag[2:].strip().lstrip('@') or base.family)
+            elif tag.startswith('r'):
+                font = styles.get(tag[1:].strip(), base)
+            elif re.fullmatch(r'b\d+', tag):
+                font = font._replace(weight=_weight(tag[1:]))
+            elif re.fullmatch(r'i\d+', tag):
+                font = font._replace(italic=tag[1:] != '0')
+            elif re.fullmatch(r'p\d+', tag):
+                drawing = tag[1:] != '0'
+
+
+# resolving
+
+class Attachment(NamedTuple):
+    path: str
+    mimetype: str
+
+
+def match(use: Use, faces: Sequence[Face]) -> Optional[Face]:
+    """The face a renderer would pick: same name, then closest italic and weight."""
+    name = use.family.lower()
+    found = [f for f in faces if any(n.lower() == name for n in f.names)]
+    if not found:
+        return None
+    return min(found, key=lambda f: ((f.italic != use.italic) * 1000 + abs(f.weight - use.weight), f.path, f.index))
+
+
+def _subset(face: Face, chars: Set[str], root: str) -> str:
+    st = os.stat(face.path)
+    key = hashlib.blake2b(json.dumps([face.path, face.index, st.st_size, st.st_mtime, sorted(chars)]).encode(),
+                          digest_size=12).hexdigest()
+    for ext in ('.ttf', '.otf'):
+        if os.path.exists(os.path.join(root, key + ext)):
+            return os.path.join(root, key + ext)
+
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    logging.getLogger('fontTools.subset').setLevel(logging.ERROR)   # "FFTM NOT subset" and the like
+    options = subset.Options()
+    options.name_IDs = ['*']           # the renderer looks the font up by these
+    options.name_languages = ['*']     # CJK families are often only named in their own language
+    options.name_legacy = True
+    options.layout_features = ['*']    # vert/vrt2 for @fonts, ligatures, kerning
+    options.notdef_outline = True
+    font = TTFont(face.path, fontNumber=face.index)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes={ord(c) for c in chars} | {0x20})
+    subsetter.subset(font)
+    path = os.path.join(root, key + ('.otf' if 'CFF ' in font or 'CFF2' in font else '.ttf'))
+    os.makedirs(root, exist_ok=True)
+    font.save(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def resolve(ass_paths: Sequence[str], dirs: Sequence[str] = (), subset: bool = True, index_path: str = INDEX,
+            subsets: str = SUBSETS) -> List[Attachment]:
+    """Fonts to attach for these scripts; missing fonts are reported on stderr.
+
+    `dirs` are searched before the system font folders, so a release's own fonts win.
+    """
+    local = [os.path.abspath(d) for d in dirs]
+    faces = build_index(local, index_path)
+    system = build_index(system_dirs(), index_path)
+    per_face: Dict[Tuple[str, int], Tuple[Face, Set[str]]] = {}
+    for use, chars in sorted(used(ass_paths).items()):
+        face = match(use, faces) or match(use, system)
+        if face is None:
+            print(f"fonts: no font named {use.family!r} (used for {len(chars)} characters)", file=sys.stderr)
+            continue
+        per_face.setdefault((face.path, face.index), (face, set()))[1].update(chars)
+
+    out = []
+    for face, chars in per_face.values():
+        # OS/2 fsType bit 8: the font may only be embedded whole
+        path = _subset(face, chars, subsets) if subset and not face.fs_type & 0x0100 else face.path
+        out.append(Attachment(path, MIMETYPES[os.path.splitext(path)[1].lower()]))
+    return out
+
+
+def ffmpeg_args(attachments: Sequence[Attachment], first: int = 0) -> List[str]:
+    """-attach/-metadata arguments; `first` is the number of attachment streams already mapped."""
+    args: List[str] = []
+    for a in attachments:
+        args += ["-attach", a.path]
+    for i, a in enumerate(attachments):
+        args += [f"-metadata:s:t:{first + i}", f"mimetype={a.mimetype}"]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.fonts', description=__doc__.splitlines()[0])
+    parser.add_argument('subs', nargs='+', help='.ass files, wildcards are expanded; all of them share the subsets')
+    parser.add_argument('--dir', action='append', default=[], help='font folder searched before the system fonts')
+    parser.add_argument('--no-subset', action='store_true', help='attach the whole font files')
+    parser.add_argument('--first', type=int, default=0, help='attachment streams already in the output')
+    parser.add_argument('--print', dest='fmt', default='list', choices=['list', 'cmd', 'ps'],
+                        help='list: one font per line; cmd: ffmpeg arguments on one line for a .bat; '
+                             'ps: one ffmpeg argument per line, for a PowerShell array')
+    opts = parser.parse_args(argv)
+
+    subs = [p for pattern in opts.subs for p in ([pattern] if os.path.exists(pattern) else sorted(glob.glob(pattern)))]
+    attachments = resolve(subs, opts.dir, subset=not opts.no_subset)
+    if opts.fmt == 'list':
+        print('\n'.join(a.path for a in attachments))
+    elif opts.fmt == 'cmd':
+        args = ffmpeg_args(attachments, opts.first)
+        print(' '.join(f'"{a}"' if prev == '-attach' else a for prev, a in zip([''] + args, args)))
+    else:
+        print('\n'.join(ffmpeg_args(attachments, opts.first)))
+
+
+if __name__ == '__main__':
+    main()
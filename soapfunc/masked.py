@@ -0,0 +1,97 @@
+"""MaskedMerge that only renders the branch the mask actually uses.
+
+    denoise = gated_merge(den_a, den_b, adaptive_mask)
+    dehalo1 = gated_merge(aa, dehalo, halo_mask)
+
+The mask is read first (PlaneStats min/max); when it's all 0 only `clipa` is requested,
+when it's all peak only `clipb`, and only mixed frames pay for both branches and the merge.
+The output is identical to core.std.MaskedMerge.
+"""
+__author__ = 'Soap'
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import vapoursynth as vs
+
+core = vs.core
+
+
+def _peak(clip: vs.VideoNode) -> float:
+    fmt = clip.format
+    return 1.0 if fmt.sample_type == vs.FLOAT else (1 << fmt.bits_per_sample) - 1
+
+
+def _mask_stats(mask: vs.VideoNode, planes: Sequence[int]) -> vs.VideoNode:
+    """PlaneStats of every mask plane that's used, folded into MaskMin/MaskMax props."""
+    stats = [core.std.PlaneStats(mask, plane=p, prop=f'P{p}') for p in planes]
+
+    def _fold(n: int, f: List[vs.VideoFrame]) -> vs.VideoFrame:
+        fout = f[0].copy()
+        fout.props['MaskMin'] = min(x.props[f'P{p}Min'] for x, p in zip(f, planes))
+        fout.props['MaskMax'] = max(x.props[f'P{p}Max'] for x, p in zip(f, planes))
+        return fout
+
+    return core.std.ModifyFrame(stats[0], stats, _fold)
+
+
+def gated_merge(clipa: vs.VideoNode, clipb: vs.VideoNode, mask: vs.VideoNode,
+                planes: Optional[Sequence[int]] = None, first_plane: bool = False,
+                stats: Optional[Dict[str, int]] = None) -> vs.VideoNode:
+    """Drop-in for core.std.MaskedMerge(clipa, clipb, mask, planes, first_plane).
+
+    Pass a dict as `stats` to count how many frames took the a-only, b-only and merge paths.
+    """
+    planes = list(range(clipa.format.num_planes)) if planes is None else list(planes)
+    merged = core.std.MaskedMerge(clipa, clipb, mask, planes=planes, first_plane=first_plane)
+    if set(planes) != set(range(clipa.format.num_planes)):
+        # untouched planes come from clipa, so it's needed every frame anyway
+        return merged
+
+    mask_planes = [0] if first_plane or mask.format.num_planes == 1 else planes
+    peak = _peak(mask)
+    if stats is not None:
+        stats.update(a=0, b=0, merge=0)
+
+    def _select(n: int, f: vs.VideoFrame) -> vs.VideoNode:
+        lo, hi = f.props['MaskMin'], f.props['MaskMax']
+        path, node = ('a', clipa) if hi <= 0 else ('b', clipb) if lo >= peak else ('merge', merged)
+        if stats is not None:
+            stats[path] += 1
+        return node
+
+    return core.std.FrameEval(merged, _select, prop_src=_mask_stats(mask, mask_planes))
+
+
+def _tile_edges(size: int, count: int, align: int) -> List[int]:
+    step = max(size // count // align * align, align)
+    edges = list(range(0, size, step))[:count] + [size]
+    return edges
+
+
+def gated_merge_tiles(clip: vs.VideoNode, branch_a: Callable[[vs.VideoNode], vs.VideoNode],
+                      branch_b: Callable[[vs.VideoNode], vs.VideoNode], mask: vs.VideoNode,
+                      tiles: Tuple[int, int] = (4, 4), pad: int = 32, align: int = 16) -> vs.VideoNode:
+    """Tile version: the branches are built per tile (on the tile plus `pad` pixels of context),
+    so a tile whose mask is flat never runs the other branch at all.
+
+    Filters only see `pad` pixels past the tile edge and anything sized off the clip
+    (SMDegrain's hd switch, for one) sees the tile, so pass explicit params and a pad
+    at least as large as the filters' spatial reach.
+    """
+    xs = _tile_edges(clip.width, tiles[0], align)
+    ys = _tile_edges(clip.height, tiles[1], align)
+    rows = []
+    for y0, y1 in zip(ys, ys[1:]):
+        row = []
+        for x0, x1 in zip(xs, xs[1:]):
+            px0, py0 = max(x0 - pad, 0), max(y0 - pad, 0)
+            px1, py1 = min(x1 + pad, clip.width), min(y1 + pad, clip.height)
+            region = clip.std.Crop(left=px0, right=clip.width - px1, top=py0, bottom=clip.height - py1)
+
+            def _inner(node: vs.VideoNode) -> vs.VideoNode:
+                return node.std.Crop(left=x0 - px0, right=px1 - x1, top=y0 - py0, bottom=py1 - y1)
+
+            tile_mask = mask.std.Crop(left=x0, right=mask.width - x1, top=y0, bottom=mask.height - y1)
+            row.append(gated_merge(_inner(branch_a(region)), _inner(branch_b(region)), tile_mask))
+        rows.append(core.std.StackHorizontal(row))
+    return core.std.StackVertical(rows)
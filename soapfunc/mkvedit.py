@@ -0,0 +1,380 @@
+"""Edit Matroska titles and track metadata in place, like mkvpropedit.
+
+Changing a language, a track name, a default flag, the title or the track order only
+touches the Info and Tracks elements at the start of the file. Those are re-encoded and
+written back over themselves, using the Void padding that follows them; only when the
+new element is bigger than that room is it moved to the end of the segment (old spot
+turned into Void, SeekHead pointed at the new place). Either way it is kilobytes of I/O,
+where a mkvmerge remux rewrites the whole episode.
+
+    python -m soapfunc.mkvedit *.mkv --language 1:jpn --track-name 1:Japanese --default-track 1:yes \\
+        --title "[AniDL] Kanojo, Okarishimasu [BD 1080p 10bit][Soap]" --track-order 0:0,0:1,0:2,0:3
+
+Track ids are the mkvmerge ones for a Matroska input: 0-based, in the file's track order.
+
+`--sub-charset ID:UTF-8` is accepted so old mkvmerge lines carry over, and does nothing:
+text subtitles in Matroska are UTF-8 already (mkvmerge converted them when it first
+muxed them), which is all that option meant for a Matroska input. Any other charset
+means re-encoding the subtitles, which needs a remux, and is refused.
+"""
+__author__ = 'Soap'
+
+import argparse
+import glob
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEKHEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEKID = 0x53AB
+SEEKPOSITION = 0x53AC
+INFO = 0x1549A966
+TITLE = 0x7BA9
+TRACKS = 0x1654AE6B
+TRACKENTRY = 0xAE
+FLAGDEFAULT = 0x88
+FLAGFORCED = 0x55AA
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+CLUSTER = 0x1F43B675
+VOID = 0xEC
+CRC32 = 0xBF
+
+_MASTERS = {SEEKHEAD, SEEK, INFO, TRACKS, TRACKENTRY}
+# mkvmerge writes both; the BCP47 one wins in players that know it
+_BCP47 = {'jpn': 'ja', 'eng': 'en', 'und': 'und', 'ger': 'de', 'deu': 'de', 'fre': 'fr', 'fra': 'fr',
+          'spa': 'es', 'ita': 'it', 'por': 'pt', 'rus': 'ru', 'chi': 'zh', 'zho': 'zh', 'kor': 'ko', 'tur': 'tr'}
+
+Node = List[Any]    # [id, bytes] for leaves, [id, [children...]] for masters
+
+
+class Located(NamedTuple):
+    id: int
+    start: int          # file offset of the ID
+    data_start: int
+    size: int           # data size, None when unknown
+
+    @property
+    def end(self) -> int:
+        return self.data_start + self.size
+
+
+# encoding
+
+def enc_id(id_: int) -> bytes:
+    return id_.to_bytes((id_.bit_length() + 7) // 8, 'big')
+
+
+def enc_size(n: int, length: Optional[int] = None) -> bytes:
+    if length is None:
+        length = 1
+        while n >= 2**(7 * length) - 1:
+            length += 1
+    if n >= 2**(7 * length) - 1:
+        raise ValueError(f'{n} does not fit a {length} byte size')
+    return (n | (1 << (7 * length))).to_bytes(length, 'big')
+
+
+def enc_uint(v: int, width: Optional[int] = None) -> bytes:
+    width = width or max(1, (v.bit_length() + 7) // 8)
+    return v.to_bytes(width, 'big')
+
+
+def void(total: int) -> bytes:
+    """A Void element exactly `total` (>= 2) bytes long."""
+    for length in range(1, 9):
+        data = total - 1 - length
+        if 0 <= data < 2**(7 * length) - 1:
+            return bytes([VOID]) + enc_size(data, length) + bytes(data)
+    raise ValueError(f'no Void of {total} bytes')
+
+
+def serialize(node: Node) -> bytes:
+    id_, payload = node
+    return enc_id(id_) + enc_size(len(payload_bytes(node))) + payload_bytes(node)
+
+
+def payload_bytes(node: Node) -> bytes:
+    id_, payload = node
+    if isinstance(payload, bytes):
+        return payload
+    body = b''.join(serialize(c) for c in payload if c[0] != CRC32)
+    if payload and payload[0][0] == CRC32:
+        crc = struct.pack('<I', zlib.crc32(body) & 0xffffffff)
+        body = serialize([CRC32, crc]) + body
+    return body
+
+
+def fit(node: Node, room: int) -> Optional[bytes]:
+    """`node` encoded into exactly `room` bytes (size field widened or Void after), or None."""
+    data = payload_bytes(node)
+    for length in range(1, 9):
+        if len(data) >= 2**(7 * length) - 1:
+            continue
+        el = enc_id(node[0]) + enc_size(len(data), length) + data
+        gap = room - len(el)
+        if gap == 0:
+            return el
+        if gap >= 2:
+            return el + void(gap)
+    return None
+
+
+# decoding
+
+def _vint(buf: bytes, pos: int, marker: bool) -> Tuple[int, int]:
+    first = buf[pos]
+    length = 8 - first.bit_length() + 1
+    if first == 0 or length > 8:
+        raise ValueError(f'bad EBML vint at {pos}')
+    value = int.from_bytes(buf[pos:pos + length], 'big')
+    if not marker:
+        value &= (1 << (7 * length)) - 1
+    return value, pos + length
+
+
+def parse(buf: bytes, masters=_MASTERS) -> List[Node]:
+    nodes, pos = [], 0
+    while pos < len(buf):
+        id_, pos = _vint(buf, pos, True)
+        size, pos = _vint(buf, pos, False)
+        data = buf[pos:pos + size]
+        nodes.append([id_, parse(data, masters) if id_ in masters else bytes(data)])
+        pos += size
+    return nodes
+
+
+def _read_header(f: BinaryIO, pos: int) -> Located:
+    f.seek(pos)
+    head = f.read(12)
+    id_, p = _vint(head, 0, True)
+    size_len = 8 - head[p].bit_length() + 1
+    size, p = _vint(head, p, False)
+    unknown = size == (1 << (7 * size_len)) - 1
+    return Located(id_, pos, pos + p, None if unknown else size)
+
+
+def layout(f: BinaryIO) -> Tuple[Located, List[Located]]:
+    """The Segment and its children up to the first Cluster."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    ebml = _read_header(f, 0)
+    if ebml.id != EBML:
+        raise ValueError('not a Matroska file')
+    seg = _read_header(f, ebml.end)
+    if seg.id != SEGMENT:
+        raise ValueError('no Segment after the EBML header')
+    children, pos = [], seg.data_start
+    while pos < file_size:
+        el = _read_header(f, pos)
+        if el.id == CLUSTER or el.size is None:
+            break
+        children.append(el)
+        pos = el.end
+    return seg, children
+
+
+def _child(children: List[Node], id_: int) -> Optional[Node]:
+    return next((c for c in children if c[0] == id_), None)
+
+
+def _set(children: List[Node], id_: int, payload: Optional[bytes]) -> None:
+    """Replace (or add, or with None remove) a leaf."""
+    for i, c in enumerate(children):
+        if c[0] == id_:
+            if payload is None:
+                del children[i]
+            else:
+                c[1] = payload
+            return
+    if payload is not None:
+        children.append([id_, payload])
+
+
+# editing
+
+class TrackEdit(NamedTuple):
+    name: Optional[str] = None          # "" removes the name
+    language: Optional[str] = None
+    default: Optional[bool] = None
+    forced: Optional[bool] = None
+
+
+def _edit_track(entry: Node, edit: TrackEdit) -> None:
+    kids = entry[1]
+    if edit.name is not None:
+        _set(kids, NAME, edit.name.encode('utf-8') or None)
+    if edit.language is not None:
+        _set(kids, LANGUAGE, edit.language.encode('ascii'))
+        if _child(kids, LANGUAGE_BCP47):
+            _set(kids, LANGUAGE_BCP47, _BCP47.get(edit.language, edit.language).encode('ascii'))
+    if edit.default is not None:
+        _set(kids, FLAGDEFAULT, enc_uint(int(edit.default)))
+    if edit.forced is not None:
+        _set(kids, FLAGFORCED, enc_uint(int(edit.forced)))
+
+
+def _room(f: BinaryIO, el: Located) -> int:
+    """Bytes `el` may use: itself plus the Voids right after it."""
+    f.seek(0, 2)
+    file_size, end = f.tell(), el.end
+    while end + 2 <= file_size:
+        nxt = _read_header(f, end)
+        if nxt.id != VOID or nxt.size is None:
+            break
+        end = nxt.end
+    return end - el.start
+
+
+def _seeks(f: BinaryIO, children: List[Located]):
+    """(SeekHead element, its parsed node, Seek node) for every entry of the SeekHeads before the first Cluster."""
+    for el in children:
+        if el.id == SEEKHEAD:
+            f.seek(el.data_start)
+            head = [SEEKHEAD, parse(f.read(el.size))]
+            for seek in head[1]:
+                if seek[0] == SEEK and _child(seek[1], SEEKID) and _child(seek[1], SEEKPOSITION):
+                    yield el, head, seek
+
+
+def _find(f: BinaryIO, seg: Located, children: List[Located], id_: int) -> Located:
+    for el in children:
+        if el.id == id_:
+            return el
+    # moved behind the Clusters by an earlier edit (or written there by the muxer)
+    for _, _, seek in _seeks(f, children):
+        if _child(seek[1], SEEKID)[1] == enc_id(id_):
+            return _read_header(f, seg.data_start + int.from_bytes(_child(seek[1], SEEKPOSITION)[1], 'big'))
+    raise ValueError(f'no {id_:X} element')
+
+
+def edit(path: str, title: Optional[str] = None, tracks: Optional[Dict[int, TrackEdit]] = None,
+         order: Optional[Sequence[int]] = None) -> str:
+    """Apply the edits to `path` in place; returns 'in place' or which elements had to move."""
+    tracks = tracks or {}
+    moved = []
+    with open(path, 'r+b') as f:
+        seg, children = layout(f)
+        found: Dict[int, Located] = {}
+
+        def load(id_: int) -> Node:
+            el = found[id_] = _find(f, seg, children, id_)
+            f.seek(el.data_start)
+            return [id_, parse(f.read(el.size))]
+
+        updates: Dict[int, Node] = {}
+        if title is not None:
+            info = load(INFO)
+            _set(info[1], TITLE, title.encode('utf-8') or None)
+            updates[INFO] = info
+        if tracks or order:
+            trk = load(TRACKS)
+            entries = [c for c in trk[1] if c[0] == TRACKENTRY]
+            for tid, e in tracks.items():
+                if tid >= len(entries):
+                    raise ValueError(f'{path}: no track {tid}')
+                _edit_track(entries[tid], e)
+            if order:
+                if sorted(order) != list(range(len(entries))):
+                    raise ValueError(f'{path}: track order must name every track once')
+                others = [c for c in trk[1] if c[0] != TRACKENTRY]
+                trk[1] = others + [entries[i] for i in order]
+            updates[TRACKS] = trk
+
+        seg_end = seg.end if seg.size is not None else None
+        for id_, node in updates.items():
+            el = found[id_]
+            room = _room(f, el)
+            data = fit(node, room)
+            if data is not None:
+                f.seek(el.start)
+                f.write(data)
+                continue
+            # doesn't fit: append to the segment, repoint the SeekHead, blank the old spot
+            f.seek(0, 2)
+            new_pos = f.tell()
+            if seg_end is not None and seg_end != new_pos:
+                raise ValueError(f'{path}: data after the Segment, cannot append')
+            data = serialize(node)
+            f.write(data)
+            if seg_end is not None:
+                seg_end += len(data)
+                size_len = seg.data_start - seg.start - len(enc_id(SEGMENT))
+                f.seek(seg.start + len(enc_id(SEGMENT)))
+                f.write(enc_size(seg_end - seg.data_start, size_len))
+            _repoint(f, children, id_, new_pos - seg.data_start)
+            f.seek(el.start)
+            f.write(void(room))
+            moved.append('Info' if id_ == INFO else 'Tracks')
+    return 'in place' if not moved else 'moved ' + ', '.join(moved)
+
+
+def _repoint(f: BinaryIO, children: List[Located], id_: int, position: int) -> None:
+    for el, head, seek in _seeks(f, children):
+        if _child(seek[1], SEEKID)[1] != enc_id(id_):
+            continue
+        pos = _child(seek[1], SEEKPOSITION)
+        width = len(pos[1]) if position < 256 ** len(pos[1]) else None
+        pos[1] = enc_uint(position, width)
+        data = fit(head, _room(f, el))
+        if data is None:
+            raise ValueError('no room left to update the SeekHead')
+        f.seek(el.start)
+        f.write(data)
+        return
+    raise ValueError('the SeekHead has no entry for the moved element')
+
+
+def edit_all(paths: Sequence[str], jobs: int = 4, **edits) -> Dict[str, str]:
+    """edit() over many files at once."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(edit, p, **edits): p for p in paths}
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+            print(f"{futures[fut]}: {results[futures[fut]]}")
+    return results
+
+
+def _track_options(opts: argparse.Namespace) -> Dict[int, TrackEdit]:
+    tracks: Dict[int, Dict[str, Union[str, bool]]] = {}
+    for field, values in (('name', opts.track_name), ('language', opts.language),
+                          ('default', opts.default_track), ('forced', opts.forced_track)):
+        for v in values or []:
+            tid, _, value = v.partition(':')
+            if field in ('default', 'forced'):
+                value = value.lower() in ('', '1', 'yes', 'true')
+            tracks.setdefault(int(tid), {})[field] = value
+    return {tid: TrackEdit(**kw) for tid, kw in tracks.items()}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.mkvedit', description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help='Matroska files, wildcards are expanded')
+    parser.add_argument('--title')
+    parser.add_argument('--track-name', action='append', metavar='ID:NAME')
+    parser.add_argument('--language', action='append', metavar='ID:LANG')
+    parser.add_argument('--default-track', action='append', metavar='ID:yes|no')
+    parser.add_argument('--forced-track', action='append', metavar='ID:yes|no')
+    parser.add_argument('--track-order', help='0,1,2 or the mkvmerge form 0:0,0:1,0:2')
+    parser.add_argument('--sub-charset', action='append', metavar='ID:UTF-8', help='only UTF-8, a no-op (see above)')
+    parser.add_argument('--jobs', type=int, default=4)
+    opts = parser.parse_args(argv)
+    for v in opts.sub_charset or []:
+        if v.partition(':')[2].replace('-', '').lower() != 'utf8':
+            parser.error(f'--sub-charset {v}: subtitles in another charset need a mkvmerge remux')
+
+    # cmd.exe leaves *.mkv alone; names like "[AniDL] ..." are taken as they are
+    paths = [p for pattern in opts.files for p in ([pattern] if os.path.exists(pattern) else sorted(glob.glob(pattern)))]
+    order = [int(t.rpartition(':')[2]) for t in opts.track_order.split(',')] if opts.track_order else None
+    edit_all(paths, opts.jobs, title=opts.title, tracks=_track_options(opts), order=order)
+
+
+if __name__ == '__main__':
+    main()
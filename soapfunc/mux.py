@@ -0,0 +1,146 @@
+"""One-pass muxing: final track layout, names and languages in a single mkvmerge run.
+
+The old recipes mux with ffmpeg into "a<name>" and then let mkvmerge rewrite the whole
+file as "b<name>", so every multi-GB output is written twice, one episode after another.
+A Job lists the tracks of the final file in order (from any number of inputs) and is
+turned into one mkvmerge command line; jobs run side by side, limited per disk.
+
+    jobs = [mux.Job("b" + f,
+                    mux.tracks_of(f, 'video', name="")
+                    + [mux.Track(f"{n}.Jap.aac", name="Japanese", language="jpn")]
+                    + mux.tracks_of("../" + f, 'subtitles'),
+                    title="[AniDL] Taisou Zamurai [BD 480p 10bit][Soap]", keep_from=["../" + f])
+            for n, f in enumerate(files)]
+    mux.run_all(jobs, per_disk=2)
+"""
+__author__ = 'Soap'
+
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+MKVMERGE = shutil.which("mkvmerge") or "C:/Program Files/MKVToolNix/mkvmerge.exe"
+
+_SELECT = {'video': ('-d', '--no-video'), 'audio': ('-a', '--no-audio'), 'subtitles': ('-s', '--no-subtitles')}
+_identified: Dict[str, List[dict]] = {}
+_identify_lock = threading.Lock()
+
+
+class Track(NamedTuple):
+    path: str
+    id: int = 0                     # mkvmerge track id in that file (0 for .aac/.opus/.ass)
+    name: Optional[str] = None      # "" clears the name
+    language: Optional[str] = None
+    default: Optional[bool] = None
+
+
+class Job(NamedTuple):
+    output: str
+    tracks: Sequence[Track]                 # in the final order
+    title: Optional[str] = None
+    keep_from: Sequence[str] = ()           # inputs whose attachments and chapters are kept
+
+
+def identify(path: str) -> List[dict]:
+    """mkvmerge -J tracks of a file (id, type, codec, properties), cached per path."""
+    with _identify_lock:
+        if path in _identified:
+            return _identified[path]
+    out = subprocess.run([MKVMERGE, "-J", path], check=True, stdout=subprocess.PIPE).stdout
+    tracks = json.loads(out.decode('utf-8'))['tracks']
+    with _identify_lock:
+        _identified[path] = tracks
+    return tracks
+
+
+def tracks_of(path: str, kind: str, **options) -> List[Track]:
+    """Every track of one type ('video', 'audio', 'subtitles') in `path`, with the same options."""
+    return [Track(path, t['id'], **options) for t in identify(path) if t['type'] == kind]
+
+
+def command(job: Job, output: Optional[str] = None) -> List[str]:
+    """The mkvmerge command line for a job."""
+    files: List[str] = []
+    for t in job.tracks:
+        if t.path not in files:
+            files.append(t.path)
+
+    args = [MKVMERGE, "-o", output or job.output]
+    if job.title is not None:
+        args += ["--title", job.title]
+    for path in files:
+        mine = [t for t in job.tracks if t.path == path]
+        types = {t['id']: t['type'] for t in identify(path)}
+        args.append("--no-global-tags")
+        for kind, (select, none) in _SELECT.items():
+            ids = [str(t.id) for t in mine if types.get(t.id) == kind]
+            args += [select, ",".join(ids)] if ids else [none]
+        if path not in job.keep_from:
+            args += ["--no-attachments", "--no-chapters"]
+        for t in mine:
+            if t.name is not None:
+                args += ["--track-name", f"{t.id}:{t.name}"]
+            if t.language is not None:
+                args += ["--language", f"{t.id}:{t.language}"]
+            if t.default is not None:
+                args += ["--default-track", f"{t.id}:{'yes' if t.default else 'no'}"]
+        args.append(path)
+    for path in job.keep_from:
+        if path not in files:
+            args += ["--no-global-tags", "--no-video", "--no-audio", "--no-subtitles", path]
+    args += ["--track-order", ",".join(f"{files.index(t.path)}:{t.id}" for t in job.tracks)]
+    return args
+
+
+def run(job: Job) -> str:
+    """Mux one job into a temp name and move it into place; mkvmerge warnings (exit 1) are fine."""
+    stem, ext = os.path.splitext(job.output)
+    tmp = f"{stem}.part{ext}"
+    result = subprocess.run(command(job, tmp))
+    if result.returncode > 1:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise RuntimeError(f"{job.output}: mkvmerge exited with {result.returncode}")
+    os.replace(tmp, job.output)
+    return job.output
+
+
+def _device(path: str) -> int:
+    return os.stat(os.path.dirname(os.path.abspath(path)) or '.').st_dev
+
+
+def run_all(jobs: Sequence[Job], per_disk: int = 2) -> List[str]:
+    """Run the jobs concurrently, at most `per_disk` at a time reading or writing any one disk.
+
+    Muxing is pure I/O, so the limit is the disks, not the CPU count: two spinning
+    disks can take two jobs each even on a 4-core box, one SSD may take more.
+    """
+    disks: Dict[int, threading.Semaphore] = {}
+    needs = []
+    for job in jobs:
+        devs = sorted({_device(p) for p in [job.output] + [t.path for t in job.tracks] + list(job.keep_from)})
+        for d in devs:
+            disks.setdefault(d, threading.Semaphore(per_disk))
+        needs.append(devs)
+
+    def limited(job: Job, devs: List[int]) -> str:
+        # fixed order, so two jobs never wait on each other's disks
+        for d in devs:
+            disks[d].acquire()
+        try:
+            return run(job)
+        finally:
+            for d in reversed(devs):
+                disks[d].release()
+
+    done = []
+    with ThreadPoolExecutor(max_workers=max(1, len(disks) * per_disk)) as pool:
+        futures = [pool.submit(limited, job, devs) for job, devs in zip(jobs, needs)]
+        for fut in as_completed(futures):
+            done.append(fut.result())
+            print(f"Muxed: {done[-1]} ({len(done)}/{len(jobs)})")
+    return done
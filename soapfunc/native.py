@@ -0,0 +1,162 @@
+"""Find the native resolution and kernel to descale with.
+
+Sweeps candidate heights and kernels over a sample of frames: descale, scale back up
+with the same kernel, and measure the error against the source. Every candidate/frame
+pair is requested asynchronously so the core works through them in parallel, and the
+resulting error curves are ranked by how deep their dips are compared to neighbouring
+heights (plain error always favours heights close to the source).
+
+    python -m soapfunc.native "S01E14.mkv" --min 700 --max 1000 --frames 12 --csv errors.csv
+"""
+__author__ = 'Soap'
+
+import argparse
+import csv
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import source
+
+core = vs.core
+
+
+class Kernel(NamedTuple):
+    name: str
+    descale: str            # descale plugin function
+    resize: str             # core.resize function
+    params: Dict[str, float]
+
+    def down(self, clip: vs.VideoNode, w: int, h: int) -> vs.VideoNode:
+        return getattr(core.descale, self.descale)(clip, w, h, **self.params)
+
+    def up(self, clip: vs.VideoNode, w: int, h: int) -> vs.VideoNode:
+        p = self.params
+        if 'b' in p:
+            return getattr(core.resize, self.resize)(clip, w, h, filter_param_a=p['b'], filter_param_b=p['c'])
+        if 'taps' in p:
+            return getattr(core.resize, self.resize)(clip, w, h, filter_param_a=p['taps'])
+        return getattr(core.resize, self.resize)(clip, w, h)
+
+
+KERNELS = [
+    Kernel('Bicubic b=1/3 c=1/3', 'Debicubic', 'Bicubic', dict(b=1/3, c=1/3)),
+    Kernel('Bicubic b=0.26 c=0.37', 'Debicubic', 'Bicubic', dict(b=0.26, c=0.37)),
+    Kernel('Bicubic b=0 c=0.5', 'Debicubic', 'Bicubic', dict(b=0, c=0.5)),
+    Kernel('Bicubic b=0 c=0', 'Debicubic', 'Bicubic', dict(b=0, c=0)),
+    Kernel('Bicubic b=-0.5 c=0.25', 'Debicubic', 'Bicubic', dict(b=-0.5, c=0.25)),
+    Kernel('Bilinear', 'Debilinear', 'Bilinear', {}),
+    Kernel('Lanczos taps=3', 'Delanczos', 'Lanczos', dict(taps=3)),
+    Kernel('Spline36', 'Despline36', 'Spline36', {}),
+]
+
+
+class Candidate(NamedTuple):
+    kernel: str
+    height: int
+    width: int
+    error: float            # mean over the sample frames
+    dip: float              # error / local baseline, lower is a sharper dip
+
+
+class NativeResult(NamedTuple):
+    ranked: List[Candidate]
+    kernels: List[str]
+    heights: np.ndarray
+    frames: List[int]
+    errors: np.ndarray      # [kernel, height, frame]
+
+    def write_csv(self, path: str) -> None:
+        """Per-frame error data, one row per kernel/height."""
+        with open(path, 'w', newline='') as f:
+            out = csv.writer(f)
+            out.writerow(['kernel', 'height'] + [f'frame {n}' for n in self.frames])
+            for k, name in enumerate(self.kernels):
+                for i, h in enumerate(self.heights):
+                    out.writerow([name, int(h)] + [f'{e:.8f}' for e in self.errors[k, i]])
+
+
+def _width(clip: vs.VideoNode, height: int) -> int:
+    w = round(height * clip.width / clip.height)
+    return w + (w & 1)
+
+
+def sample_frames(clip: vs.VideoNode, count: int) -> List[int]:
+    """Evenly spread frames, staying clear of the first/last 5% (logos, black, credits)."""
+    lo, hi = clip.num_frames // 20, clip.num_frames - clip.num_frames // 20
+    return [int(x) for x in np.linspace(lo, hi - 1, count)]
+
+
+def dip_scores(errors: np.ndarray, window: int = 8) -> np.ndarray:
+    """error / median of the surrounding heights, along the last axis."""
+    padded = np.pad(errors, [(0, 0)] * (errors.ndim - 1) + [(window, window)], mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * window + 1, axis=-1)
+    baseline = np.median(windows, axis=-1)
+    return errors / np.maximum(baseline, 1e-12)
+
+
+def find_native(clip: vs.VideoNode, heights: Sequence[int], kernels: Sequence[Kernel] = KERNELS,
+                frames: Optional[Sequence[int]] = None, count: int = 12, in_flight: Optional[int] = None,
+                top: int = 10, progress: bool = True) -> NativeResult:
+    frames = list(frames) if frames is not None else sample_frames(clip, count)
+    luma = core.std.Splice([clip[n] for n in frames]).resize.Point(format=vs.GRAYS)
+    heights = np.asarray(sorted(h for h in heights if h < clip.height))
+    errors = np.zeros((len(kernels), len(heights), len(frames)))
+
+    jobs = []
+    for k, kernel in enumerate(kernels):
+        for i, h in enumerate(heights):
+            w = _width(clip, int(h))
+            up = kernel.up(kernel.down(luma, w, int(h)), clip.width, clip.height)
+            diff = core.std.PlaneStats(core.std.Expr([luma, up], 'x y - abs'))
+            jobs += [(k, i, j, diff) for j in range(len(frames))]
+
+    in_flight = in_flight or max(core.num_threads * 4, 8)
+    queue = deque(jobs)
+    pending = deque()
+    done = 0
+    while queue or pending:
+        while queue and len(pending) < in_flight:
+            k, i, j, node = queue.popleft()
+            pending.append((k, i, j, node.get_frame_async(j)))
+        k, i, j, fut = pending.popleft()
+        errors[k, i, j] = fut.result().props['PlaneStatsAverage']
+        done += 1
+        if progress and done % 200 == 0:
+            print(f"\rDescale sweep: {done}/{len(jobs)} ~ {100 * done // len(jobs)}%", end="")
+    if progress:
+        print()
+
+    mean = errors.mean(axis=2)
+    dips = dip_scores(mean)
+    order = np.argsort(dips, axis=None)[:top]
+    ranked = []
+    for flat in order:
+        k, i = np.unravel_index(flat, dips.shape)
+        h = int(heights[i])
+        ranked.append(Candidate(kernels[k].name, h, _width(clip, h), float(mean[k, i]), float(dips[k, i])))
+    return NativeResult(ranked, [k.name for k in kernels], heights, frames, errors)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.native', description=__doc__.splitlines()[0])
+    parser.add_argument('source')
+    parser.add_argument('--min', type=int, default=500)
+    parser.add_argument('--max', type=int, default=1000)
+    parser.add_argument('--step', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=12)
+    parser.add_argument('--csv', help='write per-frame errors here')
+    opts = parser.parse_args(argv)
+
+    result = find_native(source(opts.source), range(opts.min, opts.max + 1, opts.step), count=opts.frames)
+    print(f"{'kernel':<24}{'height':>8}{'width':>8}{'error':>14}{'dip':>10}")
+    for c in result.ranked:
+        print(f"{c.kernel:<24}{c.height:>8}{c.width:>8}{c.error:>14.8f}{c.dip:>10.4f}")
+    if opts.csv:
+        result.write_csv(opts.csv)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Frame output for encode_chain, a faster clip.output().
+
+clip.output() writes into a default 64 KiB pipe, through a buffered file object, with
+y4m framing in front of every frame and no say in how many frames are in flight. Here:
+
+- `in_flight` frame requests are kept running; finished frames wait in a reorder buffer
+  (the deque of futures) until it is their turn
+- the pipe is opened unbuffered and, on Linux, grown to `pipe_size`
+- planes are written straight from the frame memory (10-bit is already little-endian
+  16-bit words, which is what yuv420p10le and x265 --input-depth 10 read), gathered into
+  one writev call per frame where the OS has it
+- `rawvideo()` swaps the y4m input switches of an ffmpeg/x265 command line for raw ones
+- time spent waiting on the filters and blocked on the encoder is reported at the end
+
+    process = output.popen(output.rawvideo(ffv1_args, clip) + ["out.mkv"])
+    output.write(clip, process, progress_update=...)
+    process.communicate()
+"""
+__author__ = 'Soap'
+
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import vapoursynth as vs
+
+from . import y4m as y4m_
+from .util import plane_view
+
+core = vs.core
+
+F_SETPIPE_SZ = 1031
+_IOV_MAX = 512
+
+
+class OutputStats(NamedTuple):
+    frames: int
+    seconds: float
+    filter_wait: float      # blocked waiting for the next frame in order
+    encoder_wait: float     # blocked writing into the pipe
+
+    def __str__(self) -> str:
+        fps = self.frames / self.seconds if self.seconds else 0
+        return (f"{self.frames} frames in {self.seconds:.1f}s ({fps:.2f} fps), "
+                f"waiting on filters {self.filter_wait:.1f}s ({100 * self.filter_wait / max(self.seconds, 1e-9):.0f}%), "
+                f"blocked on encoder {self.encoder_wait:.1f}s ({100 * self.encoder_wait / max(self.seconds, 1e-9):.0f}%)")
+
+
+def pix_fmt(fmt: vs.Format) -> str:
+    """ffmpeg pixel format name for an integer YUV/GRAY format."""
+    cs = y4m_.colorspace(fmt)
+    if fmt.color_family == vs.GRAY:
+        return 'gray' if fmt.bits_per_sample == 8 else f'gray{fmt.bits_per_sample}le'
+    sub = cs[:3]
+    return f'yuv{sub}p' if fmt.bits_per_sample == 8 else f'yuv{sub}p{fmt.bits_per_sample}le'
+
+
+def rawvideo(args: Sequence[str], clip: vs.VideoNode) -> List[str]:
+    """Encoder command line reading raw planes instead of y4m (ffmpeg `-f yuv4mpegpipe -i -`, x265 `--y4m`)."""
+    args = list(args)
+    fps = f'{clip.fps.numerator}/{clip.fps.denominator}'
+    for i in range(len(args) - 3):
+        if args[i:i + 4] == ['-f', 'yuv4mpegpipe', '-i', '-']:
+            return args[:i] + ['-f', 'rawvideo', '-pix_fmt', pix_fmt(clip.format), '-s', f'{clip.width}x{clip.height}',
+                               '-r', fps, '-i', '-'] + args[i + 4:]
+    if '--y4m' in args:
+        fmt = clip.format
+        csp = {(1, 1): 'i420', (1, 0): 'i422', (0, 0): 'i444'}[(fmt.subsampling_w, fmt.subsampling_h)]
+        i = args.index('--y4m')
+        return args[:i] + ['--input-res', f'{clip.width}x{clip.height}', '--fps', fps,
+                           '--input-depth', str(fmt.bits_per_sample), '--input-csp', csp] + args[i + 1:]
+    raise ValueError('rawvideo: no y4m input switches to replace')
+
+
+def popen(args: Sequence[str], pipe_size: int = 16 * 2**20, **kwargs) -> subprocess.Popen:
+    """Start the encoder with an unbuffered stdin pipe, as large as the OS allows."""
+    process = subprocess.Popen(list(args), stdin=subprocess.PIPE, bufsize=0, **kwargs)
+    if sys.platform.startswith('linux'):
+        import fcntl
+        try:
+            with open('/proc/sys/fs/pipe-max-size') as f:
+                pipe_size = min(pipe_size, int(f.read()))
+            fcntl.fcntl(process.stdin.fileno(), F_SETPIPE_SZ, pipe_size)
+        except OSError:
+            pass    # keep the default size
+    return process
+
+
+def _buffers(frame: vs.VideoFrame) -> List[memoryview]:
+    out = []
+    for p in range(frame.format.num_planes):
+        view = plane_view(frame, p)
+        # padded strides (odd widths) need one copy, 1080p/2160p planes are already contiguous
+        out.append(view.cast('B') if view.c_contiguous else memoryview(np.ascontiguousarray(view)).cast('B'))
+    return out
+
+
+def _write_all(fd: int, bufs: List[memoryview]) -> None:
+    if hasattr(os, 'writev'):
+        bufs = list(bufs)
+        while bufs:
+            n = os.writev(fd, bufs[:_IOV_MAX])
+            while bufs and n >= len(bufs[0]):
+                n -= len(bufs[0])
+                bufs.pop(0)
+            if n:
+                bufs[0] = bufs[0][n:]
+        return
+    for buf in bufs:
+        while len(buf):
+            buf = buf[os.write(fd, buf):]
+
+
+def write(clip: vs.VideoNode, process: subprocess.Popen, y4m: bool = False, in_flight: Optional[int] = None,
+          progress_update: Optional[Callable[[int, int], None]] = None, report: bool = True,
+          tap: Optional[Callable[[int, List[memoryview]], None]] = None) -> OutputStats:
+    """Render `clip` into process.stdin in order; the caller closes it (communicate()).
+
+    `tap(n, planes)` sees every frame's plane buffers right before they are written.
+    """
+    fd = process.stdin.fileno()
+    in_flight = in_flight or max(2, core.num_threads)
+    total = clip.num_frames
+    if y4m:
+        _write_all(fd, [memoryview(y4m_.header(clip))])
+    frame_tag = [memoryview(b'FRAME\n')] if y4m else []
+
+    filter_wait = encoder_wait = 0.0
+    start = time.perf_counter()
+    pending = deque()
+    requested = 0
+    for n in range(total):
+        while requested < total and len(pending) < in_flight:
+            pending.append(clip.get_frame_async(requested))
+            requested += 1
+        t0 = time.perf_counter()
+        frame = pending.popleft().result()
+        t1 = time.perf_counter()
+        planes = _buffers(frame)
+        if tap:
+            tap(n, planes)
+        _write_all(fd, frame_tag + planes)
+        t2 = time.perf_counter()
+        filter_wait += t1 - t0
+        encoder_wait += t2 - t1
+        del frame, planes
+        if progress_update:
+            progress_update(n + 1, total)
+
+    stats = OutputStats(total, time.perf_counter() - start, filter_wait, encoder_wait)
+    if report:
+        print(f"\nOutput: {stats}", file=sys.stderr)
+    return stats
@@ -0,0 +1,319 @@
+"""Release pipeline: a per-show spec turned into a task graph, run as wide as the machine allows.
+
+heike.bat/urasekai.bat ran encode -> audio -> 3 muxes -> 9 uploads strictly one after
+another. Here every step is a Task with its dependencies and the resources it holds
+(CPU threads, RAM, a slot on each disk it touches); the runner starts whatever is ready
+and fits, so the audio encode runs next to the video encode, the 480p mux and upload
+start while the 1080p one is still muxing, and with several episodes on the command line
+episode 2 encodes while episode 1 uploads.
+
+Every finished task is recorded in a state file with a key over its parameters, the
+size/mtime of its input files and the keys of the tasks it depends on. A rerun skips
+tasks whose key is unchanged and whose outputs are still there, or no longer needed
+because everything after them is up to date too (the rung videos once clean has removed
+them), so a failed upload is retried without re-encoding. Editing the track layout in
+the spec redoes the muxes and uploads, and the encode as well unless keep_video is set.
+
+    python -m soapfunc.pipeline heike.json "[SubsPlease] Heike Monogatari - 01 (1080p) [516659CC].mkv"
+
+The spec is JSON, see `Show` for the fields; {ep}, {width} and {height} are filled in
+the output name, the title and the destinations.
+"""
+__author__ = 'Soap'
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from . import audio, mux, publish
+
+STATE = 'pipeline-state.json'
+
+
+class Task(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    deps: Sequence[str] = ()
+    inputs: Sequence[str] = ()      # files whose size/mtime key the task
+    outputs: Sequence[str] = ()     # files that must still exist for the task to be skipped, unless
+                                    # every task after it is skipped as well
+    params: Any = None              # anything else that changes the result, JSON-able
+    cpu: int = 1                    # threads it keeps busy, 0 for pure I/O
+    ram_mb: int = 0
+    io: bool = True                 # takes a slot on every disk its files are on
+
+
+def _device(path: str) -> int:
+    return os.stat(os.path.dirname(os.path.abspath(path)) or '.').st_dev
+
+
+def _stat(path: str) -> Any:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def _load_state(path: str) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(path: str, state: Dict[str, str]) -> None:
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _order(tasks: Sequence[Task]) -> List[Task]:
+    """Tasks in dependency order; unknown dependencies and cycles are errors."""
+    by_name = {t.name: t for t in tasks}
+    for t in tasks:
+        for d in t.deps:
+            if d not in by_name:
+                raise ValueError(f'{t.name}: unknown dependency {d}')
+    done, out = set(), []
+    while len(out) < len(tasks):
+        ready = [t for t in tasks if t.name not in done and all(d in done for d in t.deps)]
+        if not ready:
+            raise ValueError('dependency cycle between ' + ', '.join(t.name for t in tasks if t.name not in done))
+        for t in ready:
+            done.add(t.name)
+            out.append(t)
+    return out
+
+
+def run(tasks: Sequence[Task], state: str = STATE, cpus: Optional[int] = None, ram_mb: Optional[int] = None,
+        per_disk: int = 2, dry_run: bool = False) -> Dict[str, str]:
+    """Run the graph; returns each task's outcome: done, skipped, failed or blocked (a dependency failed).
+
+    A task asking for more CPUs or RAM than the machine has gets all of it and runs alone.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    if ram_mb is None:
+        try:
+            import psutil
+            ram_mb = psutil.virtual_memory().available // 2**20 * 3 // 4
+        except ImportError:
+            ram_mb = 2**40
+    pending = _order(tasks)
+    saved = _load_state(state)
+    status: Dict[str, str] = {}
+    keys: Dict[str, str] = {}
+    free = dict(cpu=cpus, ram=ram_mb)
+    disks: Dict[int, int] = {}
+    cond = threading.Condition()
+
+    def key(t: Task, known: Dict[str, str]) -> str:
+        blob = json.dumps([t.params, [(p, _stat(p)) for p in t.inputs], [known[d] for d in t.deps]], sort_keys=True)
+        return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+    # what the keys come to if nothing reruns, to tell whether a task's missing outputs are still needed
+    planned: Dict[str, str] = {}
+    dependents: Dict[str, List[Task]] = {}
+    for t in pending:
+        planned[t.name] = key(t, planned)
+        for d in t.deps:
+            dependents.setdefault(d, []).append(t)
+    fresh_memo: Dict[str, bool] = {}
+
+    def fresh(t: Task) -> bool:
+        if t.name not in fresh_memo:
+            after = dependents.get(t.name, [])
+            fresh_memo[t.name] = saved.get(t.name) == planned[t.name] and (
+                all(os.path.exists(p) for p in t.outputs) or bool(after) and all(fresh(d) for d in after))
+        return fresh_memo[t.name]
+
+    def needs(t: Task) -> Dict[str, Any]:
+        devs = sorted({_device(p) for p in list(t.inputs) + list(t.outputs)}) if t.io else []
+        return dict(cpu=min(t.cpu, cpus), ram=min(t.ram_mb, ram_mb), devs=devs)
+
+    def fits(n: Dict[str, Any]) -> bool:
+        return (n['cpu'] <= free['cpu'] and n['ram'] <= free['ram']
+                and all(disks.setdefault(d, per_disk) > 0 for d in n['devs']))
+
+    def take(n: Dict[str, Any], sign: int) -> None:
+        free['cpu'] -= sign * n['cpu']
+        free['ram'] -= sign * n['ram']
+        for d in n['devs']:
+            disks[d] -= sign
+
+    def work(t: Task, n: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            t.run()
+            outcome = 'done'
+        except Exception as e:
+            print(f"{t.name}: failed: {e}", file=sys.stderr)
+            outcome = 'failed'
+        with cond:
+            take(n, -1)
+            status[t.name] = outcome
+            if outcome == 'done':
+                saved[t.name] = keys[t.name]
+                _save_state(state, saved)
+                print(f"{t.name}: done in {time.perf_counter() - start:.0f}s")
+            cond.notify_all()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(tasks))) as pool, cond:
+        while pending or any(s == 'running' for s in status.values()):
+            for t in list(pending):
+                deps = [status.get(d) for d in t.deps]
+                if any(s in ('failed', 'blocked') for s in deps):
+                    status[t.name] = 'blocked'
+                elif all(s in ('done', 'skipped') for s in deps):
+                    if t.name not in keys:
+                        keys[t.name] = key(t, keys)
+                    if saved.get(t.name) == keys[t.name] and (all(os.path.exists(p) for p in t.outputs) or fresh(t)):
+                        status[t.name] = 'skipped'
+                        print(f"{t.name}: unchanged, skipped")
+                    elif dry_run:
+                        print(f"{t.name}: would run")
+                        status[t.name] = 'done'
+                    else:
+                        n = needs(t)
+                        if not fits(n):
+                            continue
+                        take(n, 1)
+                        status[t.name] = 'running'
+                        print(f"{t.name}: started")
+                        pool.submit(work, t, n)
+                else:
+                    continue
+                pending.remove(t)
+                cond.notify_all()
+            if pending or any(s == 'running' for s in status.values()):
+                cond.wait(timeout=5)
+    return status
+
+
+# release graphs
+
+class Show(NamedTuple):
+    script: str                                 # the .vpy, gets key=<source> like vspipe --arg
+    output: str                                 # release file name, "[AniDL] Heike Monogatari - {ep} [WEB {height}p 10bit][SubsPlease].mkv"
+    rungs: Sequence[str] = ("854x480", "1280x720", "1920x1080")
+    x265: str = ""                              # -x265-params
+    crf: float = 22
+    preset: str = "slow"
+    audio: str = "opus128"                      # soapfunc.audio codec name
+    audio_stream: int = 0
+    tracks: Sequence[Dict[str, Any]] = ()       # final order: {"from": "video"|"audio"|"subtitles", "name", "language", "default"}
+    title: Optional[str] = None
+    destinations: Sequence[str] = ()            # rclone remotes or local folders
+    upload_limits: Optional[Dict[str, int]] = None  # files at a time per remote, default 2
+    episode: str = r" - (\d+(?:\.\d+)?) "       # regex for the episode number in the source name
+    encode_ram_mb: int = 8000
+    keep_video: bool = False                    # keep the encoded-only rung files; without them a finished
+                                                # episode re-encodes if its mux settings change later
+
+    @classmethod
+    def load(cls, path: str) -> 'Show':
+        with open(path, encoding='utf-8') as f:
+            spec = json.load(f)
+        unknown = set(spec) - set(cls._fields)
+        if unknown:
+            raise ValueError(f"{path}: unknown fields {', '.join(sorted(unknown))}")
+        return cls(**spec)
+
+    def encoder(self) -> List[str]:
+        return ["-y", "-c:v", "libx265", "-x265-params", self.x265, "-crf", str(self.crf), "-pix_fmt", "yuv420p10le",
+                "-preset", self.preset, "-map", "0", "-movflags", "faststart"]
+
+
+def _mux_job(show: Show, source: str, video: str, out: str, title: Optional[str]) -> mux.Job:
+    encoder, ext = audio.CODECS[show.audio]
+    tracks: List[mux.Track] = []
+    for layout in show.tracks:
+        opts = {k: v for k, v in layout.items() if k != 'from'}
+        if layout['from'] == 'video':
+            tracks += mux.tracks_of(video, 'video', **opts)
+        elif layout['from'] == 'audio':
+            # a cache hit by now, the audio task made it
+            tracks.append(mux.Track(audio.cached(source, show.audio_stream, encoder, ext), **opts))
+        else:
+            tracks += mux.tracks_of(source, layout['from'], **opts)
+    # the source's fonts and chapters go along with its subtitles
+    return mux.Job(out, tracks, title=title, keep_from=[source])
+
+
+def release(show: Show, source: str, spec_dir: str = '.') -> List[Task]:
+    """Tasks for one episode: encode (all rungs in one fanout), audio, then mux and upload per rung."""
+    found = re.search(show.episode, os.path.basename(source))
+    if not found:
+        raise ValueError(f"{source}: no episode number matching {show.episode!r}")
+    ep = found.group(1)
+    script = os.path.join(spec_dir, show.script)
+    rungs = []
+    for size in show.rungs:
+        w, h = size.lower().split('x')
+        fill = dict(ep=ep, width=w, height=h)
+        out = show.output.format(**fill)
+        rungs.append((size, h, fill, out, os.path.splitext(out)[0] + '.video.mkv'))
+
+    fanout = [sys.executable, "-m", "soapfunc.fanout", script, "--arg", f"key={source}"]
+    for size, _, _, _, video in rungs:
+        fanout += ["--rung", size, video]
+    fanout += ["--"] + show.encoder()
+    tasks = [
+        # one thread short of the whole machine, so the audio encode runs alongside
+        Task(f"{ep}/encode", lambda: subprocess.run(fanout, check=True), inputs=[source, script],
+             outputs=[r[4] for r in rungs], params=fanout[1:], cpu=max(1, (os.cpu_count() or 1) - 1),
+             ram_mb=show.encode_ram_mb),
+        Task(f"{ep}/audio", lambda: audio.cached(source, show.audio_stream, *audio.CODECS[show.audio]),
+             inputs=[source], params=[show.audio, show.audio_stream]),
+    ]
+    uploads = []
+    for size, h, fill, out, video in rungs:
+        title = show.title.format(**fill) if show.title else None
+        tasks.append(Task(f"{ep}/mux {h}p", lambda v=video, o=out, t=title: mux.run(_mux_job(show, source, v, o, t)),
+                          deps=[f"{ep}/encode", f"{ep}/audio"], inputs=[source], outputs=[out],
+                          params=[list(show.tracks), title], cpu=0))
+        if show.destinations:
+            # one read of the file feeds every destination
+            remotes = [dest.format(**fill) for dest in show.destinations]
+            name = f"{ep}/upload {h}p"
+            tasks.append(Task(name, lambda o=out, r=remotes: publish.send(o, r, limits=show.upload_limits),
+                              deps=[f"{ep}/mux {h}p"], inputs=[out], params=remotes, cpu=0))
+            uploads.append(name)
+    if not show.keep_video:
+        videos = [r[4] for r in rungs]
+        tasks.append(Task(f"{ep}/clean", lambda: [os.remove(v) for v in videos if os.path.exists(v)],
+                          deps=uploads or [f"{ep}/mux {r[1]}p" for r in rungs], cpu=0, io=False))
+    return tasks
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.pipeline', description=__doc__.splitlines()[0])
+    parser.add_argument('spec', help='show spec (JSON)')
+    parser.add_argument('sources', nargs='+', help='source episodes')
+    parser.add_argument('--state', help=f'state file (default: {STATE} next to the spec)')
+    parser.add_argument('--cpus', type=int)
+    parser.add_argument('--ram', type=int, help='MB the tasks may hold together (default: 3/4 of available)')
+    parser.add_argument('--per-disk', type=int, default=2)
+    parser.add_argument('--dry-run', action='store_true', help='print what would run')
+    opts = parser.parse_args(argv)
+
+    show = Show.load(opts.spec)
+    spec_dir = os.path.dirname(os.path.abspath(opts.spec))
+    tasks = [t for source in opts.sources for t in release(show, source, spec_dir)]
+    status = run(tasks, opts.state or os.path.join(spec_dir, STATE), cpus=opts.cpus, ram_mb=opts.ram,
+                 per_disk=opts.per_disk, dry_run=opts.dry_run)
+    failed = [name for name, s in status.items() if s in ('failed', 'blocked')]
+    if failed:
+        sys.exit(f"failed or blocked: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""Per-node timing for filter chains.
+
+`instrument(filter_chain)` returns a copy of the function whose module aliases (core,
+hvf, lvf, insaneAA, ...) and helper functions are wrapped, so every clip a call in its
+body returns is bracketed by two nodes: a FrameEval that stamps the request and a
+ModifyFrame that stamps the finished frame. Which call feeds which is taken from the
+clips passed between the wrapped calls, not from the timestamps. `run()` renders on a
+single VapourSynth thread, so the work is done one node at a time and the time up to a
+node's finished frame since the previous one finished is that node's own (plus any
+unwrapped nodes just before it):
+
+    prof = Profiler()
+    final = prof.instrument(filter_chain)(raw, comps=False)
+    prof.run(final, frames=40)          # sampled frames, one at a time
+    print(prof.table())
+    prof.write_folded('lost.folded')    # flamegraph.pl / speedscope / inferno
+
+Profiler(every=250) only records every 250th frame, for a look at a real encode. The
+wrappers still call into Python twice per wrapped node on every frame, and with the
+encode's threads overlapping only the inclusive (wall) times mean anything there.
+
+    python -m soapfunc.profiler lost_butterfly.py --frames 40 --folded lost.folded -- 00001.m2ts
+"""
+__author__ = 'Soap'
+
+import argparse
+import inspect
+import runpy
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import vapoursynth as vs
+
+core = vs.core
+
+
+class Event(NamedTuple):
+    node: str
+    n: int
+    start: int      # perf_counter_ns
+    end: int
+
+
+class NodeStats(NamedTuple):
+    node: str
+    frames: int
+    wall: float         # inclusive seconds
+    exclusive: float    # seconds of its own work, from a single-threaded run()
+
+
+class Profiler:
+    def __init__(self, every: int = 1) -> None:
+        self.every = every
+        self.events: List[Event] = []
+        self._starts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._names: Dict[str, int] = defaultdict(int)
+        self._wrapped: Dict[int, str] = {}         # id of a wrapped clip -> its call site
+        self._keep: List[vs.VideoNode] = []         # keeps those ids valid
+        self.consumer: Dict[str, str] = {}          # call site -> the first call site that took its clip
+
+    # building
+
+    def wrap(self, clip: vs.VideoNode, name: str) -> vs.VideoNode:
+        every, starts, events = self.every, self._starts, self.events
+
+        def begin(n: int) -> vs.VideoNode:
+            if n % every == 0:
+                starts[name, n] = time.perf_counter_ns()
+            return clip
+
+        def end(n: int, f: vs.VideoFrame) -> vs.VideoFrame:
+            if n % every == 0:
+                t0 = starts.pop((name, n), None)
+                if t0 is not None:
+                    events.append(Event(name, n, t0, time.perf_counter_ns()))
+            return f
+
+        timed = core.std.FrameEval(clip, begin)
+        out = core.std.ModifyFrame(timed, timed, end)
+        with self._lock:
+            self._wrapped[id(out)] = name
+            self._keep.append(out)
+        return out
+
+    def _mark(self, value: Any, name: str) -> Any:
+        if isinstance(value, vs.VideoNode):
+            return self.wrap(value, name)
+        if isinstance(value, (tuple, list)) and any(isinstance(v, vs.VideoNode) for v in value):
+            return type(value)(self._mark(v, f'{name}[{i}]') for i, v in enumerate(value))
+        return value
+
+    def _call_site(self, name: str) -> str:
+        # one row per call site: depth@47 and depth@71 are different nodes
+        line = sys._getframe(2).f_lineno
+        with self._lock:
+            key = f'{name}@{line}'
+            self._names[key] += 1
+            count = self._names[key]
+        return key if count == 1 else f'{key}#{count}'
+
+    def function(self, fn: Callable, name: Optional[str] = None) -> Callable:
+        """fn with every clip it returns wrapped."""
+        name = name or getattr(fn, '__name__', repr(fn))
+
+        def timed(*args, **kwargs):
+            site = self._call_site(name)
+            out = fn(*args, **kwargs)
+            for clip in _clips(list(args) + list(kwargs.values())):
+                source = self._wrapped.get(id(clip))
+                if source is not None and source != site:
+                    self.consumer.setdefault(source, site)
+            return self._mark(out, site)
+        timed.__wrapped__ = fn
+        return timed
+
+    def proxy(self, obj: Any, name: str) -> Any:
+        return _Proxy(self, obj, name)
+
+    def instrument(self, fn: Callable) -> Callable:
+        """A copy of fn that sees wrapped versions of the modules and helpers it uses."""
+        env = dict(fn.__globals__)
+        for key in fn.__code__.co_names:
+            if key in env:
+                env[key] = self._instrumented(env[key], key)
+        copy = types.FunctionType(fn.__code__, env, fn.__name__, fn.__defaults__, fn.__closure__)
+        copy.__kwdefaults__ = fn.__kwdefaults__
+        return copy
+
+    def _instrumented(self, value: Any, name: str) -> Any:
+        if isinstance(value, (types.ModuleType, vs.Core, vs.Plugin)):
+            return self.proxy(value, name)
+        if isinstance(value, (types.FunctionType, types.BuiltinFunctionType, vs.Function)):
+            return self.function(value, name)
+        return value
+
+    # running
+
+    def run(self, clip: vs.VideoNode, frames: int = 40, first: int = 0, last: Optional[int] = None) -> None:
+        """Render `frames` evenly spaced frames one at a time on one thread, so nodes never overlap."""
+        last = clip.num_frames if last is None else last
+        step = max(1, (last - first) // frames)
+        threads = core.num_threads
+        core.num_threads = 1
+        try:
+            for i, n in enumerate(range(first, last, step)[:frames]):
+                clip.get_frame(n)
+                print(f"\rProfiling: {i + 1}/{frames}", end="", file=sys.stderr)
+        finally:
+            core.num_threads = threads
+        print(file=sys.stderr)
+
+    # reporting
+
+    def _exclusive(self) -> List[int]:
+        """Per event: the time since the previous event finished (or since it was requested, if later)."""
+        events = self.events
+        out = [0] * len(events)
+        previous = None
+        for i in sorted(range(len(events)), key=lambda i: events[i].end):
+            e = events[i]
+            out[i] = e.end - (e.start if previous is None else max(previous, e.start))
+            previous = e.end
+        return out
+
+    def stack(self, node: str) -> List[str]:
+        """node and the calls its clip went into, innermost first (the first consumer where there are several)."""
+        path = [node]
+        while path[-1] in self.consumer and self.consumer[path[-1]] not in path:
+            path.append(self.consumer[path[-1]])
+        return path
+
+    def stats(self) -> List[NodeStats]:
+        frames: Dict[str, int] = defaultdict(int)
+        wall: Dict[str, int] = defaultdict(int)
+        excl: Dict[str, int] = defaultdict(int)
+        for e, x in zip(self.events, self._exclusive()):
+            frames[e.node] += 1
+            wall[e.node] += e.end - e.start
+            excl[e.node] += x
+        rows = [NodeStats(k, frames[k], wall[k] / 1e9, excl[k] / 1e9) for k in frames]
+        return sorted(rows, key=lambda r: r.exclusive, reverse=True)
+
+    def table(self) -> str:
+        rows = self.stats()
+        total = sum(r.exclusive for r in rows) or 1
+        width = max([len(r.node) for r in rows] + [4])
+        lines = [f"{'node':<{width}}  {'frames':>6}  {'wall s':>9}  {'excl s':>9}  {'excl ms/f':>9}  {'%':>5}"]
+        for r in rows:
+            lines.append(f"{r.node:<{width}}  {r.frames:>6}  {r.wall:>9.3f}  {r.exclusive:>9.3f}  "
+                         f"{1000 * r.exclusive / r.frames:>9.2f}  {100 * r.exclusive / total:>5.1f}")
+        return "\n".join(lines)
+
+    def folded(self) -> Dict[str, int]:
+        """Collapsed stacks (output;...;node -> exclusive microseconds), root first."""
+        out: Dict[str, int] = defaultdict(int)
+        for e, x in zip(self.events, self._exclusive()):
+            out[';'.join(reversed(self.stack(e.node)))] += x // 1000
+        return out
+
+    def write_folded(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, us in sorted(self.folded().items()):
+                if us > 0:
+                    f.write(f"{stack} {us}\n")
+
+
+class _Proxy:
+    """Attribute access on a module, core or plugin that hands back timed functions."""
+
+    def __init__(self, prof: Profiler, obj: Any, name: str) -> None:
+        object.__setattr__(self, '_prof', prof)
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, attr: str) -> Any:
+        value = getattr(self._obj, attr)
+        name = f'{self._name}.{attr}'
+        if isinstance(value, (types.ModuleType, vs.Plugin)):
+            return _Proxy(self._prof, value, name)
+        if isinstance(value, (types.FunctionType, types.BuiltinFunctionType, vs.Function)):
+            return self._prof.function(value, name)
+        return value
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self._obj, attr, value)
+
+
+def _clips(values: Sequence[Any]) -> List[vs.VideoNode]:
+    """The clips among a call's arguments, one level into lists and tuples."""
+    out = []
+    for v in values:
+        if isinstance(v, vs.VideoNode):
+            out.append(v)
+        elif isinstance(v, (tuple, list)):
+            out += [x for x in v if isinstance(x, vs.VideoNode)]
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.profiler', description=__doc__.splitlines()[0])
+    parser.add_argument('script', help='script defining the chain function')
+    parser.add_argument('--func', default='filter_chain')
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--folded', help='write collapsed stacks here')
+    parser.add_argument('--comps', action='store_true', help="let the chain write its comps (passes comps=False otherwise)")
+    parser.add_argument('args', nargs='*', help='positional arguments for the chain function')
+    opts = parser.parse_args(argv)
+
+    sys.argv = [opts.script] + opts.args
+    env = runpy.run_path(opts.script, run_name='__profile__')
+    prof = Profiler()
+    func = env[opts.func]
+    # comp screenshots would be timed as part of the chain and render frames of their own
+    kwargs = {} if opts.comps or 'comps' not in inspect.signature(func).parameters else dict(comps=False)
+    clip = prof.instrument(func)(*opts.args, **kwargs)
+    prof.run(clip, opts.frames)
+    print(prof.table())
+    if opts.folded:
+        prof.write_folded(opts.folded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Upload finished files to every destination from a single read.
+
+The release bats ran `rclone copy` nine times, one file and one remote after another,
+reading each file from disk three times. Here each file is read once, in chunks that
+go to one writer thread per destination: `rclone rcat` for remotes, a plain file for
+local folders (which is also how this is tried out without touching the remotes). Any
+one destination only takes `limit` files at a time.
+
+A manifest of what was sent where (blake2b of the content) means a file that is
+already at a destination with the same content is not sent again; the hash of a local
+file is remembered by size and mtime, and computed while streaming. Failed destinations
+are retried with backoff without resending to the ones that succeeded.
+
+    python -m soapfunc.publish "ep01 480p.mkv" "ep01 720p.mkv" \\
+        --to "SoapEnc12:Public/[AniDL] Heike Monogatari [WEB 480p 10bit][Soap]" --to "D:/mirror" --limit "OneDrive ceo=2"
+"""
+__author__ = 'Soap'
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+MANIFEST = os.path.join(os.path.expanduser('~'), '.soapfunc', 'publish.json')
+CHUNK = 8 * 2**20
+
+_manifest_lock = threading.Lock()
+_slots: Dict[str, threading.Semaphore] = {}
+_slots_lock = threading.Lock()
+
+
+class Item(NamedTuple):
+    path: str
+    dest: str           # local folder or rclone "remote:folder"
+
+
+def is_remote(dest: str) -> bool:
+    """rclone "remote:path"; drive letters (C:/, D:\\) are local."""
+    return bool(re.match(r'^[^:/\\]{2,}:', dest))
+
+
+def remote_name(dest: str) -> str:
+    """What the concurrency limit applies to: the rclone remote, or the local folder."""
+    return dest.split(':', 1)[0] if is_remote(dest) else os.path.abspath(dest)
+
+
+def _slot(dest: str, limits: Dict[str, int], default: int) -> threading.Semaphore:
+    name = remote_name(dest)
+    with _slots_lock:
+        if name not in _slots:
+            _slots[name] = threading.Semaphore(limits.get(name, default))
+        return _slots[name]
+
+
+class _Sink:
+    """One destination of one file, fed by its own thread."""
+
+    def __init__(self, dest: str, name: str) -> None:
+        self.dest, self.name, self.error = dest, name, None
+        self.queue: queue.Queue = queue.Queue(maxsize=4)
+        if is_remote(dest):
+            self.target = f"{dest.rstrip('/')}/{name}"
+            self.process = subprocess.Popen(["rclone", "rcat", self.target], stdin=subprocess.PIPE)
+            self.out = self.process.stdin
+        else:
+            os.makedirs(dest, exist_ok=True)
+            self.target = os.path.join(dest, name)
+            self.process = None
+            self.out = open(self.target + '.part', 'wb')
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.out.write(chunk)
+                except OSError as e:
+                    self.error = e      # keep draining, the reader must not block on us
+        try:
+            self.out.close()
+        except OSError as e:
+            self.error = self.error or e
+        if self.process:
+            if self.process.wait() and self.error is None:
+                self.error = RuntimeError(f"rclone rcat exited with {self.process.returncode}")
+        elif self.error is None:
+            os.replace(self.target + '.part', self.target)
+        elif os.path.exists(self.target + '.part'):
+            os.remove(self.target + '.part')
+
+    def finish(self) -> Optional[Exception]:
+        self.queue.put(None)
+        self.thread.join()
+        return self.error
+
+
+def _load(path: str) -> dict:
+    if not os.path.exists(path):
+        return dict(files={}, sent={})
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save(path: str, manifest: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _known_hash(path: str, manifest: dict) -> Optional[str]:
+    st = os.stat(path)
+    hit = manifest['files'].get(os.path.abspath(path))
+    if hit and hit['size'] == st.st_size and hit['mtime'] == st.st_mtime:
+        return hit['hash']
+    return None
+
+
+def _hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _stream(path: str, dests: Sequence[str], chunk: int) -> Tuple[str, Dict[str, Optional[Exception]]]:
+    """Read `path` once into every destination; returns its hash and each destination's error (or None)."""
+    name = os.path.basename(path)
+    sinks, errors = [], {}
+    for d in dests:
+        try:
+            sinks.append(_Sink(d, name))
+        except OSError as e:
+            errors[d] = e
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+            for s in sinks:
+                s.queue.put(block)
+    for s in sinks:
+        errors[s.dest] = s.finish()
+    return h.hexdigest(), errors
+
+
+def send(path: str, dests: Sequence[str], limits: Optional[Dict[str, int]] = None, default_limit: int = 2,
+         retries: int = 3, manifest: str = MANIFEST, chunk: int = CHUNK) -> Dict[str, str]:
+    """Put one file in every destination; returns dest -> 'sent' or 'unchanged'. Raises once retries are used up."""
+    limits = limits or {}
+    name = os.path.basename(path)
+    size = os.path.getsize(path)
+    with _manifest_lock:
+        m = _load(manifest)
+        digest = _known_hash(path, m)
+        sent = {d: m['sent'].get(f"{d.rstrip('/')}/{name}") for d in dests}
+    if digest is None and any(s and s['size'] == size for s in sent.values()):
+        digest = _hash(path)     # same size as what is out there: only the content can tell
+    result = {d: 'unchanged' for d, s in sent.items() if s and s['size'] == size and s['hash'] == digest}
+    todo = [d for d in dests if d not in result]
+
+    attempt = 0
+    while todo:
+        # every destination's slot, always in the same order, so two files never wait on each other
+        slots = sorted({remote_name(d): _slot(d, limits, default_limit) for d in todo}.items())
+        for _, s in slots:
+            s.acquire()
+        try:
+            digest, errors = _stream(path, todo, chunk)
+        finally:
+            for _, s in reversed(slots):
+                s.release()
+        st = os.stat(path)
+        with _manifest_lock:
+            m = _load(manifest)
+            m['files'][os.path.abspath(path)] = dict(size=st.st_size, mtime=st.st_mtime, hash=digest)
+            for d, e in errors.items():
+                if e is None:
+                    m['sent'][f"{d.rstrip('/')}/{name}"] = dict(size=size, hash=digest)
+                    result[d] = 'sent'
+            _save(manifest, m)
+        todo = [d for d, e in errors.items() if e is not None]
+        if todo:
+            attempt += 1
+            if attempt > retries:
+                raise RuntimeError(f"{name}: failed for {', '.join(todo)}: {errors[todo[0]]}")
+            print(f"{name}: retrying {', '.join(todo)} ({attempt}/{retries}): {errors[todo[0]]}")
+            time.sleep(min(60, 5 * 2**(attempt - 1)))
+    return result
+
+
+def publish(items: Sequence[Item], jobs: int = 4, **options) -> Dict[str, Dict[str, str]]:
+    """send() every file to all of its destinations, `jobs` files at a time."""
+    by_file: Dict[str, List[str]] = {}
+    for item in items:
+        by_file.setdefault(item.path, []).append(item.dest)
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(send, path, dests, **options): path for path, dests in by_file.items()}
+        for fut in as_completed(futures):
+            results[futures[fut]] = fut.result()
+            print(f"Published: {os.path.basename(futures[fut])} "
+                  + ", ".join(f"{remote_name(d)} {r}" for d, r in results[futures[fut]].items()))
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.publish', description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--to', action='append', required=True, metavar='DEST',
+                        help='local folder or rclone remote:folder, repeatable')
+    parser.add_argument('--limit', action='append', default=[], metavar='REMOTE=N',
+                        help='files at a time for one remote (default --default-limit)')
+    parser.add_argument('--default-limit', type=int, default=2)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=4, help='files read at a time')
+    parser.add_argument('--manifest', default=MANIFEST)
+    opts = parser.parse_args(argv)
+
+    limits = {k: int(v) for k, _, v in (s.rpartition('=') for s in opts.limit)}
+    publish([Item(f, d) for f in opts.files for d in opts.to], jobs=opts.jobs, limits=limits,
+            default_limit=opts.default_limit, retries=opts.retries, manifest=opts.manifest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Classify scenes and write the frame ranges `lvf.rfs` takes.
+
+One streaming pass over the source collects per-frame luma statistics (average, detail
+from a Sobel pass, high-frequency energy as a grain estimate) and scene cuts. Scenes are
+then classed as dark, flat or grainy by their medians and merged into range lists:
+
+    python -m soapfunc.scenes "00001.m2ts" > ranges.py
+    # dark = [(1534, 1610), (4020, 4188), ...]
+
+    grain = lvf.rfs(grain, src, ranges=dark)
+"""
+__author__ = 'Soap'
+
+import argparse
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import vapoursynth as vs
+
+from .util import source
+
+core = vs.core
+
+Range = Tuple[int, int]
+
+
+class FrameStats(NamedTuple):
+    luma: np.ndarray        # normalised average luma
+    detail: np.ndarray      # normalised Sobel average
+    grain: np.ndarray       # normalised |x - blur(x)| average
+    cuts: np.ndarray        # frame numbers that start a scene (0 included)
+
+
+def analyse(clip: vs.VideoNode, sc_thr: float = 0.1, progress: bool = True) -> FrameStats:
+    """Single pass, all statistics come from PlaneStats so the work stays in the core's threads."""
+    y = core.std.ShufflePlanes(clip, 0, vs.GRAY)
+    blur = y.std.Convolution([1] * 9)
+    hf = core.std.Expr([y, blur], 'x y - abs')
+    det = y.std.Sobel()
+    small = y.resize.Bilinear(y.width // 4 & ~1, y.height // 4 & ~1)
+
+    stats = [
+        y.std.PlaneStats(prop='Luma'),
+        det.std.PlaneStats(prop='Detail'),
+        hf.std.PlaneStats(prop='Grain'),
+        small.std.PlaneStats(small[0] + small, prop='Prev'),
+    ]
+
+    def _merge(n: int, f: List[vs.VideoFrame]) -> vs.VideoFrame:
+        fout = f[0].copy()
+        for other in f[1:]:
+            for k, v in other.props.items():
+                if k.startswith(('Detail', 'Grain', 'Prev')):
+                    fout.props[k] = v
+        return fout
+
+    props = core.std.ModifyFrame(stats[0], stats, _merge)
+    total = clip.num_frames
+    luma, detail, grain, diff = (np.zeros(total) for _ in range(4))
+    for n, f in enumerate(props.frames()):
+        p = f.props
+        luma[n], detail[n], grain[n], diff[n] = p['LumaAverage'], p['DetailAverage'], p['GrainAverage'], p['PrevDiff']
+        if progress and n % 1000 == 0:
+            print(f"\rScene analysis: {n}/{total} ~ {100 * n // total}%", end="", file=sys.stderr)
+    if progress:
+        print(file=sys.stderr)
+
+    cuts = np.flatnonzero(diff > sc_thr)
+    cuts = np.union1d([0], cuts)
+    return FrameStats(luma, detail, grain, cuts)
+
+
+def to_ranges(frames: np.ndarray, merge_gap: int = 0) -> List[Range]:
+    """Sorted frame numbers -> inclusive (start, end) tuples, joining runs at most `merge_gap` apart."""
+    if not len(frames):
+        return []
+    breaks = np.flatnonzero(np.diff(frames) > merge_gap + 1)
+    starts = np.concatenate([[frames[0]], frames[breaks + 1]])
+    ends = np.concatenate([frames[breaks], [frames[-1]]])
+    return [(int(s), int(e)) for s, e in zip(starts, ends)]
+
+
+def classify(stats: FrameStats, dark: float = 0.15, flat: float = 0.01, grainy: float = 0.012,
+             min_len: int = 12, merge_gap: int = 0) -> Dict[str, List[Range]]:
+    """Class every scene by its medians; scenes shorter than `min_len` are left out."""
+    total = len(stats.luma)
+    scene = np.cumsum(np.isin(np.arange(total), stats.cuts)) - 1
+    bounds = np.append(stats.cuts, total)
+    lengths = np.diff(bounds)
+
+    def _medians(values: np.ndarray) -> np.ndarray:
+        return np.array([np.median(v) for v in np.split(values, stats.cuts[1:])])
+
+    tests = {
+        'dark': _medians(stats.luma) < dark,
+        'flat': _medians(stats.detail) < flat,
+        'grain': _medians(stats.grain) > grainy,
+    }
+    out = {}
+    for name, hit in tests.items():
+        hit = hit & (lengths >= min_len)
+        out[name] = to_ranges(np.flatnonzero(hit[scene]), merge_gap)
+    return out
+
+
+def format_ranges(name: str, ranges: List[Range]) -> str:
+    return f"{name} = [{', '.join(f'({s}, {e})' for s, e in ranges)}]"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='soapfunc.scenes', description=__doc__.splitlines()[0])
+    parser.add_argument('source')
+    parser.add_argument('--dark', type=float, default=0.15)
+    parser.add_argument('--flat', type=float, default=0.01)
+    parser.add_argument('--grain', type=float, default=0.012)
+    parser.add_argument('--min-len', type=int, default=12)
+    parser.add_argument('--merge-gap', type=int, default=0)
+    opts = parser.parse_args(argv)
+
+    stats = analyse(source(opts.source))
+    ranges = classify(stats, opts.dark, opts.flat, opts.grain, opts.min_len, opts.merge_gap)
+    for name, r in ranges.items():
+        print(format_ranges(name, r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Season runner: filter the NCOP/NCED once, then encode episodes side by side.
+
+Each episode script loads the same creditless OP/ED and runs the whole chain over those
+~2150 frames again. Here the chain runs once per NC file into a lossless FFV1 cache,
+and each episode takes its OP/ED from that file through atf.ApplyCredits. The episodes
+then run in a process pool that shares one thread and RAM budget.
+
+The season script supplies top-level functions (they have to pickle) and a splice table:
+
+    episodes = [
+        Episode('06/00004.m2ts', '06/06.mkv', [Splice('JJK v2/00005.m2ts', 843, 3017, 0, -10), ...]),
+        ...
+    ]
+    if __name__ == '__main__':
+        run(episodes, load, chain, finish, credit_fix=credit_fix)
+"""
+__author__ = 'Soap'
+
+import hashlib
+import inspect
+import marshal
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import vapoursynth as vs
+
+core = vs.core
+
+Filter = Callable[[vs.VideoNode], vs.VideoNode]
+
+FFV1 = ["ffmpeg", "-hide_banner", "-v", "quiet", "-y", "-f", "yuv4mpegpipe", "-i", "-",
+        "-c:v", "ffv1", "-level", "3", "-threads", "8", "-map", "0"]
+
+
+class Splice(NamedTuple):
+    nc: str                     # creditless clip
+    start: int                  # episode frames [start, end) carry the credits
+    end: int
+    nc_start: int = 0           # nc[nc_start:nc_end] lines up with them, slice rules
+    nc_end: Optional[int] = None
+
+
+class Episode(NamedTuple):
+    source: str
+    output: str
+    splices: Sequence[Splice]
+
+
+def nc_cache_path(nc: str, chain: Filter, tag: str = '') -> str:
+    """Where the filtered NC lives; the name changes with the chain's source code (and
+    `tag`, bump it after editing helpers the chain calls)."""
+    try:
+        code = inspect.getsource(chain).encode()
+    except (OSError, TypeError):
+        code = marshal.dumps(chain.__code__)
+    h = hashlib.blake2b(f'{chain.__module__}.{chain.__qualname__}:{tag}:'.encode(), digest_size=6)
+    h.update(code)
+    return f'{os.path.splitext(nc)[0]}.{h.hexdigest()}.filtered.mkv'
+
+
+def _filter_nc(nc: str, load: Callable[[str], vs.VideoNode], chain: Filter, out: str,
+               threads: int, cache_mb: int) -> str:
+    core.num_threads = threads
+    core.max_cache_size = cache_mb
+    clip = chain(load(nc))
+    tmp = out + '.part.mkv'
+    process = subprocess.Popen(FFV1 + [tmp], stdin=subprocess.PIPE)
+    clip.output(process.stdin, y4m=True)
+    process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"{nc}: encoder exited with {process.returncode}")
+    os.replace(tmp, out)
+    return out
+
+
+def build(ep: Episode, load: Callable[[str], vs.VideoNode], chain: Filter, finish: Filter,
+          cached: Dict[str, str], credit_fix: Optional[Filter] = None) -> vs.VideoNode:
+    """The episode graph: chain(source) everywhere, cached NC + ApplyCredits over the splices."""
+    import atomchtools as atf
+
+    source = load(ep.source)
+    filtered = chain(source)
+    pieces, pos = [], 0
+    for sp in sorted(ep.splices, key=lambda s: s.start):
+        nc = load(sp.nc)[sp.nc_start:sp.nc_end]
+        nc_filtered = load(cached[sp.nc])[sp.nc_start:sp.nc_end]
+        if nc.num_frames != sp.end - sp.start:
+            raise ValueError(f'{ep.source}: splice {sp.start}-{sp.end} is {sp.end - sp.start} frames, '
+                             f'the NC trim is {nc.num_frames}')
+        fixed = atf.ApplyCredits(source[sp.start:sp.end], nc, nc_filtered)
+        if credit_fix:
+            fixed = credit_fix(fixed)
+        if sp.start > pos:
+            pieces.append(filtered[pos:sp.start])
+        pieces.append(fixed)
+        pos = sp.end
+    if pos < source.num_frames:
+        pieces.append(filtered[pos:])
+    return finish(core.std.Splice(pieces))
+
+
+def _encode_episode(ep: Episode, load, chain, finish, cached, credit_fix, encoder_args,
+                    threads: int, cache_mb: int) -> str:
+    core.num_threads = threads
+    core.max_cache_size = cache_mb
+    clip = build(ep, load, chain, finish, cached, credit_fix)
+    process = subprocess.Popen(list(encoder_args) + [ep.output], stdin=subprocess.PIPE)
+    clip.output(process.stdin, y4m=True)
+    process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"{ep.source}: encoder exited with {process.returncode}")
+    return ep.output
+
+
+def budget(jobs: int, threads: Optional[int], ram_mb: Optional[int], threads_per_job: int,
+           ram_per_job_mb: int) -> int:
+    """How many jobs fit in the thread and RAM budget at once."""
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if ram_mb is None:
+        import psutil
+        ram_mb = psutil.virtual_memory().available // 2**20 * 3 // 4
+    return max(1, min(jobs, threads // threads_per_job, ram_mb // ram_per_job_mb))
+
+
+def run(episodes: Sequence[Episode], load: Callable[[str], vs.VideoNode], chain: Filter, finish: Filter,
+        credit_fix: Optional[Filter] = None, encoder_args: Sequence[str] = FFV1 + ["-pix_fmt", "yuv420p10le"],
+        tag: str = '', threads: Optional[int] = None, ram_mb: Optional[int] = None,
+        threads_per_episode: int = 8, ram_per_episode_mb: int = 12000) -> List[str]:
+    workers = budget(len(episodes), threads, ram_mb, threads_per_episode, ram_per_episode_mb)
+    cache_mb = ram_per_episode_mb * 2 // 3   # the rest is for the encoder and Python
+
+    ncs = sorted({sp.nc for ep in episodes for sp in ep.splices})
+    cached = {nc: nc_cache_path(nc, chain, tag) for nc in ncs}
+    todo = [nc for nc in ncs if not os.path.exists(cached[nc])
+            or os.path.getmtime(cached[nc]) < os.path.getmtime(nc)]
+
+    print(f"Season: {len(episodes)} episodes, {len(todo)} NC clips to filter, {workers} at a time")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for fut in as_completed([pool.submit(_filter_nc, nc, load, chain, cached[nc], threads_per_episode, cache_mb)
+                                 for nc in todo]):
+            print(f"NC cached: {fut.result()}")
+        outputs = []
+        futures = {pool.submit(_encode_episode, ep, load, chain, finish, cached, credit_fix, encoder_args,
+                               threads_per_episode, cache_mb): ep for ep in episodes}
+        for fut in as_completed(futures):
+            outputs.append(fut.result())
+            print(f"Episode done: {outputs[-1]} ({len(outputs)}/{len(episodes)})")
+    return outputs
@@ -0,0 +1,329 @@
+"""Episode titles from TMDB, cached, and renames that can be undone.
+
+- the api key is asked for once and kept in ~/.soapfunc/tmdb.json (or TMDB_API_KEY)
+- show and season responses are kept in ~/.soapfunc/tmdb.sqlite for `ttl` seconds;
+  every season not in the cache is fetched in one request per 20 seasons
+  (append_to_response), and when TMDB can't be reached, stale entries are used
+- files are matched to episodes by the number in their name (S01E02, "- 02", E02,
+  tried in that order, then the last number standing on its own, as in "Show 03.mkv"
+  or "Show.04.mkv"; [bracketed] and (parenthesised) tags ignored), not by their
+  position in the folder listing
+- the whole rename plan is checked first (missing episodes, two files wanting one
+  name, names already taken), written to a journal in the folder and then applied; a
+  failure halfway rolls the done renames back, and `--undo` reverts the last batch (or,
+  after a crash, puts back the files of the one that was cut short)
+
+    python "Random scripts/tmdb_showname.py" 1429 --season 1
+    python "Random scripts/tmdb_showname.py" --undo
+
+`--api` points it at another server (a local fixture for trying it out).
+"""
+__author__ = 'Soap'
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+API = "https://api.themoviedb.org/3"
+ROOT = os.path.join(os.path.expanduser('~'), '.soapfunc')
+CACHE = os.path.join(ROOT, 'tmdb.sqlite')
+CONFIG = os.path.join(ROOT, 'tmdb.json')
+JOURNAL = '.tmdb_renames.json'
+TTL = 7 * 24 * 3600
+BATCH = 20                  # TMDB's append_to_response limit
+
+_EPISODE = [re.compile(r'[Ss](\d{1,2})[ ._-]?[Ee](\d{1,4})(?!\d)'),             # S01E02
+            re.compile(r' - (\d{1,4})(?:v\d)?(?=[ .\[(])'),                      # "Show - 02 [..]"
+            re.compile(r'(?<![A-Za-z0-9])[Ee][Pp]?[ ._]?(\d{1,4})(?!\d)')]        # E02, EP02
+_TAG = re.compile(r'\[[^\]]*\]')        # [SubsPlease], [E3A1B2C4]: never the episode
+_PAREN = re.compile(r'\([^)]*\)')        # (1080p), (BD 1080p x265): for the bare number only
+# last resort: a number of its own, not x264, 10bit or 1080p
+_BARE = re.compile(r'(?<![A-Za-z0-9])(\d{1,3})(?:v\d)?(?![A-Za-z0-9])')
+
+
+def api_key() -> str:
+    key = os.environ.get('TMDB_API_KEY')
+    if key:
+        return key
+    if os.path.exists(CONFIG):
+        with open(CONFIG, encoding='utf-8') as f:
+            key = json.load(f).get('api_key')
+    if not key:
+        key = input("Enter TMDB api key: ").strip()
+        os.makedirs(ROOT, exist_ok=True)
+        with open(CONFIG, 'w', encoding='utf-8') as f:
+            json.dump(dict(api_key=key), f)
+    return key
+
+
+# metadata
+
+class Cache:
+    """Response bodies by request URL (without the key), with the time they were fetched."""
+
+    def __init__(self, path: str = CACHE) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, fetched REAL, body TEXT)")
+
+    def get(self, key: str, ttl: Optional[float]) -> Optional[dict]:
+        """The entry if it is younger than `ttl` (any age with ttl=None)."""
+        row = self.db.execute("SELECT fetched, body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row and (ttl is None or time.time() - row[0] < ttl):
+            return json.loads(row[1])
+        return None
+
+    def put(self, items: Iterable[Tuple[str, dict]]) -> None:
+        now = time.time()
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                                [(k, now, json.dumps(v)) for k, v in items])
+
+
+class Client:
+    def __init__(self, key: Optional[str] = None, api: str = API, cache: Optional[Cache] = None, ttl: float = TTL,
+                 offline: bool = False) -> None:
+        self.key, self.api, self.ttl, self.offline = key, api.rstrip('/'), ttl, offline
+        self.cache = cache or Cache()
+
+    def _get(self, path: str, **params) -> dict:
+        params['api_key'] = self.key or api_key()
+        url = f"{self.api}{path}?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=30) as r:
+            return json.load(r)
+
+    def _key(self, show: int, season: int) -> str:
+        # per server, so a fixture's answers never stand in for TMDB's
+        return f"{self.api}/tv/{show}/season/{season}"
+
+    def seasons(self, show: int, numbers: Iterable[int]) -> Dict[int, dict]:
+        """Season objects (with their episodes), from the cache where it is fresh, the rest in batched requests."""
+        numbers = sorted(set(numbers))
+        found = {n: self.cache.get(self._key(show, n), self.ttl) for n in numbers}
+        missing = [n for n, s in found.items() if s is None]
+        if missing and not self.offline:
+            try:
+                for i in range(0, len(missing), BATCH):
+                    chunk = missing[i:i + BATCH]
+                    body = self._get(f"/tv/{show}", append_to_response=','.join(f"season/{n}" for n in chunk))
+                    got = {n: body[f"season/{n}"] for n in chunk if f"season/{n}" in body}
+                    self.cache.put((self._key(show, n), v) for n, v in got.items())
+                    found.update(got)
+            except (urllib.error.URLError, OSError) as e:
+                print(f"tmdb: {e}; using cached data where there is any", file=sys.stderr)
+        for n in [n for n, s in found.items() if s is None]:
+            stale = self.cache.get(self._key(show, n), None)
+            if stale is None:
+                raise LookupError(f"show {show} season {n}: not on TMDB or not cached")
+            found[n] = stale
+        return found
+
+
+# renaming
+
+def parse_episode(name: str, season: int) -> Optional[Tuple[int, int]]:
+    """(season, episode) from a file name, or None."""
+    name = _TAG.sub(' ', name)
+    m = _EPISODE[0].search(name)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    for pattern in _EPISODE[1:]:
+        m = pattern.search(name)
+        if m:
+            return season, int(m.group(1))
+    bare = _BARE.findall(_PAREN.sub(' ', os.path.splitext(name)[0]))
+    if bare:
+        return season, int(bare[-1])
+    return None
+
+
+def clean(name: str) -> str:
+    return "".join(c for c in name if c not in '\\/:*?"<>|')
+
+
+class Rename(NamedTuple):
+    source: str
+    target: str
+
+
+def plan(files: Sequence[str], client: Client, show: int, season: int,
+         fmt: str = "{stem}{name}{ext}") -> List[Rename]:
+    """Renames for every file whose episode could be matched; raises if the plan doesn't hold together.
+
+    `fmt` gets stem, ext, season, episode and name.
+    """
+    parsed = {f: parse_episode(os.path.basename(f), season) for f in files}
+    for f, p in parsed.items():
+        if p is None:
+            print(f"tmdb: no episode number in {f!r}, left alone", file=sys.stderr)
+    seasons = client.seasons(show, {p[0] for p in parsed.values() if p})
+    titles = {(s, e['episode_number']): e['name'] for s, body in seasons.items() for e in body.get('episodes', [])}
+
+    renames = []
+    for f, p in parsed.items():
+        if p is None:
+            continue
+        if p not in titles:
+            raise LookupError(f"{f}: TMDB has no S{p[0]:02d}E{p[1]:02d}")
+        stem, ext = os.path.splitext(os.path.basename(f))
+        target = os.path.join(os.path.dirname(f), fmt.format(stem=stem, ext=ext, season=p[0], episode=p[1],
+                                                             name=clean(titles[p])))
+        if target != f:
+            renames.append(Rename(f, target))
+
+    targets = [r.target for r in renames]
+    sources = {os.path.normcase(os.path.abspath(r.source)) for r in renames}
+    for t in targets:
+        if targets.count(t) > 1:
+            raise ValueError(f"two files would be named {t!r}")
+        if os.path.exists(t) and os.path.normcase(os.path.abspath(t)) not in sources:
+            raise FileExistsError(t)
+    return renames
+
+
+def _write_journal(path: str, batches: List[dict]) -> None:
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(batches, f, indent=1, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _read_journal(path: str) -> List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _tmp(source: str, pid: int, i: int) -> str:
+    return os.path.join(os.path.dirname(source), f".tmdb-{pid}-{i}.tmp")
+
+
+def _move_all(renames: Sequence[Rename]) -> None:
+    """All or nothing. Goes through temp names, so swaps and chains (a->b, b->c) work."""
+    done: List[Tuple[str, str]] = []
+    try:
+        staged = []
+        for i, r in enumerate(renames):
+            tmp = _tmp(r.source, os.getpid(), i)
+            os.rename(r.source, tmp)
+            done.append((r.source, tmp))
+            staged.append((tmp, r.target))
+        for tmp, target in staged:
+            os.rename(tmp, target)
+            done.append((tmp, target))
+    except OSError:
+        for a, b in reversed(done):
+            os.rename(b, a)
+        raise
+
+
+def _recover(batch: dict, save) -> None:
+    """Put the files of a batch that was cut short back under their old names.
+
+    Before `staged` every file is under its old name or its temp name; after it, the
+    ones whose temp name is gone already have their new name.
+    """
+    pairs = list(enumerate(batch['renames']))
+    if batch['staged']:
+        for i, (source, target) in reversed(pairs):
+            tmp = _tmp(source, batch['pid'], i)
+            if not os.path.exists(tmp):
+                os.rename(target, tmp)
+        batch['staged'] = False
+        save()
+    for i, (source, target) in reversed(pairs):
+        tmp = _tmp(source, batch['pid'], i)
+        if os.path.exists(tmp):
+            os.rename(tmp, source)
+
+
+def apply(renames: Sequence[Rename], journal: str = JOURNAL) -> None:
+    """Rename everything, journalling each step so an interrupted batch can be undone."""
+    if not renames:
+        return
+    batches = _read_journal(journal)
+    batch = dict(time=time.strftime('%Y-%m-%d %H:%M:%S'), renames=[list(r) for r in renames],
+                 pid=os.getpid(), staged=False, applied=False)
+    batches.append(batch)
+
+    def save() -> None:
+        _write_journal(journal, batches)
+
+    save()
+    try:
+        for i, r in enumerate(renames):
+            os.rename(r.source, _tmp(r.source, batch['pid'], i))
+        batch['staged'] = True
+        save()
+        for i, r in enumerate(renames):
+            os.rename(_tmp(r.source, batch['pid'], i), r.target)
+    except OSError:
+        _recover(batch, save)
+        batches.pop()
+        save()
+        raise
+    batch['applied'] = True
+    save()
+
+
+def undo(journal: str = JOURNAL) -> List[Rename]:
+    """Revert the last batch: finish rolling back one that was cut short, or else undo the last applied one."""
+    batches = _read_journal(journal)
+    if not batches:
+        raise LookupError(f"{journal}: nothing to undo")
+
+    def save() -> None:
+        _write_journal(journal, batches)
+
+    back = [Rename(t, s) for s, t in reversed(batches[-1]['renames'])]
+    if batches[-1]['applied']:
+        _move_all(back)
+    else:
+        _recover(batches[-1], save)
+    batches.pop()
+    save()
+    return back
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='tmdb_showname', description='Append TMDB episode titles to file names')
+    parser.add_argument('show', nargs='?', type=int, help='TMDB show id')
+    parser.add_argument('files', nargs='*', help='default: *.mkv in the current folder')
+    parser.add_argument('--season', type=int, help='for files without SxxEyy (specials are usually season 0)')
+    parser.add_argument('--format', default="{stem}{name}{ext}", help='new name, from stem, ext, season, episode, name')
+    parser.add_argument('--ttl', type=float, default=TTL / 86400, help='days a cached season stays fresh')
+    parser.add_argument('--offline', action='store_true', help='cache only, no requests')
+    parser.add_argument('--api', default=API)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--undo', action='store_true', help='revert the last rename batch in this folder')
+    opts = parser.parse_args(argv)
+
+    if opts.undo:
+        for r in undo():
+            print(f"{r.source} -> {r.target}")
+        return
+    show = opts.show if opts.show is not None else int(input("Enter TMDB Show ID: "))
+    season = opts.season if opts.season is not None else int(input("Enter Season Number (Specials are usually Season 0): "))
+    files = [p for pattern in opts.files or ['*.mkv']
+             for p in ([pattern] if os.path.exists(pattern) else sorted(glob.glob(pattern)))]
+    client = Client(api=opts.api, ttl=opts.ttl * 86400, offline=opts.offline)
+    renames = plan(files, client, show, season, opts.format)
+    for r in renames:
+        print(f"{r.source} -> {r.target}")
+    if not opts.dry_run:
+        apply(renames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Cache size and thread count from the machine instead of a number pasted into each script.
+
+    final = depth(grain, 10)
+    tune(final)             # x265 next to it; tune(final, encoder='ffv1') for the lossless runs
+    final.set_output()
+
+Probes available RAM and cores, holds back what the encoder will need, renders a short
+warm-up from the middle of the clip while watching the process working set, and sizes
+`core.max_cache_size` from what the graph actually touched. Messages go to stderr, so it
+is safe under vspipe.
+
+The warm-up's working set is remembered in ~/.soapfunc/tune.json per script (and its
+mtime), clip format, encoder and machine, so only the first start of a script renders
+it; `remember=False` measures every time.
+
+Under soapfunc.fanout one render feeds an encoder per rung; fanout hands the script an
+`encoders` global for that, to be passed on:
+
+    tune(final, encoders=globals().get('encoders', 1))
+"""
+__author__ = 'Soap'
+
+import hashlib
+import json
+import os
+import sys
+from typing import NamedTuple, Optional
+
+import psutil
+import vapoursynth as vs
+
+from .util import main_script
+
+core = vs.core
+
+MEASURED = os.path.join(os.path.expanduser('~'), '.soapfunc', 'tune.json')
+
+
+class Machine(NamedTuple):
+    available_mb: int
+    physical: int
+    logical: int
+
+
+class Tuning(NamedTuple):
+    threads: int
+    cache_mb: int
+    working_set_mb: int
+    encoder_mb: int
+
+
+def probe() -> Machine:
+    logical = psutil.cpu_count() or os.cpu_count() or 1
+    return Machine(psutil.virtual_memory().available // 2**20, psutil.cpu_count(logical=False) or logical, logical)
+
+
+def encoder_reserve(clip: vs.VideoNode, encoder: Optional[str] = 'x265') -> int:
+    """Rough resident size of the encoder process in MB, from the frame size."""
+    frame_mb = clip.width * clip.height * 3 / 2**20      # 4:2:0 at 16 bit inside the encoder
+    if encoder == 'x265':
+        return int(600 + 160 * frame_mb)      # lookahead, refs and frame threads: ~1.5 GB at 1080p
+    if encoder == 'ffv1':
+        return int(300 + 16 * frame_mb)
+    return 0
+
+
+def encoder_threads(machine: Machine, encoder: Optional[str] = 'x265') -> int:
+    if encoder == 'x265':
+        return machine.logical // 3
+    if encoder == 'ffv1':
+        return min(8, machine.logical // 4)
+    return 0
+
+
+def _rss_mb() -> int:
+    return psutil.Process().memory_info().rss // 2**20
+
+
+def _measure_key(clip: vs.VideoNode, encoder: Optional[str], threads: int, machine: Machine) -> str:
+    script = main_script()
+    blob = json.dumps([script and [os.path.abspath(script), os.path.getmtime(script)],
+                       clip.format.name, clip.width, clip.height, encoder, threads,
+                       machine.physical, machine.logical, psutil.virtual_memory().total // 2**30])
+    return hashlib.blake2b(blob.encode(), digest_size=12).hexdigest()
+
+
+def _load_measured() -> dict:
+    try:
+        with open(MEASURED, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_measured(key: str, working: int) -> None:
+    measured = _load_measured()
+    measured[key] = working
+    os.makedirs(os.path.dirname(MEASURED), exist_ok=True)
+    with open(MEASURED + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(measured, f, indent=1)
+    os.replace(MEASURED + '.tmp', MEASURED)
+
+
+def tune(clip: vs.VideoNode, encoder: Optional[str] = 'x265', warmup: int = 48, start: Optional[int] = None,
+         margin: float = 1.5, min_cache_mb: int = 2048, slack_mb: int = 1024,
+         threads: Optional[int] = None, encoders: int = 1, remember: bool = True, verbose: bool = True) -> Tuning:
+    """Set core.num_threads and core.max_cache_size for `clip` and return what was picked.
+
+    `encoders` is how many encoders run next to the graph, each reserved at `clip`'s size.
+    """
+    machine = probe()
+    enc_mb = encoder_reserve(clip, encoder) * encoders
+    if threads is None:
+        # the encoders' threads are held back, but never more than two thirds of the machine
+        held = min(encoder_threads(machine, encoder) * encoders, machine.logical * 2 // 3)
+        threads = max(2, machine.logical - held)
+    budget = machine.available_mb - enc_mb - slack_mb
+
+    core.num_threads = threads
+    core.max_cache_size = max(min_cache_mb, budget)
+    key = _measure_key(clip, encoder, threads, machine) if remember else None
+    working = _load_measured().get(key) if key else None
+    if working is None:
+        start = clip.num_frames // 2 if start is None else start
+        end = min(clip.num_frames, start + warmup)
+        base = peak = _rss_mb()
+        for _ in clip[start:end].frames():
+            peak = max(peak, _rss_mb())
+        working = peak - base
+        if key:
+            _save_measured(key, working)
+
+    cache = int(min(max(working * margin, min_cache_mb), budget))
+    if cache < min_cache_mb:
+        cache = max(512, budget)
+        print(f"tune: only {machine.available_mb} MB free with {enc_mb} MB kept for {encoder}, "
+              f"cache squeezed to {cache} MB", file=sys.stderr)
+    core.max_cache_size = cache
+    if verbose:
+        print(f"tune: {threads} threads ({machine.physical} cores/{machine.logical} threads), "
+              f"cache {cache} MB (warm-up working set {working} MB, {enc_mb} MB kept for {encoders}x {encoder})",
+              file=sys.stderr)
+    return Tuning(threads, cache, working, enc_mb)
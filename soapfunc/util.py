@@ -0,0 +1,58 @@
+"""Small helpers shared by the soapfunc modules"""
+__author__ = 'Soap'
+
+import os
+import runpy
+import sys
+from typing import Any, Dict, Optional
+
+import vapoursynth as vs
+
+core = vs.core
+
+
+def main_script() -> Optional[str]:
+    """The script being run, under python, vspipe or load_script()."""
+    for name in ('__main__', '__vapoursynth__'):
+        path = getattr(sys.modules.get(name), '__file__', None)
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def load_script(path: str, args: Optional[Dict[str, Any]] = None, index: int = 0) -> vs.VideoNode:
+    """Run a .vpy/.py script the way vspipe does and return one of its outputs.
+
+    `args` are injected as globals, same as `vspipe --arg key=value`.
+    """
+    vs.clear_outputs()
+    runpy.run_path(path, init_globals=dict(args or {}), run_name='__vapoursynth__')
+    out = vs.get_output(index)
+    # API4 hands back a VideoOutputTuple, API3 the node itself
+    return getattr(out, 'clip', out)
+
+
+def source(path: str) -> vs.VideoNode:
+    """Index a file with L-SMASH, falling back to ffms2 (like lvf.src without the extras)."""
+    if hasattr(core, 'lsmas'):
+        if path.lower().endswith(('.m2ts', '.mts', '.ts', '.mkv', '.mp4', '.mov', '.webm')):
+            return core.lsmas.LWLibavSource(path)
+    return core.ffms2.Source(path)
+
+
+def plane_view(frame: vs.VideoFrame, p: int, write: bool = False) -> memoryview:
+    """View of one plane, rows without the stride padding. `write` needs a copied frame."""
+    try:
+        return memoryview(frame[p])
+    except TypeError:
+        # API3 frames aren't subscriptable
+        return frame.get_write_array(p) if write else frame.get_read_array(p)
+
+
+def parse_args(pairs) -> Dict[str, str]:
+    """['key=value', ...] -> {'key': 'value'}, for the vspipe-style --arg switches."""
+    out = {}
+    for pair in pairs or []:
+        k, _, v = pair.partition('=')
+        out[k] = v
+    return out
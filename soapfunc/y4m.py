@@ -0,0 +1,34 @@
+"""YUV4MPEG2 framing, written the same way vspipe --y4m does"""
+__author__ = 'Soap'
+
+from typing import BinaryIO
+
+import vapoursynth as vs
+
+from .util import plane_view
+
+_SUBSAMPLING = {(1, 1): '420', (1, 0): '422', (0, 0): '444', (2, 2): '410', (2, 0): '411', (0, 1): '440'}
+
+
+def colorspace(fmt: vs.Format) -> str:
+    if fmt.color_family == vs.GRAY:
+        cs = 'mono'
+        return cs if fmt.bits_per_sample == 8 else f'{cs}{fmt.bits_per_sample}'
+    if fmt.color_family != vs.YUV or fmt.sample_type != vs.INTEGER:
+        raise ValueError('y4m: only integer YUV and GRAY clips can be written')
+    cs = _SUBSAMPLING[(fmt.subsampling_w, fmt.subsampling_h)]
+    return cs if fmt.bits_per_sample == 8 else f'{cs}p{fmt.bits_per_sample}'
+
+
+def header(clip: vs.VideoNode) -> bytes:
+    cs = colorspace(clip.format)
+    return (f'YUV4MPEG2 C{cs} W{clip.width} H{clip.height} F{clip.fps.numerator}:{clip.fps.denominator} '
+            f'Ip A0:0 XLENGTH={clip.num_frames}\n').encode()
+
+
+def write_frame(stream: BinaryIO, frame: vs.VideoFrame, y4m: bool = True) -> None:
+    if y4m:
+        stream.write(b'FRAME\n')
+    for p in range(frame.format.num_planes):
+        view = plane_view(frame, p)
+        stream.write(view if view.contiguous else view.tobytes())
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from soapfunc import publish
+
+
+@pytest.fixture
+def episode(tmp_path):
+    path = tmp_path / 'ep01 480p.mkv'
+    path.write_bytes(os.urandom(3 * 1024 + 17))
+    return str(path)
+
+
+@pytest.fixture
+def streamed(monkeypatch):
+    """The destinations of every _stream() call, in order."""
+    calls = []
+    real = publish._stream
+
+    def recording(path, dests, chunk):
+        calls.append(list(dests))
+        return real(path, dests, chunk)
+    monkeypatch.setattr(publish, '_stream', recording)
+    monkeypatch.setattr(publish.time, 'sleep', lambda s: None)
+    return calls
+
+
+def test_local_folders(tmp_path, episode, streamed):
+    a, b = str(tmp_path / 'a'), str(tmp_path / 'b')
+    result = publish.send(episode, [a, b], manifest=str(tmp_path / 'manifest.json'), chunk=1000)
+    assert result == {a: 'sent', b: 'sent'}
+    assert streamed == [[a, b]]     # one read for both
+    data = open(episode, 'rb').read()
+    for d in (a, b):
+        assert open(os.path.join(d, 'ep01 480p.mkv'), 'rb').read() == data
+        assert not os.path.exists(os.path.join(d, 'ep01 480p.mkv.part'))
+
+
+def test_resend_is_skipped(tmp_path, episode, streamed):
+    a = str(tmp_path / 'a')
+    manifest = str(tmp_path / 'manifest.json')
+    publish.publish([publish.Item(episode, a)], manifest=manifest)
+    assert publish.send(episode, [a], manifest=manifest) == {a: 'unchanged'}
+    assert streamed == [[a]]
+
+    with open(episode, 'ab') as f:
+        f.write(b'v2')
+    assert publish.send(episode, [a], manifest=manifest) == {a: 'sent'}
+    assert open(os.path.join(a, 'ep01 480p.mkv'), 'rb').read() == open(episode, 'rb').read()
+
+
+def test_failed_destination_retried_alone(tmp_path, episode, streamed, monkeypatch):
+    good, bad = str(tmp_path / 'good'), str(tmp_path / 'bad')
+    failures = [OSError('disk full')]
+
+    class Flaky(publish._Sink):
+        def __init__(self, dest, name):
+            super().__init__(dest, name)
+            if dest == bad and failures:
+                self.error = failures.pop()
+    monkeypatch.setattr(publish, '_Sink', Flaky)
+
+    result = publish.send(episode, [good, bad], manifest=str(tmp_path / 'manifest.json'))
+    assert result == {good: 'sent', bad: 'sent'}
+    assert streamed == [[good, bad], [bad]]
+    assert not os.path.exists(os.path.join(bad, 'ep01 480p.mkv.part'))
+    assert os.path.exists(os.path.join(bad, 'ep01 480p.mkv'))
+
+
+def test_gives_up_after_retries(tmp_path, episode, streamed, monkeypatch):
+    bad = str(tmp_path / 'bad')
+
+    class Broken(publish._Sink):
+        def __init__(self, dest, name):
+            super().__init__(dest, name)
+            self.error = OSError('gone')
+    monkeypatch.setattr(publish, '_Sink', Broken)
+
+    with pytest.raises(RuntimeError, match='failed for'):
+        publish.send(episode, [bad], retries=2, manifest=str(tmp_path / 'manifest.json'))
+    assert len(streamed) == 3
+
+
+def test_remote_names():
+    assert publish.is_remote('SoapEnc12:Public/x')
+    assert not publish.is_remote('D:/mirror')
+    assert not publish.is_remote('D:\\mirror')
+    assert publish.remote_name('OneDrive ceo:Public/x') == 'OneDrive ceo'
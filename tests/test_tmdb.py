@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from soapfunc import tmdb
+
+SHOW = 1429
+SEASONS = {1: ['To You, 2000 Years From Now', 'That Day', 'A Dim Light Amid Despair']}
+
+
+@pytest.fixture
+def server():
+    """A TMDB stand-in for --api: /3/tv/<id>?append_to_response=season/1,... and the requests it got.
+
+    Answers 503 to everything while `down` holds anything.
+    """
+    requests, down = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            requests.append(url)
+            if down:
+                self.send_error(503)
+                return
+            query = urllib.parse.parse_qs(url.query)
+            if url.path != f'/3/tv/{SHOW}' or 'api_key' not in query:
+                self.send_error(404)
+                return
+            body = dict(id=SHOW)
+            for part in query.get('append_to_response', [''])[0].split(','):
+                n = int(part.partition('/')[2] or -1)
+                if n in SEASONS:
+                    body[part] = dict(season_number=n, episodes=[
+                        dict(episode_number=i + 1, name=name) for i, name in enumerate(SEASONS[n])])
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}/3', requests, down
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server, tmp_path):
+    api = server[0]
+    return tmdb.Client(key='test', api=api, cache=tmdb.Cache(str(tmp_path / 'tmdb.sqlite')))
+
+
+@pytest.fixture
+def folder(tmp_path):
+    d = tmp_path / 'show'
+    d.mkdir()
+    names = ['[SubsPlease] Shingeki - 02 [1080p].mkv', 'Shingeki S01E01.mkv', 'Shingeki E03 [ABCD1234].mkv']
+    for name in names:
+        (d / name).write_text(name)
+    return d, [str(d / name) for name in names]
+
+
+def listing(d):
+    return sorted(os.listdir(d))
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Show S02E05 [1080p].mkv', (2, 5)),
+    ('[SubsPlease] Show - 07 (1080p) [ABCD1234].mkv', (1, 7)),
+    ('Show - 12v2 [BD].mkv', (1, 12)),
+    ('Show EP08.mkv', (1, 8)),
+    ('Show 03.mkv', (1, 3)),
+    ('Show.04.mkv', (1, 4)),
+    ('Show 05 x264 10bit.mp4', (1, 5)),
+    ('Show.06v2.(BD 1080p).mkv', (1, 6)),
+    ('[Group] Show [01].mkv', None),
+    ('Show OVA.mkv', None),
+])
+def test_parse_episode(name, expected):
+    assert tmdb.parse_episode(name, 1) == expected
+
+
+def test_plan_apply_undo(client, folder, tmp_path):
+    d, files = folder
+    before = listing(d)
+    journal = str(tmp_path / 'journal.json')
+    renames = tmdb.plan(files, client, SHOW, 1, fmt='{season:02d}x{episode:02d} {name}{ext}')
+    assert sorted(os.path.basename(r.target) for r in renames) == [
+        '01x01 To You, 2000 Years From Now.mkv', '01x02 That Day.mkv', '01x03 A Dim Light Amid Despair.mkv']
+
+    tmdb.apply(renames, journal=journal)
+    assert listing(d) == sorted(os.path.basename(r.target) for r in renames)
+    assert (d / '01x02 That Day.mkv').read_text() == '[SubsPlease] Shingeki - 02 [1080p].mkv'
+    assert tmdb._read_journal(journal)[-1]['applied']
+
+    tmdb.undo(journal=journal)
+    assert listing(d) == before
+    assert tmdb._read_journal(journal) == []
+    with pytest.raises(LookupError):
+        tmdb.undo(journal=journal)
+
+
+def test_seasons_come_from_the_cache(client, server, folder):
+    requests = server[1]
+    _, files = folder
+    tmdb.plan(files, client, SHOW, 1)
+    tmdb.plan(files, client, SHOW, 1)
+    assert len(requests) == 1
+    assert urllib.parse.parse_qs(requests[0].query)['append_to_response'] == ['season/1']
+
+
+def test_stale_cache_when_unreachable(client, server, folder):
+    _, files = folder
+    tmdb.plan(files, client, SHOW, 1)
+    server[2].append(True)
+    client.ttl = 0
+    assert len(tmdb.plan(files, client, SHOW, 1)) == 3
+    assert len(server[1]) == 2      # it did try
+    with pytest.raises(LookupError, match='season 2'):
+        tmdb.plan([files[0]], client, SHOW, 2)
+
+
+def test_plan_refuses_missing_episode_and_taken_names(client, folder):
+    d, files = folder
+    (d / 'Shingeki - 09 [x].mkv').write_text('')
+    with pytest.raises(LookupError, match='S01E09'):
+        tmdb.plan(files + [str(d / 'Shingeki - 09 [x].mkv')], client, SHOW, 1)
+    (d / 'That Day.mkv').write_text('')
+    with pytest.raises(FileExistsError):
+        tmdb.plan(files, client, SHOW, 1, fmt='{name}{ext}')
+
+
+def test_failed_apply_rolls_back(client, folder, tmp_path):
+    d, files = folder
+    before = listing(d)
+    journal = str(tmp_path / 'journal.json')
+    # targets in a folder that doesn't exist: staging works, the final renames fail
+    renames = tmdb.plan(files, client, SHOW, 1, fmt='missing/{name}{ext}')
+    with pytest.raises(OSError):
+        tmdb.apply(renames, journal=journal)
+    assert listing(d) == before
+    assert tmdb._read_journal(journal) == []
+
+
+def interrupted(renames, journal, staged, moved):
+    """The folder and journal as apply() would leave them killed after `moved` of the second loop's renames."""
+    pid = 4242
+    for i, r in enumerate(renames):
+        os.rename(r.source, tmdb._tmp(r.source, pid, i))
+    for i, r in enumerate(renames[:moved]):
+        os.rename(tmdb._tmp(r.source, pid, i), r.target)
+    tmdb._write_journal(journal, [dict(time='', renames=[list(r) for r in renames], pid=pid,
+                                       staged=staged, applied=False)])
+
+
+@pytest.mark.parametrize('staged, moved', [(False, 0), (True, 0), (True, 2)])
+def test_undo_recovers_interrupted_batch(client, folder, tmp_path, staged, moved):
+    d, files = folder
+    before = listing(d)
+    journal = str(tmp_path / 'journal.json')
+    renames = tmdb.plan(files, client, SHOW, 1)
+    interrupted(renames, journal, staged, moved)
+    assert listing(d) != before
+
+    tmdb.undo(journal=journal)
+    assert listing(d) == before
+    assert tmdb._read_journal(journal) == []
+
+
+def test_recover_after_crash_in_recovery(client, folder, tmp_path):
+    # killed again after _recover has moved the finished ones back to their temp names
+    d, files = folder
+    before = listing(d)
+    journal = str(tmp_path / 'journal.json')
+    renames = tmdb.plan(files, client, SHOW, 1)
+    interrupted(renames, journal, staged=True, moved=2)
+    batches = tmdb._read_journal(journal)
+    for i, r in enumerate(renames[:2]):
+        os.rename(r.target, tmdb._tmp(r.source, 4242, i))
+    batches[-1]['staged'] = False
+    tmdb._write_journal(journal, batches)
+
+    tmdb.undo(journal=journal)
+    assert listing(d) == before